@@ -0,0 +1,79 @@
+"""
+Measure how long short invocations of the caada command line take, each in a fresh Python interpreter.
+
+Run from the repository root, e.g.::
+
+    python benchmarks/cli_startup.py -n 10
+    python benchmarks/cli_startup.py --importtime 15 -- epa-cems-dl -h
+
+By default this times ``caada -h`` plus ``-h`` for each subcommand, since those only need to build the argument parser
+and so show the fixed cost of starting the CLI.
+"""
+
+from argparse import ArgumentParser
+import os
+import re
+import statistics
+import subprocess
+import sys
+import time
+
+_repo_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+_default_invocations = [
+    ['-h'],
+    ['ca-pems', '-h'],
+    ['os-covid', '-h'],
+    ['epa-cems-dl', '-h'],
+    ['epa-cems-agg', '-h'],
+    ['streetlight', '-h'],
+]
+
+
+def time_invocation(cl_args, repeats):
+    cmd = [sys.executable, '-m', 'caada'] + list(cl_args)
+    times = []
+    for _ in range(repeats):
+        t0 = time.perf_counter()
+        subprocess.run(cmd, cwd=_repo_root, stdout=subprocess.DEVNULL, check=True)
+        times.append(time.perf_counter() - t0)
+    return times
+
+
+def slowest_imports(cl_args, n):
+    """Return the `n` modules with the largest cumulative import times, from ``python -X importtime``"""
+    cmd = [sys.executable, '-X', 'importtime', '-m', 'caada'] + list(cl_args)
+    result = subprocess.run(cmd, cwd=_repo_root, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, check=True,
+                            universal_newlines=True)
+    entries = []
+    for line in result.stderr.splitlines():
+        m = re.match(r'import time:\s+\d+\s+\|\s+(\d+)\s+\|(\s*)(\S+)', line)
+        if m:
+            entries.append((int(m.group(1)), m.group(3)))
+    entries.sort(reverse=True)
+    return entries[:n]
+
+
+def parse_args():
+    p = ArgumentParser(description='Time short invocations of the caada command line')
+    p.add_argument('cl_args', nargs='*', help='Arguments to pass to caada. If not given, a default set of help '
+                                              'invocations are timed. Use "--" before them, e.g. "-- epa-cems-dl -h".')
+    p.add_argument('-n', '--repeats', type=int, default=5, help='How many times to run each invocation.')
+    p.add_argument('--importtime', type=int, default=0, metavar='N',
+                   help='Also list the N slowest imports (cumulative) for each invocation.')
+    return p.parse_args()
+
+
+def main():
+    args = parse_args()
+    invocations = [args.cl_args] if args.cl_args else _default_invocations
+    for cl_args in invocations:
+        times = time_invocation(cl_args, args.repeats)
+        print('caada {:<24s} min {:6.3f} s  median {:6.3f} s'.format(' '.join(cl_args), min(times),
+                                                                      statistics.median(times)))
+        if args.importtime > 0:
+            for usec, module in slowest_imports(cl_args, args.importtime):
+                print('    {:8.3f} s  {}'.format(usec * 1e-6, module))
+
+
+if __name__ == '__main__':
+    main()
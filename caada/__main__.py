@@ -3,10 +3,26 @@ import sys
 
 from .caada_logging import set_log_level
 from .ca_pems.__main__ import parse_ca_pems_agg_args, parse_ca_pems_orgfiles_args
-from .opensky.__main__ import parse_opensky_covid_agg_args
-from .epa_cems.__main__ import parse_cems_download_args
+from .opensky.__main__ import parse_opensky_covid_agg_args, parse_opensky_od_agg_args
+from .epa_cems.__main__ import parse_cems_download_args, parse_cems_agg_args, parse_cems_store_args, \
+    parse_cems_pipeline_args
+from .streetlight.__main__ import parse_streetlight_agg_args
+from .caada_cli import LazyDriver
 
-def parse_args():
+
+def parse_run_args(p: ArgumentParser):
+    p.description = 'Run a pipeline of CAADA commands described in a TOML file, skipping stages that are up to date'
+    p.add_argument('pipeline_file', help='The TOML file describing the pipeline.')
+    p.add_argument('-j', '--max-workers', type=int, help='Maximum number of stages to run at once. Overrides the '
+                                                          'max_workers setting in the pipeline file.')
+    p.add_argument('-f', '--force', action='store_true', help='Run every stage, even those that are up to date.')
+    p.add_argument('-n', '--dry-run', action='store_true', help='Only list which stages would run.')
+    p.add_argument('--state-file', help='JSON file recording which stages have run. Default is to use the state_file '
+                                        'setting in the pipeline file, or PIPELINE.state.json.')
+    p.set_defaults(driver_fxn=LazyDriver('.caada_pipeline', 'run_pipeline', __package__))
+
+
+def build_parser() -> ArgumentParser:
     p = ArgumentParser(description='Agglomerate various datasets into netCDF files')
     p.add_argument('-v', '--verbose', action='store_const', const=2, default=1,
                    help='Increase verbosity of reports to console (stderr) to maximum')
@@ -22,11 +38,32 @@ def parse_args():
 
     os_covid = subp.add_parser('os-covid', help='Agglomerate OpenSky-derived COVID .csvs into one netCDF')
     parse_opensky_covid_agg_args(os_covid)
+    os_covid_od = subp.add_parser('os-covid-od', help='Agglomerate OpenSky-derived COVID .csvs into one netCDF of '
+                                                      'flights between airport pairs')
+    parse_opensky_od_agg_args(os_covid_od)
 
     epa_cems_dl = subp.add_parser('epa-cems-dl', help='Download US EPA CEMS data')
     parse_cems_download_args(epa_cems_dl)
+    epa_cems_agg = subp.add_parser('epa-cems-agg', help='Agglomerate US EPA CEMS data to states or counties')
+    parse_cems_agg_args(epa_cems_agg)
+    epa_cems_store = subp.add_parser('epa-cems-store',
+                                     help='Convert US EPA CEMS data into a partitioned Parquet dataset')
+    parse_cems_store_args(epa_cems_store)
+    epa_cems_pipe = subp.add_parser('epa-cems-dl-agg', help='Download US EPA CEMS data and agglomerate it to states '
+                                                            'or counties in one pipelined step')
+    parse_cems_pipeline_args(epa_cems_pipe)
+
+    streetlight = subp.add_parser('streetlight', help='Convert Streetlight VMT data into a county x time netCDF file')
+    parse_streetlight_agg_args(streetlight)
 
-    return vars(p.parse_args())
+    run = subp.add_parser('run', help='Run a pipeline of CAADA commands described in a TOML file')
+    parse_run_args(run)
+
+    return p
+
+
+def parse_args():
+    return vars(build_parser().parse_args())
 
 
 def main():
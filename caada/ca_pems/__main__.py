@@ -1,6 +1,5 @@
 from argparse import ArgumentParser
-from .agglomeration import cl_dispatcher
-from .files import sort_pems_files
+from ..caada_cli import LazyDriver
 
 
 def parse_ca_pems_agg_args(p: ArgumentParser):
@@ -14,7 +13,7 @@ def parse_ca_pems_agg_args(p: ArgumentParser):
     p.add_argument('save_path', help='The path to save the netCDF file as (including filename).')
     p.add_argument('-s', '--spatial-resolution', default='county', choices=('county',),
                    help='What spatial resolution to agglomerate the data to.')
-    p.set_defaults(driver_fxn=cl_dispatcher)
+    p.set_defaults(driver_fxn=LazyDriver('.agglomeration', 'cl_dispatcher', __package__))
 
 
 def parse_ca_pems_orgfiles_args(p: ArgumentParser):
@@ -27,4 +26,4 @@ def parse_ca_pems_orgfiles_args(p: ArgumentParser):
                    help='Do not decompress any .gz files as they are moved. By default, .gz files are decompressed '
                         'and, if --delete-orig is specified, deleted.')
     p.add_argument('-d', '--dry-run', action='store_true', help='Print what would be done, but do not actually do it.')
-    p.set_defaults(driver_fxn=sort_pems_files)
+    p.set_defaults(driver_fxn=LazyDriver('.files', 'sort_pems_files', __package__))
@@ -72,32 +72,39 @@ def agglomerate_by_county(pems_root: _pathlike, meta_root: _pathlike, save_path:
 
     # Iterate over districts; each county should be entirely contained within districts
     data = []
+    input_files = []
     for district_data_dir in pems_root.iterdir():
         if not re.match(r'd\d\d', district_data_dir.name):
             continue
         district_meta_dir = meta_root / district_data_dir.name
         print('Agglomerating data from {}'.format(district_data_dir))
         print('Using metadata from {}'.format(district_meta_dir))
-        this_data = _agglomerate_district_to_counties(district_data_dir, district_meta_dir, min_percent_observed=min_percent_observed)
+        this_data, this_files = _agglomerate_district_to_counties(district_data_dir, district_meta_dir,
+                                                                  min_percent_observed=min_percent_observed)
+        input_files.extend(this_files)
         if this_data is not None:
             data.append(this_data)
 
     # Memory wasteful, but much easier to implement
     all_district_df = pd.concat(data, axis=0)
     data_arrays, dates, counties = _sum_data_to_counties(all_district_df, variables)
+    parameters = dict(pems_root=pems_root, meta_root=meta_root, min_percent_observed=min_percent_observed,
+                      variables=list(variables))
     _save_county_file(data_dict=data_arrays, dates=dates, county_ids=counties, save_path=save_path,
-                      min_percent_observed=min_percent_observed)
+                      min_percent_observed=min_percent_observed, input_files=input_files, parameters=parameters)
 
 
 def _agglomerate_district_to_counties(pems_district_root: _pathlike, meta_district_root: _pathlike,
                                       min_percent_observed: _scalarnum = 75):
     # Load all the individual month's files
     full_df = []
+    stn_files = []
     print('Loading files...', end=' ')
     for stn_file in pems_district_root.iterdir():
         if not re.match(r'd\d\d.*\.txt', stn_file.name):
             continue
 
+        stn_files.append(stn_file)
         this_df = readers.read_pems_station_csv(stn_file)
         # Eliminate rows with a percent observed less that allowed
         xx = this_df['percent observed'] >= min_percent_observed
@@ -105,7 +112,7 @@ def _agglomerate_district_to_counties(pems_district_root: _pathlike, meta_distri
 
     print('{} files loaded.'.format(len(full_df)))
     if len(full_df) == 0:
-        return None
+        return None, stn_files
 
     full_df = pd.concat(full_df, axis=0)
 
@@ -116,7 +123,7 @@ def _agglomerate_district_to_counties(pems_district_root: _pathlike, meta_distri
     # Group by counties, compute both the total vehicles/day
     xx = full_df['county id'] >= 0
     full_df = full_df[xx]
-    return full_df
+    return full_df, stn_files
 
 
 def _add_county_ids(df: pd.DataFrame, metadata_dir: _pathlike):
@@ -156,7 +163,7 @@ def _sum_data_to_counties(full_df, variables):
 
 
 def _save_county_file(data_dict: dict, dates: np.ndarray, county_ids: np.ndarray, save_path: _pathlike,
-                      min_percent_observed: _scalarnum):
+                      min_percent_observed: _scalarnum, input_files=None, parameters=None):
     variable_info = {'samples': ('num_samples', dict(units='#',
                                                      pems_description='Total number of samples received for all lanes',
                                                      description='Total number of samples summed over all stations in each county.')),
@@ -189,4 +196,4 @@ def _save_county_file(data_dict: dict, dates: np.ndarray, county_ids: np.ndarray
         ds.setncattr('variable_attr_help', "The `pems_description` attribute contains the description of that variable's"
                                            "raw form in the Caltrans PEMS online database. The `description` attribute "
                                            "describes the calculations done to aggregate it for this file.")
-        common_utils.add_caada_info(ds)
+        common_utils.add_caada_info(ds, input_files=input_files, parameters=parameters)
@@ -0,0 +1,35 @@
+from importlib import import_module
+
+
+class LazyDriver:
+    """A command line driver function that is only imported when called.
+
+    Subcommand parsers should use this with `set_defaults(driver_fxn=...)` rather than importing their driver
+    functions directly. That way building the argument parser (e.g. for `caada -h`) does not import the heavy
+    dependencies (netCDF4, geopandas, etc.) of every subcommand.
+
+    Parameters
+    ----------
+    module
+        The module containing the driver function. May be relative, in which case `package` must be given.
+
+    name
+        The name of the driver function in `module`.
+
+    package
+        The package to resolve a relative `module` against; usually the caller's `__package__`.
+    """
+    def __init__(self, module: str, name: str, package: str = None):
+        self.module = module
+        self.name = name
+        self.package = package
+
+    def load(self):
+        """Import and return the driver function"""
+        return getattr(import_module(self.module, self.package), self.name)
+
+    def __call__(self, *args, **kwargs):
+        return self.load()(*args, **kwargs)
+
+    def __repr__(self):
+        return '{}({!r}, {!r}, package={!r})'.format(self.__class__.__name__, self.module, self.name, self.package)
@@ -0,0 +1,79 @@
+"""
+Helpers for writing files safely. This module only uses the standard library so that it can be imported by the web
+modules without pulling in the heavier dependencies of :mod:`caada.common_utils`.
+"""
+
+from contextlib import contextmanager
+import os
+from pathlib import Path
+import tempfile
+from typing import IO, Iterator, Union
+
+# Same as caada.caada_typing.pathlike, which is not imported since it needs pandas
+pathlike = Union[str, Path]
+
+
+def _read_umask() -> int:
+    """Get the process's umask, without changing it if possible"""
+    # Linux reports the umask in /proc, which avoids the brief window in which the umask is changed below
+    try:
+        with open('/proc/self/status') as robj:
+            for line in robj:
+                if line.startswith('Umask:'):
+                    return int(line.split()[1], 8)
+    except (OSError, ValueError, IndexError):
+        pass
+
+    # Otherwise the only way to read the umask is to set it, so set it back immediately
+    umask = os.umask(0o022)
+    os.umask(umask)
+    return umask
+
+
+# The umask is shared by every thread in the process, so changing it to read it (as _read_umask may have to) is only
+# safe before any other threads are creating files. Read it once on import rather than every time a file is written.
+_umask = _read_umask()
+
+
+def default_file_mode() -> int:
+    """Get the permissions a newly created file would normally get, i.e. 0o666 less the process's umask.
+
+    Files created with :func:`tempfile.mkstemp` are only readable by their owner; use this with :func:`os.chmod`
+    before moving such a file into place so that it gets the usual permissions. The umask is read when this module is
+    imported, so this is safe to call from any thread, but will not reflect later changes to the umask.
+    """
+    return 0o666 & ~_umask
+
+
+@contextmanager
+def atomic_writer(path: pathlike, mode: str = 'wb') -> Iterator[IO]:
+    """Open a temporary file to write in place of `path`, which replaces `path` once the block exits without error.
+
+    Concurrent readers of `path` will see either the old or the new file, never a partially written one. If the block
+    raises an exception, the temporary file is removed and `path` is left as it was. The new file gets the usual
+    permissions for a new file (see :func:`default_file_mode`).
+
+    Parameters
+    ----------
+    path
+        The file to write.
+
+    mode
+        The mode to open the temporary file with, either "wb" or "w".
+    """
+    path = Path(path)
+    fd, tmp_name = tempfile.mkstemp(dir=path.parent, prefix='.' + path.name, suffix='.tmp')
+    try:
+        with os.fdopen(fd, mode) as wobj:
+            yield wobj
+        os.chmod(tmp_name, default_file_mode())
+        os.replace(tmp_name, path)
+    except BaseException:
+        os.remove(tmp_name)
+        raise
+
+
+def write_atomic(path: pathlike, data: bytes):
+    """Write `data` to `path` atomically. See :func:`atomic_writer`."""
+    with atomic_writer(path) as wobj:
+        wobj.write(data)
@@ -0,0 +1,369 @@
+"""
+This module runs a pipeline of CAADA commands (and custom Python functions) described in a TOML file.
+
+Each stage lists the files it reads (`inputs`) and writes (`outputs`). A stage that reads another stage's outputs runs
+after it; stages that do not depend on each other run at the same time, in separate processes. After each stage
+succeeds, a fingerprint of its inputs (as they are after the stage ran, leaving out any of the stage's own outputs) and
+parameters is saved in a JSON state file, and on later runs stages whose fingerprint has not changed (and whose outputs
+still exist) are skipped.
+
+An example pipeline file::
+
+    # Optional settings; these are the defaults
+    max_workers = 2
+    fingerprint = "mtime"    # or "content" to hash the input files
+    # state_file = "pipeline.state.json"
+
+    [stages.org_pems]
+    command = "org-pems"
+    args = ["pems", "pems_meta", "raw_pems/*"]
+    inputs = ["raw_pems"]
+    outputs = ["pems", "pems_meta"]
+
+    [stages.ca_pems]
+    command = "ca-pems"
+    args = ["pems", "pems_meta", "ca_pems.nc"]
+    inputs = ["pems", "pems_meta"]
+    outputs = ["ca_pems.nc"]
+
+    [stages.flights]
+    command = "os-covid"
+    args = ["flights.nc", "flightlist_*.csv.gz"]
+    inputs = ["flightlist_*.csv.gz"]
+    outputs = ["flights.nc"]
+
+    [stages.plots]
+    function = "mypackage.plots:make_plots"
+    kwargs = {pems_file = "ca_pems.nc", flights_file = "flights.nc"}
+    inputs = ["ca_pems.nc", "flights.nc"]
+    outputs = ["plots"]
+
+`command` stages take the same arguments as that subcommand does on the command line (globs in `args` are expanded,
+as a shell would). `function` stages call `module:function` with `kwargs`. Paths are relative to the directory
+containing the pipeline file, and inputs may be glob patterns or directories (which include every file under them).
+Stages with no inputs, e.g. downloads, are only rerun if their parameters change or their outputs are missing, unless
+they set `always_run = true`.
+"""
+
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+import fnmatch
+import glob
+import hashlib
+import json
+import os
+from pathlib import Path
+import time
+from typing import Dict, List, Optional
+
+from .caada_cli import LazyDriver
+from .caada_logging import logger
+from .caada_typing import pathlike
+
+_fingerprint_modes = ('mtime', 'content')
+
+
+class PipelineStage:
+    """One stage of a pipeline, as described by one `[stages.NAME]` table in the pipeline file"""
+    def __init__(self, name: str, config: dict, base_dir: Path):
+        self.name = name
+        self.base_dir = base_dir
+        self.command = config.get('command')
+        self.args = [str(a) for a in config.get('args', [])]
+        self.function = config.get('function')
+        self.kwargs = config.get('kwargs', dict())
+        self.inputs = list(config.get('inputs', []))
+        self.outputs = list(config.get('outputs', []))
+        self.depends_on = list(config.get('depends_on', []))
+        self.always_run = bool(config.get('always_run', False))
+
+        unknown = set(config.keys()).difference({'command', 'args', 'function', 'kwargs', 'inputs', 'outputs',
+                                                 'depends_on', 'always_run'})
+        if unknown:
+            raise ValueError('Stage "{}" has unknown keys: {}'.format(name, ', '.join(sorted(unknown))))
+        if (self.command is None) == (self.function is None):
+            raise ValueError('Stage "{}" must have exactly one of "command" or "function"'.format(name))
+        if self.command == 'run':
+            raise ValueError('Stage "{}" cannot itself run a pipeline'.format(name))
+        if self.function is not None and ':' not in self.function:
+            raise ValueError('Stage "{}" function must be given as "module:function"'.format(name))
+
+    def parameters_hash(self) -> str:
+        params = dict(command=self.command, args=self.args, function=self.function, kwargs=self.kwargs,
+                      inputs=self.inputs, outputs=self.outputs)
+        return hashlib.sha1(json.dumps(params, sort_keys=True, default=str).encode('utf8')).hexdigest()
+
+    def resolve_driver(self):
+        """Return the driver function (as a picklable :class:`~caada.caada_cli.LazyDriver`) and its keyword arguments.
+
+        For `command` stages, the arguments go through the same argument parser as on the command line, so they are
+        checked (and get the same defaults) before anything runs.
+        """
+        if self.function is not None:
+            module, name = self.function.split(':', 1)
+            return LazyDriver(module, name), dict(self.kwargs)
+
+        from .__main__ import build_parser
+        args = []
+        for a in self.args:
+            # Expand globs like the shell would, leaving arguments that match nothing unchanged
+            matches = sorted(glob.glob(str(self.base_dir / a))) if glob.has_magic(a) else []
+            if matches:
+                args.extend(os.path.relpath(m, self.base_dir) for m in matches)
+            else:
+                args.append(a)
+
+        try:
+            cl_args = vars(build_parser().parse_args([self.command] + args))
+        except SystemExit:
+            # argparse has already printed what was wrong
+            raise ValueError('Invalid command line arguments for stage "{}"'.format(self.name)) from None
+        for key in ('verbose', 'pdb'):
+            cl_args.pop(key, None)
+        return cl_args.pop('driver_fxn'), cl_args
+
+    def input_files(self) -> List[Path]:
+        """List the files matching the stage's inputs, leaving out any that are also its outputs"""
+        files = set()
+        for pattern in self.inputs:
+            matches = glob.glob(str(self.base_dir / pattern), recursive=True)
+            if len(matches) == 0:
+                raise IOError('Input "{}" of stage "{}" does not exist'.format(pattern, self.name))
+            for m in matches:
+                if os.path.isdir(m):
+                    for root, _, fnames in os.walk(m):
+                        files.update(Path(root) / f for f in fnames)
+                else:
+                    files.add(Path(m))
+        return sorted(f for f in files if not self.produces(os.path.relpath(f, self.base_dir)))
+
+    def inputs_fingerprint(self, mode: str) -> str:
+        entries = []
+        for f in self.input_files():
+            if mode == 'content':
+                entries.append((str(f), _hash_file(f)))
+            else:
+                st = f.stat()
+                entries.append((str(f), st.st_size, st.st_mtime_ns))
+        return hashlib.sha1(json.dumps(entries).encode('utf8')).hexdigest()
+
+    def outputs_exist(self) -> bool:
+        return all(len(glob.glob(str(self.base_dir / o))) > 0 for o in self.outputs)
+
+    def produces(self, path: str) -> bool:
+        """Whether `path` (relative to the pipeline directory) is one of this stage's outputs or inside one"""
+        path = os.path.normpath(path)
+        for out in self.outputs:
+            out = os.path.normpath(out)
+            if path == out or path.startswith(out + os.sep) or fnmatch.fnmatch(path, out) or fnmatch.fnmatch(out, path):
+                return True
+        return False
+
+
+class Pipeline:
+    """A pipeline of stages read from a TOML file; see the module documentation for the file format.
+
+    Parameters
+    ----------
+    pipeline_file
+        The TOML file describing the pipeline.
+
+    state_file
+        The JSON file recording what has already been run. If not given, the `state_file` setting in the pipeline file
+        is used, or else a file named after the pipeline file, e.g. "pipeline.state.json" for "pipeline.toml".
+    """
+    def __init__(self, pipeline_file: pathlike, state_file: Optional[pathlike] = None):
+        import toml
+        pipeline_file = Path(pipeline_file)
+        config = toml.load(str(pipeline_file))
+
+        self.base_dir = pipeline_file.resolve().parent
+        self.max_workers = int(config.get('max_workers', 2))
+        self.fingerprint = config.get('fingerprint', 'mtime')
+        if self.fingerprint not in _fingerprint_modes:
+            raise ValueError('fingerprint must be one of: {}'.format(', '.join(_fingerprint_modes)))
+        if state_file is None:
+            state_file = config.get('state_file', pipeline_file.with_suffix('.state.json').name)
+        self.state_file = self.base_dir / state_file
+
+        stages = config.get('stages', dict())
+        if len(stages) == 0:
+            raise ValueError('No stages defined in {}'.format(pipeline_file))
+        self.stages = {name: PipelineStage(name, cfg, self.base_dir) for name, cfg in stages.items()}
+        self.dependencies = self._find_dependencies()
+
+    def _find_dependencies(self) -> Dict[str, set]:
+        deps = dict()
+        for name, stage in self.stages.items():
+            deps[name] = set(stage.depends_on)
+            for other_name, other in self.stages.items():
+                if other_name != name and any(other.produces(inp) for inp in stage.inputs):
+                    deps[name].add(other_name)
+            missing = deps[name].difference(self.stages)
+            if missing:
+                raise ValueError('Stage "{}" depends on unknown stage(s): {}'.format(name, ', '.join(sorted(missing))))
+
+        # Check for cycles by repeatedly removing stages with no remaining dependencies
+        remaining = {k: set(v) for k, v in deps.items()}
+        while remaining:
+            ready = [k for k, v in remaining.items() if not v]
+            if not ready:
+                raise ValueError('Pipeline stages have circular dependencies: {}'.format(', '.join(sorted(remaining))))
+            for k in ready:
+                del remaining[k]
+            for v in remaining.values():
+                v.difference_update(ready)
+        return deps
+
+    def run(self, max_workers: Optional[int] = None, force: bool = False, dry_run: bool = False) -> Dict[str, str]:
+        """Run the stages that are out of date, in dependency order.
+
+        Parameters
+        ----------
+        max_workers
+            Maximum number of stages to run at once. Overrides the `max_workers` setting in the pipeline file.
+
+        force
+            Run every stage, even if it is up to date.
+
+        dry_run
+            Only log which stages would run, without running them. Since the stages do not run, stages downstream of
+            one that would run are reported as needing to run too.
+
+        Returns
+        -------
+        dict
+            The status of each stage: "skipped" (up to date), "ran", "failed", or "blocked" (not run because a stage it
+            depends on failed). With `dry_run`, stages that would run have the status "would run".
+
+        Raises
+        ------
+        RuntimeError
+            If any stage failed. Stages that do not depend on the failed stage still run.
+        """
+        max_workers = self.max_workers if max_workers is None else max_workers
+        state = self._load_state()
+        status = dict()
+        pending = dict(self.dependencies)
+        running = dict()
+        failures = []
+        log_level = logger.level
+
+        with ProcessPoolExecutor(max_workers=max_workers, initializer=_init_worker,
+                                 initargs=(str(self.base_dir), log_level)) as pool:
+            while pending or running:
+                for name in [n for n, d in pending.items() if all(x in status for x in d)]:
+                    del pending[name]
+                    upstream = [status[d] for d in self.dependencies[name]]
+                    if any(s in ('failed', 'blocked') for s in upstream):
+                        logger.warning('Not running stage "%s" because a stage it depends on failed', name)
+                        status[name] = 'blocked'
+                        continue
+
+                    upstream_ran = any(s in ('ran', 'would run') for s in upstream)
+                    stage = self.stages[name]
+                    # Resolve and fingerprint in this process so that bad arguments or missing inputs fail early
+                    try:
+                        driver, kwargs = stage.resolve_driver()
+                        if dry_run and upstream_ran:
+                            fingerprint = None
+                        else:
+                            fingerprint = stage.inputs_fingerprint(self.fingerprint)
+                    except (ValueError, IOError) as err:
+                        logger.error('Stage "%s" failed: %s', name, err)
+                        status[name] = 'failed'
+                        failures.append(name)
+                        continue
+
+                    if not force and not upstream_ran and self._is_current(stage, state.get(name), fingerprint):
+                        logger.info('Stage "%s" is up to date, skipping', name)
+                        status[name] = 'skipped'
+                    elif dry_run:
+                        logger.info('Stage "%s" would run', name)
+                        status[name] = 'would run'
+                    else:
+                        logger.info('Starting stage "%s"', name)
+                        running[pool.submit(_run_stage, driver, kwargs)] = (name, time.time())
+
+                if not running:
+                    continue
+
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for fut in done:
+                    name, start = running.pop(fut)
+                    err = fut.exception()
+                    if err is None:
+                        logger.info('Finished stage "%s" in %.1f s', name, time.time() - start)
+                        status[name] = 'ran'
+                        # Fingerprint the inputs again, since the stage may have changed them (e.g. org-pems with
+                        # --delete-orig). If they can no longer be fingerprinted, the stage will just run next time.
+                        try:
+                            fingerprint = self.stages[name].inputs_fingerprint(self.fingerprint)
+                        except IOError as fp_err:
+                            logger.warning('Could not fingerprint the inputs of stage "%s" after it ran: %s',
+                                           name, fp_err)
+                            fingerprint = None
+                        state[name] = {'parameters': self.stages[name].parameters_hash(), 'inputs': fingerprint,
+                                       'finished': time.time()}
+                        # Save after every stage, so that an interrupted pipeline does not redo the finished stages
+                        self._save_state(state)
+                    else:
+                        logger.error('Stage "%s" failed: %s', name, err)
+                        status[name] = 'failed'
+                        failures.append(name)
+
+        if failures:
+            raise RuntimeError('Pipeline stage(s) failed: {}'.format(', '.join(failures)))
+        return status
+
+    def _is_current(self, stage: PipelineStage, record: Optional[dict], fingerprint: Optional[str]) -> bool:
+        if stage.always_run or record is None:
+            return False
+        return (record.get('parameters') == stage.parameters_hash() and record.get('inputs') == fingerprint
+                and stage.outputs_exist())
+
+    def _load_state(self) -> dict:
+        try:
+            with open(self.state_file) as robj:
+                state = json.load(robj)
+        except FileNotFoundError:
+            return dict()
+        except (OSError, ValueError) as err:
+            logger.warning('Could not read pipeline state file %s (%s), will rerun all stages', self.state_file, err)
+            return dict()
+        if state.get('fingerprint') != self.fingerprint:
+            return dict()
+        return state.get('stages', dict())
+
+    def _save_state(self, stages_state: dict):
+        tmp_file = self.state_file.with_name(self.state_file.name + '.tmp')
+        with open(tmp_file, 'w') as wobj:
+            json.dump({'fingerprint': self.fingerprint, 'stages': stages_state}, wobj, indent=1)
+        os.replace(tmp_file, self.state_file)
+
+
+def _hash_file(path: Path, chunk_size: int = 1 << 20) -> str:
+    h = hashlib.sha1()
+    with open(path, 'rb') as robj:
+        for chunk in iter(lambda: robj.read(chunk_size), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def _init_worker(base_dir: str, log_level: int):
+    os.chdir(base_dir)
+    logger.setLevel(log_level)
+
+
+def _run_stage(driver, kwargs):
+    driver(**kwargs)
+
+
+def run_pipeline(pipeline_file: pathlike, max_workers: Optional[int] = None, force: bool = False,
+                 dry_run: bool = False, state_file: Optional[pathlike] = None):
+    """Run a pipeline described in a TOML file. See :class:`Pipeline` and :meth:`Pipeline.run` for the parameters.
+
+    Returns
+    -------
+    None
+    """
+    Pipeline(pipeline_file, state_file=state_file).run(max_workers=max_workers, force=force, dry_run=dry_run)
@@ -4,6 +4,7 @@ import numpy as np
 import os
 import pandas as pd
 from typing import Sequence, Optional, Union
+from ..caada_logging import logger
 from ..caada_typing import intseq
 
 from jllutils.subutils import ncdf as ncio
@@ -140,12 +141,23 @@ def geometry_to_lat_lon(geo):
 
 def add_county_polys_to_ncdf(nch: ncdf.Dataset, county_ids: Sequence[int], state_ids: Sequence[int],
                              county_dimension: str = 'county'):
-    polys = get_county_polygons(county_ids, state_ids)
+    # Look up each county individually so that the polygons stay aligned with the county dimension even if some of the
+    # counties are not in the shapefile. Those get empty bounds.
+    county_ids, state_ids = _standardize_input_ids(county_ids, state_ids)
+    county_index = pd.MultiIndex.from_arrays([state_ids, county_ids])
+    polys = _county_gdf.set_index(['statefp', 'countyfp'])['geometry'].reindex(county_index).tolist()
+    missing = [fips for fips, p in zip(county_index, polys) if p is None]
+    if len(missing) > 0:
+        logger.warning('{} counties are not in the county shapefile and will have empty bounds: {}'.format(
+            len(missing), ', '.join('{:02d}{:03d}'.format(*fips) for fips in missing)))
 
     # Convert to an array of lat/lon
     poly_latlon = np.empty([len(polys), 2], object)
     for i, p in enumerate(polys):
-        lat, lon = geometry_to_lat_lon(p)
+        if p is None:
+            lat = lon = np.array([], dtype='float32')
+        else:
+            lat, lon = geometry_to_lat_lon(p)
         poly_latlon[i, 0] = lat.astype('float32')
         poly_latlon[i, 1] = lon.astype('float32')
 
@@ -163,6 +175,7 @@ def add_county_polys_to_ncdf(nch: ncdf.Dataset, county_ids: Sequence[int], state
     for i, p in enumerate(polys):
         # assume the polys are in the same order as the county IDs - the county IDs MUST be given in the order they
         # are in the netCDF file
-        wkt_var[i] = p.to_wkt()
+        wkt_var[i] = '' if p is None else p.wkt
     wkt_var.setncattr('crs', str(_county_gdf.crs))
-    wkt_var.setncattr('description', 'The county shape described in the CRS well known text format')
+    wkt_var.setncattr('description', 'The county shape described in the CRS well known text format, empty if the '
+                                     'county was not in the shapefile')
@@ -1,22 +1,109 @@
+from functools import lru_cache
+import json
 import netCDF4 as ncdf
 import os
 import defusedxml
 from defusedxml.common import EntitiesForbidden
 import xlrd
+from typing import Mapping, Optional
+
+try:
+    import openpyxl
+except ImportError:
+    openpyxl = None
 
 from jllutils import vcs
 from . import __version__
+from .caada_logging import logger
+from .caada_typing import pathseq
 
 defusedxml.defuse_stdlib()
 
+# Written by setup.py when CAADA is installed, so that installed copies do not need git to report their version
+_build_info_file = os.path.join(os.path.dirname(__file__), '_build_info.json')
+
+
+@lru_cache(maxsize=None)
+def get_caada_git_info() -> str:
+    """Get a description of the git commit of CAADA in use.
+
+    This is only worked out once per process. Installed copies of CAADA use the commit recorded at install time; if
+    there is no record (e.g. a development install), git is asked instead, but only if CAADA is inside a git working
+    tree, so that nothing is run (and nothing can hang) for copies that are not.
+
+    Returns
+    -------
+    str
+        A string like "Commit abc123 on master (clean)", or one starting with "unknown" if the commit could not be
+        determined.
+    """
+    try:
+        with open(_build_info_file) as robj:
+            info = json.load(robj)
+        commit, branch, is_clean = info['commit'], info['branch'], info['clean']
+    except FileNotFoundError:
+        if not _in_git_work_tree(os.path.dirname(os.path.abspath(__file__))):
+            return 'unknown (no build information and not in a git repository)'
+        try:
+            repo = vcs.Git(os.path.dirname(__file__))
+            commit, branch, _ = repo.commit_info()
+            is_clean = repo.is_repo_clean()
+        except Exception as err:
+            logger.warning('Could not get git information for CAADA: %s', err)
+            return 'unknown ({})'.format(err)
+    except (OSError, ValueError, KeyError) as err:
+        logger.warning('Could not read CAADA build information from %s: %s', _build_info_file, err)
+        return 'unknown ({})'.format(err)
 
-def add_caada_info(ds: ncdf.Dataset):
-    ds.setncattr('caada_version', __version__)
-    repo = vcs.Git(os.path.dirname(__file__))
-    commit, branch, _ = repo.commit_info()
-    is_clean = repo.is_repo_clean()
     clean_str = 'clean' if is_clean else 'uncommitted changes'
-    ds.setncattr('caada_git_info', 'Commit {commit} on {branch} ({clean})'.format(commit=commit, branch=branch, clean=clean_str))
+    return 'Commit {commit} on {branch} ({clean})'.format(commit=commit, branch=branch, clean=clean_str)
+
+
+def _in_git_work_tree(path: str) -> bool:
+    """Check whether `path` or any of its parents has a .git directory (or file, for worktrees and submodules)"""
+    while True:
+        if os.path.exists(os.path.join(path, '.git')):
+            return True
+        parent = os.path.dirname(path)
+        if parent == path:
+            return False
+        path = parent
+
+
+def add_caada_info(ds: ncdf.Dataset, input_files: Optional[pathseq] = None, parameters: Optional[Mapping] = None,
+                   timings: Optional[Mapping[str, float]] = None):
+    """Add the CAADA version and provenance to a netCDF file's global attributes.
+
+    All attributes are set in one call, and the git information is cached (see :func:`get_caada_git_info`), so this
+    is cheap to call for every file written.
+
+    Parameters
+    ----------
+    ds
+        The netCDF dataset to add the attributes to.
+
+    input_files
+        The files the data were read from, stored in the "caada_input_files" attribute one per line.
+
+    parameters
+        The processing options used, stored as JSON in the "caada_parameters" attribute. Values that JSON cannot
+        represent are converted to strings.
+
+    timings
+        How long each processing step took, in seconds, stored as JSON in the "caada_timings_seconds" attribute.
+
+    Returns
+    -------
+    None
+    """
+    attrs = {'caada_version': __version__, 'caada_git_info': get_caada_git_info()}
+    if input_files is not None:
+        attrs['caada_input_files'] = '\n'.join(str(f) for f in input_files)
+    if parameters is not None:
+        attrs['caada_parameters'] = json.dumps(parameters, default=str, sort_keys=True)
+    if timings is not None:
+        attrs['caada_timings_seconds'] = json.dumps({k: round(float(v), 3) for k, v in timings.items()})
+    ds.setncatts(attrs)
 
 
 # As recommended by https://xlrd.readthedocs.io/en/latest/vulnerabilities.html
@@ -39,4 +126,35 @@ def secure_open_workbook(*args, **kwargs) -> xlrd.Book:
     try:
         return xlrd.open_workbook(*args, **kwargs)
     except EntitiesForbidden:
-        raise ValueError('Please use a xlsx file without XEE')
\ No newline at end of file
+        raise ValueError('Please use a xlsx file without XEE')
+
+
+def secure_open_xlsx_workbook(filename, **kwargs) -> 'openpyxl.Workbook':
+    """Open an Excel .xlsx workbook with :mod:`openpyxl` safely, protecting against embedded XML attacks.
+
+    By default the workbook is opened in read-only mode, which streams rows from the file rather than loading every
+    cell into memory.
+
+    Parameters
+    ----------
+    filename
+        Path to the .xlsx file.
+
+    kwargs
+        Keyword arguments, passed through to :func:`openpyxl.load_workbook`. `read_only` and `data_only` default to
+        `True`.
+
+    Returns
+    -------
+    openpyxl.Workbook
+        Excel workbook. In read-only mode, this should be closed when done.
+    """
+    if openpyxl is None:
+        raise ImportError('The openpyxl package is required to read .xlsx files. Install CAADA with the "xlsx" extra '
+                          '(pip install CAADA[xlsx]) or install openpyxl directly.')
+    kwargs.setdefault('read_only', True)
+    kwargs.setdefault('data_only', True)
+    try:
+        return openpyxl.load_workbook(filename, **kwargs)
+    except EntitiesForbidden:
+        raise ValueError('Please use a xlsx file without XEE')
@@ -1,14 +1,33 @@
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+import netCDF4 as ncdf
+import numpy as np
 import pandas as pd
 import re
+from pathlib import Path
+from typing import Dict, Optional, Sequence, Tuple
+
+from jllutils.subutils import ncdf as ncio
+
+from .. import common_utils
+from ..caada_logging import logger
+from ..caada_typing import pathlike, pathseq
+
+_column_regex = re.compile(r'^([\w\s]+) (all sectors|residential|commercial|industrial|transportation|other) ([\w\s]+)$')
 
-from ..caada_typing import pathlike
 
 def _parse_column_name(colname):
-    regex = re.compile(r'^([\w\s]+) (all sectors|residential|commercial|industrial|transportation|other) ([\w\s]+)$')
-    match = regex.search(colname)
+    location, sector, units = _parse_column_name_cached(colname)
+    return dict(location=location, sector=sector, units=units)
 
-    info = dict(location=match.group(1), sector=match.group(2), units=match.group(3))
-    return info
+
+@lru_cache(maxsize=None)
+def _parse_column_name_cached(colname):
+    # The same column names recur across many chart files, so only parse each once
+    match = _column_regex.search(colname)
+    if match is None:
+        raise ValueError('Could not parse the EIA column name "{}"'.format(colname))
+    return match.group(1), match.group(2), match.group(3)
 
 
 def _columns_to_multiindex(columns):
@@ -28,6 +47,15 @@ def _columns_to_multiindex(columns):
     return pd.MultiIndex.from_tuples(mi_list), units_dict
 
 
+def _read_eia_metric(filename: pathlike) -> str:
+    """Get what an EIA chart file measures from its title line (e.g. "Retail sales of electricity : monthly" gives
+    "Retail sales of electricity"), falling back on the file name if the title is blank."""
+    with open(filename) as robj:
+        title = robj.readline().strip().strip('"')
+    metric = title.split(' : ')[0].strip()
+    return metric if metric else Path(filename).stem
+
+
 def load_eia_df(filename: pathlike, with_units: bool = False):
     """Load an EIA electricity consumption chart CSV as a dataframe
 
@@ -64,3 +92,211 @@ def load_eia_df(filename: pathlike, with_units: bool = False):
         return df, units
     else:
         return df
+
+
+class EIACube:
+    """EIA data from many chart files aligned on common region, sector, and month axes
+
+    Each distinct combination of metric (e.g. "Retail sales of electricity") and units (e.g. "thousand megawatthours")
+    in the input files is one variable, stored as a dense region x sector x month array with NaNs where the input files
+    had no data. Variables are identified by ``(metric, units)`` tuples.
+
+    Parameters
+    ----------
+    regions, sectors
+        The region (e.g. "California") and sector (e.g. "residential") names along the first two axes.
+
+    times
+        The months along the last axis.
+
+    data
+        A dictionary mapping each ``(metric, units)`` variable to its region x sector x month array.
+
+    input_files
+        The chart files the data came from, recorded in the netCDF file written by :meth:`to_netcdf`.
+    """
+    def __init__(self, regions: Sequence[str], sectors: Sequence[str], times: pd.DatetimeIndex,
+                 data: Dict[Tuple[str, str], np.ndarray], input_files: Optional[Sequence[str]] = None):
+        self.regions = pd.Index(regions)
+        self.sectors = pd.Index(sectors)
+        self.times = pd.DatetimeIndex(times)
+        shape = (self.regions.size, self.sectors.size, self.times.size)
+        for key, arr in data.items():
+            if arr.shape != shape:
+                raise ValueError('Array for {} has shape {}, expected {}'.format(key, arr.shape, shape))
+        self.data = data
+        self.input_files = None if input_files is None else [str(f) for f in input_files]
+
+    @property
+    def variables(self):
+        """The ``(metric, units)`` of each variable in the cube"""
+        return list(self.data.keys())
+
+    def __getitem__(self, key) -> np.ndarray:
+        return self.data[key]
+
+    def to_dataframe(self, key: Tuple[str, str]) -> pd.DataFrame:
+        """Convert one variable to a dataframe in the same form as :func:`load_eia_df` returns
+
+        Parameters
+        ----------
+        key
+            The ``(metric, units)`` of the variable to convert.
+
+        Returns
+        -------
+        pandas.DataFrame
+            A dataframe indexed by month, with (region, sector) multiindex columns. Region/sector pairs with no data are
+            omitted.
+        """
+        arr = self.data[key]
+        columns = pd.MultiIndex.from_product([self.regions, self.sectors])
+        df = pd.DataFrame(arr.reshape(-1, arr.shape[-1]).T, index=self.times, columns=columns)
+        return df.dropna(axis=1, how='all')
+
+    def to_netcdf(self, save_path: pathlike):
+        """Write the cube to a netCDF file that :meth:`from_netcdf` can read
+
+        Parameters
+        ----------
+        save_path
+            The path to write to. Will be overwritten if exists!
+
+        Returns
+        -------
+        None
+        """
+        with ncdf.Dataset(save_path, 'w') as ds:
+            time = ncio.make_nctimedim_helper(ds, 'time', self.times, time_units='days')
+            region_dim = ds.createDimension('region', self.regions.size)
+            sector_dim = ds.createDimension('sector', self.sectors.size)
+            for dim, names in ((region_dim, self.regions), (sector_dim, self.sectors)):
+                var = ds.createVariable('{}_name'.format(dim.name), str, dim.name)
+                for i, n in enumerate(names):
+                    var[i] = n
+
+            for i, ((metric, units), arr) in enumerate(self.data.items()):
+                var = ds.createVariable('variable_{}'.format(i), 'f8', (region_dim.name, sector_dim.name, time.name),
+                                        zlib=True, fill_value=np.nan)
+                var[:] = arr
+                var.setncattr('metric', metric)
+                var.setncattr('units', units)
+
+            ds.setncattr('source', 'US Energy Information Administration electricity data browser')
+            common_utils.add_caada_info(ds, input_files=self.input_files,
+                                        parameters=dict(sectors=list(self.sectors)))
+
+    @classmethod
+    def from_netcdf(cls, filename: pathlike) -> 'EIACube':
+        """Read a cube written by :meth:`to_netcdf`
+
+        Parameters
+        ----------
+        filename
+            The netCDF file to read.
+
+        Returns
+        -------
+        EIACube
+        """
+        with ncdf.Dataset(filename) as ds:
+            regions = list(ds.variables['region_name'][:])
+            sectors = list(ds.variables['sector_name'][:])
+            time_var = ds.variables['time']
+            calendar = time_var.getncattr('calendar') if 'calendar' in time_var.ncattrs() else 'standard'
+            times = pd.DatetimeIndex(ncdf.num2date(time_var[:], time_var.units, calendar=calendar,
+                                                   only_use_cftime_datetimes=False, only_use_python_datetimes=True))
+            input_files = None
+            if 'caada_input_files' in ds.ncattrs():
+                input_files = ds.getncattr('caada_input_files').splitlines()
+            data = dict()
+            for name, var in ds.variables.items():
+                if name.startswith('variable_'):
+                    key = (var.getncattr('metric'), var.getncattr('units'))
+                    data[key] = np.ma.filled(var[:].astype(np.float64), np.nan)
+        return cls(regions, sectors, times, data, input_files=input_files)
+
+
+def load_eia_cube(filenames: pathseq, n_threads: int = 4, sectors: Optional[Sequence[str]] = None) -> EIACube:
+    """Load many EIA electricity chart CSVs into a single region x sector x month cube
+
+    Parameters
+    ----------
+    filenames
+        Paths to .csv files that are the CHART download from https://www.eia.gov/electricity/data/browser/#/topic/,
+        as for :func:`load_eia_df`.
+
+    n_threads
+        How many files to read at once.
+
+    sectors
+        The order to put the sectors in. By default, the order is "all sectors", "residential", "commercial",
+        "industrial", "transportation", "other", with any sector not present in any file omitted.
+
+    Returns
+    -------
+    EIACube
+        The data from all of the files. The metric of each file is taken from its title line (or its file name, if the
+        title is blank), so files for different metrics with the same units (e.g. generation and sales, both in
+        thousand megawatthours) become separate variables.
+
+    Raises
+    ------
+    ValueError
+        If two files have different values for the same metric, units, region, sector, and month. Files that overlap
+        but agree are fine.
+    """
+    if n_threads > 1 and len(filenames) > 1:
+        with ThreadPoolExecutor(max_workers=n_threads) as pool:
+            frames = list(pool.map(load_eia_df, filenames, [True] * len(filenames)))
+    else:
+        frames = [load_eia_df(f, with_units=True) for f in filenames]
+
+    if len(frames) == 0:
+        raise ValueError('No EIA files given')
+    metrics = [_read_eia_metric(f) for f in filenames]
+
+    # First pass: collect the axes. Each column is identified by (region, sector, metric, units).
+    all_regions = dict()
+    all_sectors = set()
+    all_variables = dict()
+    times = pd.DatetimeIndex([])
+    for metric, (df, units) in zip(metrics, frames):
+        times = times.union(df.index)
+        for loc, sec in df.columns:
+            all_regions.setdefault(loc, None)
+            all_sectors.add(sec)
+            all_variables.setdefault((metric, units[loc][sec]), None)
+
+    if sectors is None:
+        sector_order = ['all sectors', 'residential', 'commercial', 'industrial', 'transportation', 'other']
+        sectors = [s for s in sector_order if s in all_sectors]
+    regions = pd.Index(list(all_regions))
+    sectors = pd.Index(sectors)
+    data = {key: np.full((regions.size, sectors.size, times.size), np.nan) for key in all_variables}
+
+    # Second pass: scatter each file's values into the cube with integer indexing, one block per file
+    for filename, metric, (df, units) in zip(filenames, metrics, frames):
+        logger.debug('Adding {} to the EIA cube'.format(filename))
+        region_inds = regions.get_indexer(df.columns.get_level_values(0))
+        sector_inds = sectors.get_indexer(df.columns.get_level_values(1))
+        time_inds = times.get_indexer(df.index)
+        values = df.to_numpy(dtype=np.float64, na_value=np.nan)
+        col_units = [units[loc][sec] for loc, sec in df.columns]
+        for u in set(col_units):
+            cols = np.flatnonzero((np.array(col_units) == u) & (sector_inds >= 0))
+            block = values[:, cols].T
+            good = ~np.isnan(block)
+            r = np.broadcast_to(region_inds[cols, None], block.shape)[good]
+            s = np.broadcast_to(sector_inds[cols, None], block.shape)[good]
+            t = np.broadcast_to(time_inds[None, :], block.shape)[good]
+            arr = data[(metric, u)]
+            existing = arr[r, s, t]
+            conflict = ~np.isnan(existing) & ~np.isclose(existing, block[good])
+            if conflict.any():
+                i = np.flatnonzero(conflict)[0]
+                raise ValueError('{} has a different value for "{}" ({}) in {}, {}, {:%Y-%m} than an earlier file'
+                                 .format(filename, metric, u, regions[r[i]], sectors[s[i]], times[t[i]]))
+            arr[r, s, t] = block[good]
+
+    return EIACube(regions, sectors, times, data, input_files=filenames)
@@ -1,23 +1,95 @@
 from argparse import ArgumentParser
-from .web import download_cl_driver
+from ..caada_cli import LazyDriver
 
 
 def parse_cems_download_args(p: ArgumentParser):
     p.description = 'Downlowd continuous emissions data from the US EPA FTP server'
     p.add_argument('time_res', choices=('daily', 'hourly'), help='Which time resolution of data to download')
     p.add_argument('start_time', help='Beginning of time period to download, in YYYY-MM-DD format.')
-    p.add_argument('stop_time', help='End of time period to download, in YYYY-MM-DD format.')
+    p.add_argument('stop_time', help='End of time period to download, in YYYY-MM-DD format. This is inclusive: files '
+                                     'for the month (hourly) or quarter (daily) starting on or before it are included.')
     p.add_argument('-s', '--save-dir', default='.',
                    help='Where to save the downloaded files. Default is the current directory.')
     p.add_argument('-c', '--no-decompress', action='store_false', dest='unzip',
                    help='By default the .zip files downloaded are unzipped into their .csv file. Pass this flag to '
-                        'skip that and leave them as .zip files.')
+                        'skip that and leave them as .zip files, which CAADA can read directly.')
     p.add_argument('-k', '--keep-zip', action='store_false', dest='delete_zip',
                    help='If the .zip files are decompresses, they are by default deleted. Pass this flag to skip '
                         'deleting them. This has no effect either way if --no-decompress is set.')
-    p.set_defaults(driver_fxn=download_cl_driver)
+    p.add_argument('-f', '--force', action='store_true',
+                   help='Download all files from scratch. By default, files already downloaded (and unzipped, unless '
+                        '--no-decompress is given) that have not changed on the server are skipped, and partially '
+                        'downloaded files are resumed.')
+    p.add_argument('-n', '--connections', type=int, default=1,
+                   help='Number of simultaneous FTP connections to download over. Default is %(default)d. When more '
+                        'than one, files are also unzipped while the next ones download.')
+    p.add_argument('--listing-ttl', type=float, default=86400,
+                   help='How long, in seconds, cached listings of the FTP directories may be reused before listing '
+                        'them again. Default is %(default)g (one day); set to 0 to always list the directories.')
+    p.set_defaults(driver_fxn=LazyDriver('.web', 'download_cl_driver', __package__))
     p.epilog = 'A note on the start and stop time: the hourly data is provided in monthly files and the daily data ' \
                'in quarterly files. The start/stop time given filter based on the first date of the files. That is, ' \
                'if you specify a start date of 15 Jan 2020 and an end date of 15 Feb 2020 for the hourly data, the ' \
                'file for February will be downloaded because 15 Jan <= 1 Feb <= 15 Feb, but the file for January will ' \
                'NOT be downloaded.'
+
+
+def parse_cems_agg_args(p: ArgumentParser):
+    p.description = 'Sum US EPA CEMS unit data to states or counties and save it as a netCDF file'
+    p.add_argument('save_path', help='The path to save the netCDF file as (including filename).')
+    p.add_argument('cems_files', nargs='+', help='The CEMS .csv files (or the .zip files containing them) to '
+                                                 'agglomerate. Do not mix hourly and daily files.')
+    p.add_argument('-t', '--time-res', default='day', choices=('hour', 'day'),
+                   help='Time resolution of the output. Default is %(default)s; "hour" requires hourly files.')
+    p.add_argument('-s', '--spatial-resolution', default='state', choices=('state', 'county'),
+                   help='What spatial resolution to agglomerate the data to. Default is %(default)s; "county" '
+                        'requires --facility-file.')
+    p.add_argument('-f', '--facility-file', help='A .csv file with the location of each facility, needed to '
+                                                 'agglomerate to counties. It must have a "fac_id" column and either '
+                                                 'a "fips" column (5-digit county FIPS code), "state_fips" and '
+                                                 '"county_fips" columns, or "latitude" and "longitude" columns.')
+    p.add_argument('--variables', nargs='+', default=['gload', 'heat_input', 'so2_mass', 'nox_mass', 'co2_mass'],
+                   help='Which CEMS variables to sum, named as the CEMS column without units in lower case. Default '
+                        'is %(default)s.')
+    p.set_defaults(driver_fxn=LazyDriver('.agglomeration', 'agglomerate_cems', __package__))
+
+
+def parse_cems_store_args(p: ArgumentParser):
+    p.description = 'Convert US EPA CEMS files into a Parquet dataset partitioned by state and month for fast queries ' \
+                    '(requires pyarrow)'
+    p.add_argument('store_dir', help='The root directory of the dataset. Will be created if needed. Files already '
+                                     'in the dataset are replaced if added again.')
+    p.add_argument('cems_files', nargs='+', help='The CEMS .csv files (or the .zip files containing them) to add.')
+    p.set_defaults(driver_fxn=LazyDriver('.store', 'build_cems_store', __package__))
+
+
+def parse_cems_pipeline_args(p: ArgumentParser):
+    p.description = 'Download US EPA CEMS data and sum it to states or counties in a netCDF file in one pipelined ' \
+                    'step. Files are decompressed and parsed while later ones download, and .csv files are never ' \
+                    'written to disk.'
+    p.add_argument('cems_time_res', choices=('daily', 'hourly'), help='Which time resolution of data to download')
+    p.add_argument('start_time', help='Beginning of time period to download, in YYYY-MM-DD format.')
+    p.add_argument('stop_time', help='End of time period to download, in YYYY-MM-DD format. This is inclusive: files '
+                                     'for the month (hourly) or quarter (daily) starting on or before it are included.')
+    p.add_argument('save_path', help='The path to save the netCDF file as (including filename).')
+    p.add_argument('-w', '--work-dir', default='.',
+                   help='Where to temporarily download the .zip files to. Default is the current directory.')
+    p.add_argument('-t', '--time-res', default='day', choices=('hour', 'day'),
+                   help='Time resolution of the output. Default is %(default)s; "hour" requires hourly files.')
+    p.add_argument('-s', '--spatial-resolution', default='state', choices=('state', 'county'),
+                   help='What spatial resolution to agglomerate the data to. Default is %(default)s; "county" '
+                        'requires --facility-file.')
+    p.add_argument('-f', '--facility-file', help='A .csv file with the location of each facility, needed to '
+                                                 'agglomerate to counties. See epa-cems-agg for the format.')
+    p.add_argument('--variables', nargs='+', help='Which CEMS variables to sum. Default is the same as epa-cems-agg.')
+    p.add_argument('-n', '--connections', type=int, default=2,
+                   help='Number of simultaneous FTP connections to download over. Default is %(default)d.')
+    p.add_argument('-p', '--parse-workers', type=int, default=1,
+                   help='Number of threads parsing files. Default is %(default)d.')
+    p.add_argument('-m', '--max-zip-files', type=int, default=4,
+                   help='Maximum number of downloaded .zip files waiting to be processed, which limits the disk '
+                        'space used. Default is %(default)d.')
+    p.add_argument('-k', '--keep-zip', action='store_true',
+                   help='Keep the downloaded .zip files in the work directory. Files already there that are '
+                        'up-to-date will not be downloaded again.')
+    p.set_defaults(driver_fxn=LazyDriver('.pipeline', 'download_and_agglomerate', __package__))
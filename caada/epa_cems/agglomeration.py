@@ -0,0 +1,339 @@
+"""
+This module contains functions for agglomerating US EPA CEMS data to states or counties and saving the result as a
+netCDF file.
+"""
+
+import geopandas as gpd
+import netCDF4 as ncdf
+import numpy as np
+import pandas as pd
+from typing import Optional
+
+from jllutils.subutils import ncdf as ncio
+
+from . import readers
+from .. import common_utils, common_ancillary
+from ..caada_logging import logger
+from ..caada_typing import pathlike, pathseq, strseq
+
+
+_default_variables = ('gload', 'heat_input', 'so2_mass', 'nox_mass', 'co2_mass')
+_variable_descriptions = {
+    'gload': 'Gross electrical load',
+    'heat_input': 'Heat input',
+    'so2_mass': 'SO2 mass emitted',
+    'nox_mass': 'NOx mass emitted',
+    'co2_mass': 'CO2 mass emitted',
+}
+
+
+def agglomerate_cems(cems_files: pathseq, save_path: pathlike, time_res: str = 'day', spatial_resolution: str = 'state',
+                     facility_file: Optional[pathlike] = None, variables: strseq = _default_variables):
+    """Sum CEMS unit data to states or counties and save as a netCDF file.
+
+    Files are read one at a time and added into running sums, so memory use depends only on the number of
+    states/counties and times in the output, not on the number of files.
+
+    Parameters
+    ----------
+    cems_files
+        Paths to the CEMS .csv files (or the .zip files containing them) to agglomerate. These may be hourly or daily
+        files, but not a mix of the two.
+
+    save_path
+        The name to give the netCDF file produced. Will be overwritten if exists!
+
+    time_res
+        The time resolution of the output, either "hour" or "day". "hour" requires hourly CEMS files.
+
+    spatial_resolution
+        Whether to sum to "state" or "county". "county" requires `facility_file`.
+
+    facility_file
+        A .csv file giving the location of each facility; see :func:`read_facility_counties` for the required format.
+        Facilities not listed are left out of county sums.
+
+    variables
+        Which CEMS variables to sum. These are the column names as :func:`~caada.epa_cems.readers.read_cems_file`
+        returns them, e.g. "gload" or "so2_mass".
+
+    Returns
+    -------
+    None
+    """
+    agglomerator = CemsAgglomerator(time_res=time_res, spatial_resolution=spatial_resolution,
+                                    facility_file=facility_file, variables=variables)
+    for i, f in enumerate(cems_files, start=1):
+        logger.info('Agglomerating {} ({} of {})'.format(f, i, len(cems_files)))
+        agglomerator.add_file(f)
+    agglomerator.save(save_path)
+
+
+class CemsAgglomerator:
+    """Running state/county x time sums of CEMS data, to which files or dataframes can be added one at a time.
+
+    This is what :func:`agglomerate_cems` uses internally; use it directly if the CEMS data is coming from somewhere
+    other than a list of files (e.g. :func:`~caada.epa_cems.pipeline.run_cems_pipeline`). Parameters are the same as
+    for :func:`agglomerate_cems`.
+    """
+    def __init__(self, time_res: str = 'day', spatial_resolution: str = 'state', facility_file: Optional[pathlike] = None,
+                 variables: strseq = _default_variables):
+        if time_res not in ('hour', 'day'):
+            raise ValueError('Unknown time resolution "{}". Allowed values are "hour", "day".'.format(time_res))
+        if spatial_resolution == 'county':
+            if facility_file is None:
+                raise ValueError('A facility file is required to agglomerate to counties')
+            self.facility_counties = read_facility_counties(facility_file)
+        elif spatial_resolution == 'state':
+            self.facility_counties = None
+        else:
+            raise ValueError('Unknown spatial resolution "{}". Allowed values are "state", "county".'.format(spatial_resolution))
+
+        self.time_res = time_res
+        self.spatial_resolution = spatial_resolution
+        self.facility_file = facility_file
+        self.variables = tuple(variables)
+        self.units = None
+        self.sources = []
+        self._accumulator = _CemsAccumulator(self.variables, time_res)
+
+    def add_file(self, cems_file: pathlike):
+        """Read a CEMS .csv or .zip file and add it to the sums."""
+        units = readers.cems_column_units(cems_file)
+        hourly = readers.cems_file_is_hourly(cems_file)
+        df = readers.read_cems_file(cems_file, flat=True, usecols=self.variables)
+        self.add_frame(df, units, source=cems_file, hourly=hourly)
+
+    def add_frame(self, df: pd.DataFrame, units: dict, source: str = 'dataframe', hourly: Optional[bool] = None):
+        """Add data to the sums.
+
+        Parameters
+        ----------
+        df
+            A dataframe as returned by :func:`~caada.epa_cems.readers.read_cems_file` with `flat=True`. It must include
+            the variables being summed.
+
+        units
+            The units of the variables, as returned by :func:`~caada.epa_cems.readers.cems_column_units`. Must be the
+            same for every dataframe added.
+
+        source
+            Where the dataframe came from, used in error and log messages.
+
+        hourly
+            Whether the dataframe was read from an hourly CEMS file. If `False` and the time resolution is "hour", a
+            :class:`ValueError` is raised, since daily data cannot be split into hours. If `None`, this is not checked.
+
+        Notes
+        -----
+        Rows whose state (or, for county sums, county) or date is missing cannot be placed on the grid, so they are
+        left out of the sums with a warning.
+        """
+        if hourly is False and self.time_res == 'hour':
+            raise ValueError('{} contains daily data, which cannot be summed to hourly time resolution'.format(source))
+
+        units = {v: units.get(v) for v in self.variables}
+        if self.units is None:
+            self.units = units
+        elif units != self.units:
+            raise ValueError('Units in {} ({}) differ from those in previous files ({}). Are hourly and daily files '
+                             'mixed?'.format(source, units, self.units))
+
+        if self.facility_counties is None:
+            region_labels = df['state'].cat.categories.astype(str).str.upper().to_numpy()
+            region_codes = df['state'].cat.codes.to_numpy()
+        else:
+            fips_inds = self.facility_counties.index.get_indexer(df['facility_id'])
+            known = fips_inds >= 0
+            if not known.all():
+                missing = np.unique(df.loc[~known, 'facility_id'])
+                logger.warning('{} facilities in {} are not in the facility file and will not be included: {}'
+                               .format(missing.size, source, ', '.join(str(m) for m in missing)))
+                df = df.loc[known]
+                fips_inds = fips_inds[known]
+            region_labels, region_codes = np.unique(self.facility_counties.to_numpy()[fips_inds], return_inverse=True)
+
+        n_dropped = self._accumulator.add(region_labels, region_codes.ravel(), df['date'].to_numpy(),
+                                          {v: df[v].to_numpy() for v in self.variables})
+        if n_dropped > 0:
+            logger.warning('{} rows in {} have no state or date and will not be included'.format(n_dropped, source))
+        self.sources.append(source)
+
+    def save(self, save_path: pathlike):
+        """Write the sums to a netCDF file. Will be overwritten if it exists!"""
+        data, counts, regions, times = self._accumulator.result()
+        parameters = dict(time_res=self.time_res, spatial_resolution=self.spatial_resolution,
+                          facility_file=self.facility_file, variables=self.variables)
+        _save_cems_file(save_path, data, counts, regions, times, spatial_resolution=self.spatial_resolution,
+                        units=self.units or dict(), time_res=self.time_res, sources=self.sources,
+                        parameters=parameters)
+
+
+def read_facility_counties(facility_file: pathlike) -> pd.Series:
+    """Read a table of facility locations and determine the county each facility is in.
+
+    Parameters
+    ----------
+    facility_file
+        A .csv file with one row per facility. Column names are case insensitive. It must have a "fac_id" or
+        "facility_id" column matching the FAC_ID column in the CEMS files, and either:
+
+        * a "fips" column with the 5-digit county FIPS code (state code * 1000 + county code),
+        * "state_fips" and "county_fips" columns with the state and county FIPS codes, or
+        * "latitude" and "longitude" columns, in which case the county is found from the census county shapes.
+
+    Returns
+    -------
+    pandas.Series
+        The 5-digit county FIPS code, indexed by facility ID. Facilities whose county could not be determined are
+        omitted.
+    """
+    df = pd.read_csv(facility_file)
+    df.rename(columns=lambda c: c.strip().lower(), inplace=True)
+    id_col = 'fac_id' if 'fac_id' in df.columns else 'facility_id'
+    if id_col not in df.columns:
+        raise ValueError('{} must have a "fac_id" or "facility_id" column'.format(facility_file))
+
+    if 'fips' in df.columns:
+        fips = pd.to_numeric(df['fips'], errors='coerce')
+    elif 'state_fips' in df.columns and 'county_fips' in df.columns:
+        fips = pd.to_numeric(df['state_fips'], errors='coerce') * 1000 + pd.to_numeric(df['county_fips'], errors='coerce')
+    elif 'latitude' in df.columns and 'longitude' in df.columns:
+        counties = common_ancillary._county_gdf
+        points = gpd.GeoDataFrame(geometry=gpd.points_from_xy(df['longitude'], df['latitude']), crs='EPSG:4326')
+        points = points.to_crs(counties.crs)
+        joined = gpd.sjoin(points, counties[['statefp', 'countyfp', 'geometry']], how='left', predicate='within')
+        joined = joined[~joined.index.duplicated()]
+        fips = joined['statefp'] * 1000 + joined['countyfp']
+    else:
+        raise ValueError('{} must have a "fips" column, "state_fips" and "county_fips" columns, or "latitude" and '
+                         '"longitude" columns'.format(facility_file))
+
+    fips = pd.Series(fips.to_numpy(), index=pd.Index(df[id_col].to_numpy(), name='facility_id'), name='fips')
+    fips = fips[fips.notna() & ~fips.index.duplicated()]
+    return fips.astype('int64')
+
+
+class _CemsAccumulator:
+    """Running sums of CEMS variables on a region x time grid that grows as new regions and times are added."""
+    def __init__(self, variables, time_res):
+        self.variables = tuple(variables)
+        self.time_unit = 'h' if time_res == 'hour' else 'D'
+        self.regions = dict()
+        self.t0 = None
+        self.sums = {v: np.zeros((0, 0)) for v in self.variables}
+        self.counts = np.zeros((0, 0), dtype=np.int64)
+
+    @property
+    def shape(self):
+        return self.counts.shape
+
+    def add(self, region_labels: np.ndarray, region_codes: np.ndarray, dates: np.ndarray, values: dict) -> int:
+        """Add data to the sums. `region_codes` gives the index in `region_labels` of the region for each row.
+
+        Rows with a negative region code (i.e. a missing region, as in :attr:`pandas.Categorical.codes`) or a missing
+        date are skipped. Returns the number of rows skipped.
+        """
+        good_rows = (region_codes >= 0) & ~np.isnat(dates)
+        n_dropped = int(good_rows.size - np.count_nonzero(good_rows))
+        if n_dropped > 0:
+            region_codes = region_codes[good_rows]
+            dates = dates[good_rows]
+            values = {v: values[v][good_rows] for v in self.variables}
+        if region_codes.size == 0:
+            return n_dropped
+
+        region_map = np.array([self.regions.setdefault(r, len(self.regions)) for r in region_labels.tolist()])
+        region_inds = region_map[region_codes]
+
+        tinds = dates.astype('datetime64[{}]'.format(self.time_unit)).astype(np.int64)
+        self._grow(len(self.regions), tinds.min(), tinds.max())
+        tinds = tinds - self.t0
+
+        # Scatter-add with bincount on the flattened grid indices, which is much faster than a groupby
+        nregions, ntimes = self.shape
+        flat_inds = region_inds * ntimes + tinds
+        self.counts += np.bincount(flat_inds, minlength=nregions * ntimes).reshape(nregions, ntimes)
+        for v in self.variables:
+            vals = values[v]
+            good = ~np.isnan(vals)
+            self.sums[v] += np.bincount(flat_inds[good], weights=vals[good], minlength=nregions * ntimes).reshape(nregions, ntimes)
+        return n_dropped
+
+    def result(self):
+        order = sorted(self.regions)
+        inds = [self.regions[r] for r in order]
+        data = {v: self.sums[v][inds] for v in self.variables}
+        counts = self.counts[inds]
+        for arr in data.values():
+            arr[counts == 0] = np.nan
+        ntimes = self.shape[1]
+        times = pd.DatetimeIndex((np.arange(ntimes) + (self.t0 or 0)).astype('datetime64[{}]'.format(self.time_unit)))
+        return data, counts, np.array(order), times
+
+    def _grow(self, nregions, tmin, tmax):
+        old_nregions, old_ntimes = self.shape
+        if self.t0 is None:
+            self.t0 = tmin
+            tstart = tmin
+            tend = tmax + 1
+        else:
+            tstart = min(self.t0, tmin)
+            tend = max(self.t0 + old_ntimes, tmax + 1)
+
+        pad = ((0, nregions - old_nregions), (self.t0 - tstart, tend - (self.t0 + old_ntimes)))
+        if pad == ((0, 0), (0, 0)):
+            return
+        self.counts = np.pad(self.counts, pad)
+        self.sums = {v: np.pad(arr, pad) for v, arr in self.sums.items()}
+        self.t0 = tstart
+
+
+def _save_cems_file(save_path, data_dict, counts, regions, times, spatial_resolution, units, time_res, sources=None,
+                    parameters=None):
+    period = 'hour' if time_res == 'hour' else 'day'
+    with ncdf.Dataset(save_path, 'w') as ds:
+        time = ncio.make_nctimedim_helper(ds, 'time', times, time_units='hours' if time_res == 'hour' else 'days')
+        if spatial_resolution == 'county':
+            regions = regions.astype(int)
+            state_ids = regions // 1000
+            county_ids = regions % 1000
+            region_dim = ncio.make_ncdim_helper(ds, 'county', np.arange(regions.size),
+                                                description='Index for the counties')
+            ncio.make_ncvar_helper(ds, 'county_id', county_ids, [region_dim],
+                                   description='Census ID of the county, unique only within a state')
+            ncio.make_ncvar_helper(ds, 'state_id', state_ids, [region_dim],
+                                   description='Census ID of the state that each county is in')
+            county_names = ds.createVariable('county_name', str, region_dim.name)
+            names = common_ancillary.get_poly_gdf_subset(county_ids.tolist(), state_ids.tolist())['name'].tolist()
+            for i, n in enumerate(names):
+                county_names[i] = n
+            common_ancillary.add_county_polys_to_ncdf(ds, county_ids=county_ids.tolist(), state_ids=state_ids.tolist(),
+                                                      county_dimension=region_dim.name)
+        else:
+            state_gdf = common_ancillary._state_gdf.set_index('stusps')
+            region_dim = ncio.make_ncdim_helper(ds, 'state', np.arange(regions.size),
+                                                description='Index for the states')
+            state_ids = state_gdf['statefp'].reindex(regions).fillna(-99).astype(int).to_numpy()
+            ncio.make_ncvar_helper(ds, 'state_id', state_ids, [region_dim],
+                                   description='Census ID of the state, -99 if the state abbreviation was not recognized')
+            state_abbrevs = ds.createVariable('state_abbrev', str, region_dim.name)
+            state_names = ds.createVariable('state_name', str, region_dim.name)
+            for i, r in enumerate(regions):
+                state_abbrevs[i] = r
+                state_names[i] = state_gdf['name'].get(r, '')
+
+        for varname, vararray in data_dict.items():
+            long_name = _variable_descriptions.get(varname, varname)
+            ncio.make_ncvar_helper(ds, varname, vararray, [region_dim, time],
+                                   units=units.get(varname) or '',
+                                   description='{} summed over all units in each {} and {}. NaN where no units '
+                                               'reported.'.format(long_name, spatial_resolution, period))
+        ncio.make_ncvar_helper(ds, 'num_unit_records', counts.astype(np.int32), [region_dim, time], units='#',
+                               description='Number of unit records (unit-hours or unit-days, depending on the input '
+                                           'files) summed in each {} and {}'.format(spatial_resolution, period))
+
+        ds.setncattr('time_resolution', time_res)
+        ds.setncattr('source', 'US EPA Continuous Emission Monitoring System (CEMS) data')
+        common_utils.add_caada_info(ds, input_files=sources, parameters=parameters)
+
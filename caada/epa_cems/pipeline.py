@@ -0,0 +1,267 @@
+"""
+This module runs the CEMS download, decompress, and parse steps as a pipeline, so that each file moves on to the next
+step as soon as it is ready rather than waiting for every file to finish the previous step.
+
+Each step runs in its own thread(s), connected by bounded queues. When a later step falls behind, the queue ahead of it
+fills up and the earlier steps wait, so no more than a fixed number of .zip files are ever on disk and no more than a
+fixed number of decompressed files or parsed dataframes are held in memory at once.
+"""
+
+from io import BytesIO
+import os
+from pathlib import Path
+import queue
+import threading
+from typing import Callable, Optional
+from zipfile import ZipFile
+
+import pandas as pd
+
+from . import readers
+from .agglomeration import CemsAgglomerator
+from .web import EPAFTP
+from ..caada_logging import logger
+from ..caada_typing import datetimelike, pathlike, strseq
+
+_DONE = object()
+
+
+class _PipelineStopped(Exception):
+    pass
+
+
+class _Pipeline:
+    """Bookkeeping shared by the pipeline threads: a stop flag set on the first error, and that error."""
+    def __init__(self):
+        self.stop = threading.Event()
+        self.error = None
+        self._lock = threading.Lock()
+
+    def fail(self, err):
+        with self._lock:
+            if self.error is None:
+                self.error = err
+        self.stop.set()
+
+    def put(self, q, item):
+        # Poll rather than block forever so that the threads can exit if another stage fails while the queue is full
+        while not self.stop.is_set():
+            try:
+                q.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                pass
+        raise _PipelineStopped()
+
+    def get(self, q):
+        while not self.stop.is_set():
+            try:
+                return q.get(timeout=0.1)
+            except queue.Empty:
+                pass
+        raise _PipelineStopped()
+
+    def run_stage(self, n_workers, worker_fxn, in_q, out_q, n_consumers):
+        """Start `n_workers` threads running `worker_fxn(item)` on each item in `in_q`, putting whatever they yield
+        into `out_q`. Once all of them are done, `n_consumers` end markers are put into `out_q`."""
+        def worker():
+            try:
+                while True:
+                    item = self.get(in_q)
+                    if item is _DONE:
+                        return
+                    for result in worker_fxn(item):
+                        self.put(out_q, result)
+            except _PipelineStopped:
+                pass
+            except Exception as err:
+                self.fail(err)
+
+        def coordinator():
+            for t in threads:
+                t.join()
+            try:
+                for _ in range(n_consumers):
+                    self.put(out_q, _DONE)
+            except _PipelineStopped:
+                pass
+
+        threads = [threading.Thread(target=worker, daemon=True) for _ in range(n_workers)]
+        for t in threads:
+            t.start()
+        coord = threading.Thread(target=coordinator, daemon=True)
+        coord.start()
+        return coord
+
+
+def run_cems_pipeline(time_res: str, start_time: datetimelike, stop_time: datetimelike, work_dir: pathlike,
+                      reduce_fxn: Callable[[str, pd.DataFrame, dict], None], states: str = 'all',
+                      connections: int = 2, decompress_workers: int = 1, parse_workers: int = 1,
+                      max_zip_files: int = 4, max_csv_files: int = 2, keep_zip: bool = False,
+                      ftp_kws: Optional[dict] = None, read_kws: Optional[dict] = None):
+    """Download, decompress, and parse CEMS files as a pipeline, passing each parsed file to a reduction function.
+
+    Parameters
+    ----------
+    time_res, start_time, stop_time, states
+        Which files to process; see :meth:`~caada.epa_cems.web.EPAFTP.download`.
+
+    work_dir
+        Directory to download the .zip files to. The .csv files are never written to disk.
+
+    reduce_fxn
+        Function called with the name of each .csv file, the dataframe read from it (by
+        :func:`~caada.epa_cems.readers.read_cems_file`), and the units of its columns (as
+        :func:`~caada.epa_cems.readers.cems_column_units` returns). It is always called from the thread that called this
+        function, one file at a time, so it does not need to be thread safe. Files are passed in whatever order they
+        finish parsing.
+
+    connections
+        Number of FTP connections to download over at once.
+
+    decompress_workers
+        Number of threads decompressing the .zip files.
+
+    parse_workers
+        Number of threads parsing the decompressed .csv data.
+
+    max_zip_files
+        Maximum number of downloaded .zip files waiting to be decompressed. Together with `connections`, this caps the
+        disk space used by the pipeline.
+
+    max_csv_files
+        Maximum number of decompressed .csv files waiting to be parsed, and parsed dataframes waiting to be reduced. This
+        caps the memory used by the pipeline.
+
+    keep_zip
+        If `True`, the downloaded .zip files are not deleted after decompressing, and ones already in `work_dir` that
+        are up-to-date with the server are not downloaded again.
+
+    ftp_kws
+        Keyword arguments for :class:`~caada.epa_cems.web.EPAFTP`.
+
+    read_kws
+        Keyword arguments for :func:`~caada.epa_cems.readers.read_cems_file`. `flat` is `True` unless given here.
+
+    Returns
+    -------
+    None
+    """
+    work_dir = EPAFTP._check_save_dir(work_dir)
+    ftp_kws = dict() if ftp_kws is None else ftp_kws
+    read_kws = dict(flat=True) if read_kws is None else dict(read_kws)
+    read_kws.setdefault('flat', True)
+
+    file_q = queue.Queue()
+    with EPAFTP(**ftp_kws) as ftp:
+        for dir_url, fnames in ftp.file_list(time_res, start_time, stop_time, states).items():
+            for f in fnames:
+                file_q.put((dir_url, f, ftp.listed_file_info(dir_url, f)))
+    nfiles = file_q.qsize()
+    logger.info('Processing {} files through the pipeline'.format(nfiles))
+    for _ in range(connections):
+        file_q.put(_DONE)
+
+    zip_q = queue.Queue(maxsize=max_zip_files)
+    csv_q = queue.Queue(maxsize=max_csv_files)
+    df_q = queue.Queue(maxsize=max_csv_files)
+    pipeline = _Pipeline()
+    ftp_local = threading.local()
+    ftp_connections = []
+
+    def download(item):
+        dir_url, fname, info = item
+        if not hasattr(ftp_local, 'ftp'):
+            ftp_local.ftp = EPAFTP(**ftp_kws)
+            ftp_connections.append(ftp_local.ftp)
+        # Go through _sync_file rather than retrieve_file so that a download that does not match a stale cached
+        # listing is retried, as for the other download functions. Nothing is unzipped to disk, so there is no
+        # manifest to check.
+        ftp_local.ftp._sync_file(dir_url, fname, work_dir, manifest=None, unzip=False, remote_info=info)
+        yield work_dir / fname
+
+    def decompress(zip_path):
+        with ZipFile(zip_path) as z:
+            members = [m for m in readers.cems_zip_members(z, zip_path) if m.filename.lower().endswith('.csv')]
+            data = [(m.filename, z.read(m)) for m in members]
+        if not keep_zip:
+            os.remove(zip_path)
+        yield from data
+
+    def parse(item):
+        name, data = item
+        units = readers.cems_column_units(BytesIO(data))
+        df = readers.read_cems_file(BytesIO(data), **read_kws)
+        yield name, df, units
+
+    stages = [
+        pipeline.run_stage(connections, download, file_q, zip_q, decompress_workers),
+        pipeline.run_stage(decompress_workers, decompress, zip_q, csv_q, parse_workers),
+        pipeline.run_stage(parse_workers, parse, csv_q, df_q, 1),
+    ]
+
+    try:
+        n_reduced = 0
+        while True:
+            item = pipeline.get(df_q)
+            if item is _DONE:
+                break
+            name, df, units = item
+            reduce_fxn(name, df, units)
+            n_reduced += 1
+            logger.info('Reduced {} ({} done)'.format(name, n_reduced))
+    except _PipelineStopped:
+        pass
+    except BaseException as err:
+        pipeline.fail(err)
+        raise
+    finally:
+        # By now the stages are either finished or need to be told to give up
+        pipeline.stop.set()
+        for s in stages:
+            s.join()
+        for conn in ftp_connections:
+            conn.close()
+
+    if pipeline.error is not None:
+        raise pipeline.error
+
+
+def download_and_agglomerate(cems_time_res: str, start_time: datetimelike, stop_time: datetimelike,
+                             save_path: pathlike, work_dir: pathlike = '.', states: str = 'all', time_res: str = 'day',
+                             spatial_resolution: str = 'state', facility_file: Optional[pathlike] = None,
+                             variables: Optional[strseq] = None, connections: int = 2, parse_workers: int = 1,
+                             max_zip_files: int = 4, keep_zip: bool = False):
+    """Download CEMS files and sum them to states or counties in a netCDF file, without writing any .csv files.
+
+    Parameters
+    ----------
+    cems_time_res
+        Which CEMS files to download, "hourly" or "daily".
+
+    start_time, stop_time, states
+        See :meth:`~caada.epa_cems.web.EPAFTP.download`.
+
+    save_path, time_res, spatial_resolution, facility_file, variables
+        See :func:`~caada.epa_cems.agglomeration.agglomerate_cems`.
+
+    work_dir, connections, parse_workers, max_zip_files, keep_zip
+        See :func:`run_cems_pipeline`.
+
+    Returns
+    -------
+    None
+    """
+    if cems_time_res == 'daily' and time_res == 'hour':
+        raise ValueError('Daily CEMS files cannot be summed to hourly time resolution')
+    agg_kws = dict() if variables is None else dict(variables=variables)
+    agglomerator = CemsAgglomerator(time_res=time_res, spatial_resolution=spatial_resolution,
+                                    facility_file=facility_file, **agg_kws)
+
+    def reduce_fxn(name, df, units):
+        agglomerator.add_frame(df, units, source=name)
+
+    run_cems_pipeline(cems_time_res, start_time, stop_time, Path(work_dir), reduce_fxn, states=states,
+                      connections=connections, parse_workers=parse_workers, max_zip_files=max_zip_files,
+                      keep_zip=keep_zip, read_kws=dict(usecols=agglomerator.variables))
+    agglomerator.save(save_path)
@@ -1,53 +1,106 @@
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+import numpy as np
+import os
 import pandas as pd
+from pathlib import Path
 import re
+from typing import List, Optional
+from zipfile import ZipFile, ZipInfo
 from jllutils import miscutils
 
-from ..caada_typing import pathseq, pathlike
+from ..caada_typing import datetimelike, pathseq, pathlike, strseq
 
+# Columns in the CEMS files that make up the index of the dataframes returned by the readers
+_cems_index_columns = ('STATE', 'OP_DATE', 'OP_HOUR', 'FAC_ID', 'UNIT_ID')
 
-def read_multi_cems_files(cems_files: pathseq, **kwargs) -> pd.DataFrame:
+
+def read_multi_cems_files(cems_files: pathseq, n_procs: int = 1, max_in_flight: Optional[int] = None,
+                          **kwargs) -> pd.DataFrame:
     """Read multiple US EPA CEMS .csv files
 
     Parameters
     ----------
     cems_files
-        A sequence of paths to CEMS .csv files.
+        A sequence of paths to CEMS .csv files, or the .zip files downloaded from the EPA FTP server that contain
+        them.
+
+    n_procs
+        Number of processes to read files in. If 1 (the default), files are read one at a time in this process.
+
+    max_in_flight
+        When `n_procs` > 1, the maximum number of files that may be read but not yet collected at any time. This
+        limits how much memory is used if the files are read faster than they are transferred back to the main
+        process. Default is twice `n_procs`.
 
     kwargs
-        Additional keyword arguments to pass to :func:`read_cems_file`
+        Additional keyword arguments to pass to :func:`read_cems_file`, e.g. `usecols`, `states`, `start_date`, and
+        `stop_date` to limit what is loaded, or `downcast` to reduce its memory use.
 
     Returns
     -------
     pandas.DataFrame
         A dataframe representing all the .csv files given in as arguments. The index with be a multiindex with state,
-        date, facility_id, and unit_id. The data will be in the same order as the file names were given.
+        date, facility_id, and unit_id (or, if `flat=True` is passed, those will be columns). The data will be in the
+        same order as the file names were given.
 
     """
-    all_dfs = []
     pbar = miscutils.ProgressBar(len(cems_files), prefix='Loading files')
-    for f in cems_files:
-        pbar.print_bar()
-        all_dfs.append(read_cems_file(f, **kwargs))
-    all_dfs = [read_cems_file(f, **kwargs) for f in cems_files]
-    return pd.concat(all_dfs)
+    if n_procs <= 1:
+        all_dfs = []
+        for f in cems_files:
+            pbar.print_bar()
+            all_dfs.append(read_cems_file(f, **kwargs))
+    else:
+        all_dfs = _read_cems_files_parallel(cems_files, n_procs, max_in_flight, pbar, **kwargs)
 
+    return _concat_cems_frames(all_dfs, flat=kwargs.get('flat', False))
 
-def read_cems_file(cems_file: pathlike, drop_units: bool = True) -> pd.DataFrame:
+
+def read_cems_file(cems_file: pathlike, drop_units: bool = True, flat: bool = False, usecols: Optional[strseq] = None,
+                   states: Optional[strseq] = None, start_date: Optional[datetimelike] = None,
+                   stop_date: Optional[datetimelike] = None, downcast: bool = False) -> pd.DataFrame:
     """Read a single US EPA CEMS .csv file
 
     Parameters
     ----------
     cems_file
-        The path to the CEMS .csv file to read
+        The path to the CEMS .csv file to read. This may also be a .zip file as downloaded from the EPA FTP server, in
+        which case the .csv file(s) in it are read directly from the archive without extracting them to disk, or an open
+        file object containing .csv data.
 
     drop_units
         Whether to remove units from the column names.
 
+    flat
+        If `True`, the state, date, facility_id, and unit_id are returned as the first four columns of the dataframe
+        with a default integer index, rather than as a multiindex. This is faster and simpler to work with if you only
+        need to group or aggregate the data.
+
+    usecols
+        If given, only these data columns are read from the file. Columns may be given by their name in the file
+        (e.g. "SO2_MASS (lbs)") or as they are named in the output (e.g. "so2_mass"). The columns needed for the
+        state, date, facility_id, and unit_id are always read.
+
+    states
+        If given, only rows for these states (two letter abbreviations, case insensitive) are kept.
+
+    start_date, stop_date
+        If given, only rows with dates (including the hour for hourly files) on or after `start_date` and before
+        `stop_date` are kept. Note that `stop_date` is exclusive, unlike the stop time for downloading files, so that
+        e.g. ``start_date='2020-01-01', stop_date='2020-02-01'`` keeps all of January 2020, including every hour of
+        January 31st.
+
+    downcast
+        If `True`, floating point columns are converted to 32-bit floats, integer columns to the smallest integer type
+        that holds them, and text columns to categoricals. This roughly halves the memory needed.
+
     Returns
     -------
     pandas.DataFrame
         A dataframe representing the .csv file given as the first argument. The index with be a multiindex with state,
-        date, facility_id, and unit_id.
+        date, facility_id, and unit_id. State and unit_id are categorical and facility_id is an integer.
     """
     def rename_fxn(c):
         c = c.lower()
@@ -55,22 +108,206 @@ def read_cems_file(cems_file: pathlike, drop_units: bool = True) -> pd.DataFrame
             c = re.sub(r'\(.+\)', '', c).strip()
         return c
 
-    df = pd.read_csv(cems_file)
-    df.index = _cems_multiindex(df)
-    cols_to_drop = ['STATE', 'OP_DATE', 'FAC_ID', 'UNIT_ID']
+    if usecols is None:
+        read_cols = None
+    else:
+        keep = set(usecols)
+
+        def read_cols(c):
+            return c in _cems_index_columns or c in keep or rename_fxn(c) in keep
+
+    df = _read_cems_csv(cems_file, usecols=read_cols)
+
+    # Filter the rows as early as possible so that later steps have less to do
+    if states is not None:
+        df = df.loc[df['STATE'].str.lower().isin([s.lower() for s in states]).to_numpy()]
+    index_arrays = _cems_index_arrays(df)
+    if start_date is not None or stop_date is not None:
+        dates = index_arrays['date']
+        xx = np.ones(dates.size, dtype=bool)
+        if start_date is not None:
+            xx &= dates >= pd.Timestamp(start_date)
+        if stop_date is not None:
+            xx &= dates < pd.Timestamp(stop_date)
+        df = df.loc[xx]
+        index_arrays = {k: v[xx] for k, v in index_arrays.items()}
+
+    cols_to_drop = [c for c in _cems_index_columns if c in df.columns]
+    df = df.drop(columns=cols_to_drop).rename(columns=rename_fxn)
+    if downcast:
+        df = _downcast_cems_frame(df)
+
+    if flat:
+        index_df = pd.DataFrame(index_arrays, index=df.index)
+        return pd.concat([index_df, df], axis=1).reset_index(drop=True)
+    else:
+        df.index = pd.MultiIndex.from_arrays(list(index_arrays.values()), names=list(index_arrays.keys()))
+        return df
+
+
+def cems_column_units(cems_file: pathlike) -> dict:
+    """Get the units of each data column in a CEMS file
+
+    Parameters
+    ----------
+    cems_file
+        The path to the CEMS .csv or .zip file. Only the header is read.
+
+    Returns
+    -------
+    dict
+        A dictionary with the column names as :func:`read_cems_file` returns them (with `drop_units=True`) as keys and
+        the units as values. Columns without units in their names are not included.
+    """
+    return _column_units(_read_cems_csv(cems_file, nrows=0).columns)
+
+
+def cems_file_is_hourly(cems_file: pathlike) -> bool:
+    """Determine whether a CEMS file contains hourly data (as opposed to daily)
+
+    Parameters
+    ----------
+    cems_file
+        The path to the CEMS .csv or .zip file. Only the header is read.
+
+    Returns
+    -------
+    bool
+        `True` if the file has an OP_HOUR column, i.e. is one of the hourly files.
+    """
+    return 'OP_HOUR' in _read_cems_csv(cems_file, nrows=0).columns
+
+
+def _column_units(columns):
+    units = dict()
+    for col in columns:
+        m = re.search(r'\((.+)\)', col)
+        if m is not None:
+            units[re.sub(r'\(.+\)', '', col.lower()).strip()] = m.group(1)
+    return units
+
+
+def cems_zip_members(zfile: ZipFile, zip_path: pathlike = '') -> List[ZipInfo]:
+    """List the members of a CEMS .zip file, checking that they are safe to extract or read
+
+    Parameters
+    ----------
+    zfile
+        The open .zip file.
+
+    zip_path
+        The path to the .zip file, only used in the error message.
+
+    Returns
+    -------
+    list
+        The :class:`zipfile.ZipInfo` instances for each member of the .zip file.
+
+    Raises
+    ------
+    IOError
+        If any member's name contains path separators. The EPA .zip files are not expected to contain any
+        directories, and such a member could be extracted outside the intended directory.
+    """
+    members = zfile.infolist()
+    for mem in members:
+        if os.sep in mem.filename or '/' in mem.filename:
+            raise IOError('A member of {} contains path separators. This is unexpected and potentially unsafe.'.format(zip_path))
+    return members
+
+
+def _read_cems_csv(cems_file, **kwargs):
+    if hasattr(cems_file, 'read'):
+        return pd.read_csv(cems_file, **kwargs)
+    elif Path(cems_file).suffix.lower() == '.zip':
+        with ZipFile(cems_file) as z:
+            members = [m for m in cems_zip_members(z, cems_file) if m.filename.lower().endswith('.csv')]
+            if len(members) == 0:
+                raise IOError('{} does not contain any .csv files'.format(cems_file))
+            dfs = []
+            for mem in members:
+                with z.open(mem) as robj:
+                    dfs.append(pd.read_csv(robj, **kwargs))
+        return pd.concat(dfs, ignore_index=True) if len(dfs) > 1 else dfs[0]
+    else:
+        return pd.read_csv(cems_file, **kwargs)
+
+
+def _cems_index_arrays(df):
+    # The dates repeat for every hour and unit, so to_datetime's cache means each unique string is only parsed once
+    dates = pd.to_datetime(df['OP_DATE'].to_numpy(), cache=True)
     if 'OP_HOUR' in df.columns:
-        cols_to_drop.append('OP_HOUR')
-    df.drop(columns=cols_to_drop, inplace=True)
-    df.rename(columns=rename_fxn, inplace=True)
+        dates = dates + pd.to_timedelta(df['OP_HOUR'].to_numpy(), unit='h')
+    return {'state': pd.Categorical(df['STATE']),
+            'date': dates,
+            'facility_id': pd.to_numeric(df['FAC_ID'], downcast='integer').to_numpy(),
+            'unit_id': pd.Categorical(df['UNIT_ID'])}
+
+
+def _read_cems_files_parallel(cems_files, n_procs, max_in_flight, pbar, **kwargs):
+    if max_in_flight is None:
+        max_in_flight = 2 * n_procs
+    max_in_flight = max(max_in_flight, 1)
+
+    read_fxn = partial(read_cems_file, **kwargs)
+    all_dfs = []
+    pending = deque()
+    with ProcessPoolExecutor(max_workers=n_procs) as pool:
+        # Collect the results in order, only submitting a new file once there is room. This keeps the output in the
+        # same order as the input and bounds how many finished dataframes can pile up waiting to be collected.
+        for f in cems_files:
+            if len(pending) >= max_in_flight:
+                all_dfs.append(pending.popleft().result())
+                pbar.print_bar()
+            pending.append(pool.submit(read_fxn, f))
+        while len(pending) > 0:
+            all_dfs.append(pending.popleft().result())
+            pbar.print_bar()
+    return all_dfs
+
+
+def _downcast_cems_frame(df):
+    for col in df.columns:
+        dtype = df[col].dtype
+        if pd.api.types.is_float_dtype(dtype):
+            df[col] = df[col].astype(np.float32)
+        elif pd.api.types.is_integer_dtype(dtype):
+            df[col] = pd.to_numeric(df[col], downcast='integer')
+        elif pd.api.types.is_object_dtype(dtype) or pd.api.types.is_string_dtype(dtype):
+            df[col] = df[col].astype('category')
     return df
 
 
-def _cems_multiindex(df):
-    states = df['STATE']
-    fac = df['FAC_ID']
-    unit = df['UNIT_ID']
-    dates = pd.DatetimeIndex(df['OP_DATE'])
-    if 'OP_HOUR' in df.columns:
-        dates = [d + pd.Timedelta(hours=h) for d, h in zip(dates, df['OP_HOUR'])]
-        dates = pd.DatetimeIndex(dates)
-    return pd.MultiIndex.from_arrays([states, dates, fac, unit], names=['state', 'date', 'facility_id', 'unit_id'])
+def _unify_categories(dfs):
+    # Concatenating categoricals with different categories falls back on plain arrays, which use much more memory,
+    # so give all the frames the same categories first.
+    if len(dfs) < 2:
+        return dfs
+    cat_cols = [c for c in dfs[0].columns if isinstance(dfs[0][c].dtype, pd.CategoricalDtype)]
+    for col in cat_cols:
+        if not all(col in d.columns and isinstance(d[col].dtype, pd.CategoricalDtype) for d in dfs):
+            continue
+        categories = dfs[0][col].cat.categories
+        for d in dfs[1:]:
+            categories = categories.union(d[col].cat.categories)
+        for d in dfs:
+            d[col] = d[col].cat.set_categories(categories)
+    return dfs
+
+
+def _concat_cems_frames(dfs, flat=False):
+    """Concatenate dataframes from :func:`read_cems_file`, keeping the state and unit_id categorical"""
+    dfs = _unify_categories(dfs)
+    if not flat:
+        df = pd.concat(dfs)
+        for col in ('state', 'unit_id'):
+            i = df.index.names.index(col)
+            if not isinstance(df.index.levels[i].dtype, pd.CategoricalDtype):
+                df.index = df.index.set_levels(pd.CategoricalIndex(df.index.levels[i]), level=i)
+        return df
+
+    df = pd.concat(dfs, ignore_index=True)
+    for col in ('state', 'unit_id'):
+        if not isinstance(df[col].dtype, pd.CategoricalDtype):
+            df[col] = pd.Categorical(df[col])
+    return df
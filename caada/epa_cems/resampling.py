@@ -0,0 +1,209 @@
+"""
+This module resamples CEMS data to daily or monthly totals per unit, facility, or state.
+
+Rather than using :meth:`pandas.DataFrame.resample` or a groupby on the full dataframe, the grouping keys and time bins
+are converted to integer codes and summed with :func:`numpy.bincount`. Each file (or dataframe) is reduced to one row
+per group and time bin before being combined with the others, so only the reduced data need to be held in memory.
+"""
+
+import numpy as np
+import pandas as pd
+from typing import Optional, Sequence, Union
+
+from . import readers
+from ..caada_logging import logger
+from ..caada_typing import pathseq, strseq
+
+_group_columns = {
+    'unit': ['facility_id', 'unit_id'],
+    'facility': ['facility_id'],
+    'state': ['state'],
+}
+_time_units = {'day': 'D', 'month': 'M'}
+# Numeric columns that identify something rather than measure it, and so should never be summed
+_id_columns = ('state', 'date', 'facility_id', 'unit_id', 'orispl_code', 'unitid', 'op_hour')
+
+
+def resample_cems(data: Union[pd.DataFrame, pathseq], freq: str = 'day', by: str = 'unit',
+                  sum_variables: Optional[strseq] = None, mean_variables: Optional[strseq] = None,
+                  weight_variable: str = 'op_time', input_res: str = 'hour', flat: bool = False) -> pd.DataFrame:
+    """Sum or average CEMS data by day or month for each unit, facility, or state.
+
+    Parameters
+    ----------
+    data
+        Either a dataframe from :func:`~caada.epa_cems.readers.read_cems_file` or
+        :func:`~caada.epa_cems.readers.read_multi_cems_files` (flat or with the multiindex), or a sequence of CEMS
+        files. Files are read and reduced one at a time.
+
+    freq
+        The time bins to resample to, "day" or "month".
+
+    by
+        What to group the data by: "unit" (each facility_id/unit_id pair), "facility", or "state".
+
+    sum_variables
+        Variables to sum in each bin. Default is every numeric variable except `weight_variable`, identifiers such as
+        the facility and unit IDs, and those in `mean_variables`.
+
+    mean_variables
+        Variables to average in each bin, weighted by `weight_variable`. Default is any variable whose name ends in
+        "_rate", since those (e.g. lbs/mmBtu) should not be summed.
+
+    weight_variable
+        The variable used to weight `mean_variables`, normally the fraction of each hour that a unit operated. Its sum
+        is also included in the output. If it is not present, the means are not weighted.
+
+    input_res
+        The time resolution of the input data, "hour" or "day". Determines how the "fraction_present" output is
+        computed.
+
+    flat
+        If `True`, return the grouping variables and date as columns rather than as a multiindex.
+
+    Returns
+    -------
+    pandas.DataFrame
+        A dataframe with one row per group and time bin, indexed by the grouping variables and the start date of each
+        bin. It has one column for each variable summed or averaged (NaN if no values were present in that bin) and:
+
+        * "num_records": the number of rows that went into each bin.
+        * "fraction_present": the fraction of hours (or days, if `input_res` is "day") in the bin with at least one
+          record. Values less than 1 indicate a partially reported period.
+        * `weight_variable` (if present): its sum over the bin, e.g. the total operating hours.
+    """
+    if by not in _group_columns:
+        raise ValueError('Unknown value for by: "{}". Allowed values are {}.'.format(by, ', '.join(_group_columns)))
+    if freq not in _time_units:
+        raise ValueError('Unknown value for freq: "{}". Allowed values are {}.'.format(freq, ', '.join(_time_units)))
+    if input_res not in ('hour', 'day'):
+        raise ValueError('Unknown value for input_res: "{}". Allowed values are "hour", "day".'.format(input_res))
+
+    if isinstance(data, pd.DataFrame):
+        frames = [('the dataframe', data)]
+    else:
+        frames = ((f, readers.read_cems_file(f, flat=True)) for f in data)
+
+    # The variables are chosen from the first frame, and every later frame must have the same ones, so that each partial
+    # has the same columns and _finalize knows which are sums and which are means.
+    sum_vars, mean_vars = None, None
+    partials = []
+    for source, df in frames:
+        if isinstance(df.index, pd.MultiIndex):
+            df = df.reset_index()
+        if sum_vars is None:
+            sum_vars, mean_vars = _default_variables(df, sum_variables, mean_variables, weight_variable)
+        missing = [v for v in sum_vars + mean_vars if v not in df.columns]
+        if len(missing) > 0:
+            raise ValueError('{} does not have the variable(s) to resample: {}'.format(source, ', '.join(missing)))
+        partials.append(_reduce_frame(df, freq=freq, by=by, sum_vars=sum_vars, mean_vars=mean_vars,
+                                      weight_var=weight_variable, input_res=input_res))
+    if len(partials) == 0:
+        raise ValueError('No CEMS data given')
+    logger.debug('Combining {} reduced CEMS frames'.format(len(partials)))
+
+    keys = _group_columns[by] + ['date']
+    combined = pd.concat(partials, ignore_index=True).groupby(keys, observed=True, sort=True).sum()
+    result = _finalize(combined, sum_vars, mean_vars, weight_variable, freq, input_res)
+    return result.reset_index() if flat else result
+
+
+def _default_variables(df: pd.DataFrame, sum_variables: Optional[Sequence[str]], mean_variables: Optional[Sequence[str]],
+                       weight_var: str):
+    if mean_variables is None:
+        mean_variables = [c for c in df.columns if c.endswith('_rate') and pd.api.types.is_numeric_dtype(df[c])]
+    if sum_variables is None:
+        exclude = set(_id_columns).union([weight_var], mean_variables)
+        sum_variables = [c for c in df.columns if c not in exclude and pd.api.types.is_numeric_dtype(df[c])
+                         and not isinstance(df[c].dtype, pd.CategoricalDtype)]
+    return list(sum_variables), list(mean_variables)
+
+
+def _reduce_frame(df, freq, by, sum_vars, mean_vars, weight_var, input_res):
+    """Reduce one dataframe to partial sums for each group and time bin"""
+    key_cols = _group_columns[by]
+
+    # Rows without a group or date would get a -1 code from factorize, which would corrupt the combined key codes
+    missing_key = df[key_cols].isna().any(axis=1).to_numpy() | df['date'].isna().to_numpy()
+    if missing_key.any():
+        logger.warning('{} CEMS rows have no {} or date and will not be included'
+                       .format(np.count_nonzero(missing_key), '/'.join(key_cols)))
+        df = df.loc[~missing_key]
+
+    # Integer code the groups: factorize each key column, then combine their codes into one
+    key_codes = np.zeros(df.shape[0], dtype=np.int64)
+    key_factors = []
+    for col in key_cols:
+        codes, uniques = pd.factorize(df[col])
+        key_codes = key_codes * len(uniques) + codes
+        key_factors.append((col, codes, uniques))
+
+    dates = df['date'].to_numpy()
+    bins = dates.astype('datetime64[{}]'.format(_time_units[freq])).astype(np.int64)
+    bin0 = bins.min() if bins.size > 0 else 0
+    nbins = int(bins.max() - bin0 + 1) if bins.size > 0 else 1
+    group_inds, group_first = _factorize_with_first(key_codes * nbins + (bins - bin0))
+    ngroups = group_first.size
+
+    out = dict()
+    for col, codes, uniques in key_factors:
+        out[col] = uniques.take(codes[group_first])
+    out['date'] = pd.DatetimeIndex(dates[group_first].astype('datetime64[{}]'.format(_time_units[freq]))
+                                   .astype('datetime64[ns]'))
+    out['num_records'] = np.bincount(group_inds, minlength=ngroups)
+
+    # Count the distinct hours (or days) with data in each group/bin
+    periods = dates.astype('datetime64[{}]'.format('h' if input_res == 'hour' else 'D')).astype(np.int64)
+    period0 = periods.min() if periods.size > 0 else 0
+    nperiods = int(periods.max() - period0 + 1) if periods.size > 0 else 1
+    unique_periods = np.unique(group_inds.astype(np.int64) * nperiods + (periods - period0))
+    out['periods_present'] = np.bincount(unique_periods // nperiods, minlength=ngroups)
+
+    if weight_var in df.columns:
+        weights = df[weight_var].to_numpy(dtype=np.float64, na_value=np.nan)
+        weights = np.where(np.isnan(weights), 0.0, weights)
+        out[weight_var] = np.bincount(group_inds, weights=weights, minlength=ngroups)
+    else:
+        weights = np.ones(df.shape[0])
+
+    for var in sum_vars + mean_vars:
+        vals = df[var].to_numpy(dtype=np.float64, na_value=np.nan)
+        good = ~np.isnan(vals)
+        out['{}__n'.format(var)] = np.bincount(group_inds[good], minlength=ngroups)
+        if var in mean_vars:
+            out['{}__wsum'.format(var)] = np.bincount(group_inds[good], weights=vals[good] * weights[good], minlength=ngroups)
+            out['{}__w'.format(var)] = np.bincount(group_inds[good], weights=weights[good], minlength=ngroups)
+        else:
+            out['{}__sum'.format(var)] = np.bincount(group_inds[good], weights=vals[good], minlength=ngroups)
+
+    return pd.DataFrame(out)
+
+
+def _factorize_with_first(codes):
+    """Renumber integer codes to 0..n-1, returning the new codes and the index of the first occurrence of each"""
+    uniques, first, inverse = np.unique(codes, return_index=True, return_inverse=True)
+    return inverse.ravel(), first
+
+
+def _finalize(combined, sum_vars, mean_vars, weight_var, freq, input_res):
+    result = pd.DataFrame(index=combined.index)
+    for var in sum_vars:
+        n = combined['{}__n'.format(var)].to_numpy()
+        result[var] = np.where(n > 0, combined['{}__sum'.format(var)].to_numpy(), np.nan)
+    for var in mean_vars:
+        w = combined['{}__w'.format(var)].to_numpy()
+        with np.errstate(invalid='ignore', divide='ignore'):
+            result[var] = np.where(w > 0, combined['{}__wsum'.format(var)].to_numpy() / w, np.nan)
+    if weight_var in combined.columns:
+        result[weight_var] = combined[weight_var]
+    result['num_records'] = combined['num_records']
+
+    bin_starts = combined.index.get_level_values('date')
+    if freq == 'day':
+        expected = np.ones(bin_starts.size)
+    else:
+        expected = bin_starts.days_in_month.to_numpy().astype(np.float64)
+    if input_res == 'hour':
+        expected = expected * 24
+    result['fraction_present'] = combined['periods_present'].to_numpy() / expected
+    return result
@@ -0,0 +1,152 @@
+"""
+This module converts CEMS .csv files into a Parquet dataset partitioned by state and month, and queries that dataset.
+Queries only read the partitions and columns they need, so are much faster than parsing the .csv files again.
+
+This requires the optional `pyarrow` package, which is installed with the "store" extra (``pip install CAADA[store]``).
+"""
+
+import glob
+import pandas as pd
+from pathlib import Path
+import re
+from typing import Optional, Sequence
+
+try:
+    import pyarrow as pa
+    import pyarrow.dataset as pads
+except ImportError:
+    pa = None
+    pads = None
+
+from . import readers
+from ..caada_logging import logger
+from ..caada_typing import datetimelike, pathlike, pathseq, strseq
+
+_partition_columns = ('state', 'year_month')
+
+
+def build_cems_store(cems_files: pathseq, store_dir: pathlike):
+    """Add CEMS files to a partitioned Parquet dataset.
+
+    The data are stored in the layout :file:`{store_dir}/state={XX}/year_month={YYYY-MM}/`, one Parquet file per input
+    file per partition. Each input file's Parquet files are named after it, so adding the same (or an updated) file
+    again replaces the earlier copy (in every partition) rather than duplicating it.
+
+    Parameters
+    ----------
+    cems_files
+        Paths to the CEMS .csv files (or the .zip files containing them) to add.
+
+    store_dir
+        The root directory of the dataset. Will be created if needed.
+
+    Returns
+    -------
+    None
+    """
+    _check_pyarrow()
+    store_dir = Path(store_dir)
+    for i, f in enumerate(cems_files, start=1):
+        logger.info('Adding {} to {} ({} of {})'.format(f, store_dir, i, len(cems_files)))
+        df = readers.read_cems_file(f, flat=True)
+        df['state'] = df['state'].astype(str).str.upper()
+        df['year_month'] = df['date'].dt.strftime('%Y-%m')
+        table = pa.Table.from_pandas(df, preserve_index=False)
+        basename = Path(f).name.split('.')[0]
+        _remove_existing_parts(store_dir, basename)
+        pads.write_dataset(table, store_dir, format='parquet', partitioning=list(_partition_columns),
+                           partitioning_flavor='hive', existing_data_behavior='overwrite_or_ignore',
+                           basename_template='{}-{{i}}.parquet'.format(basename))
+
+
+def query_cems_store(store_dir: pathlike, states: Optional[strseq] = None, facilities: Optional[Sequence[int]] = None,
+                     start_date: Optional[datetimelike] = None, stop_date: Optional[datetimelike] = None,
+                     columns: Optional[strseq] = None, flat: bool = False) -> pd.DataFrame:
+    """Read CEMS data from a dataset created by :func:`build_cems_store`.
+
+    Parameters
+    ----------
+    store_dir
+        The root directory of the dataset.
+
+    states
+        If given, only read data for these states (two letter abbreviations, case insensitive).
+
+    facilities
+        If given, only read data for these facility IDs.
+
+    start_date, stop_date
+        If given, only read data on or after `start_date` and before `stop_date` (i.e. `stop_date` is exclusive, as
+        for :func:`~caada.epa_cems.readers.read_cems_file`).
+
+    columns
+        If given, only read these data columns (named as :func:`~caada.epa_cems.readers.read_cems_file` returns them,
+        e.g. "so2_mass"). The state, date, facility_id, and unit_id are always read.
+
+    flat
+        Whether to return the state, date, facility_id, and unit_id as columns instead of a multiindex, as in
+        :func:`~caada.epa_cems.readers.read_cems_file`.
+
+    Returns
+    -------
+    pandas.DataFrame
+        The data matching all of the filters, in the same form as :func:`~caada.epa_cems.readers.read_cems_file`.
+    """
+    _check_pyarrow()
+    dataset = pads.dataset(store_dir, format='parquet', partitioning='hive')
+
+    # Filters on the partition columns let pyarrow skip whole directories; the others are applied per row group.
+    filters = []
+    if states is not None:
+        filters.append(pads.field('state').isin([s.upper() for s in states]))
+    if start_date is not None:
+        start_date = pd.Timestamp(start_date)
+        filters.append(pads.field('year_month') >= start_date.strftime('%Y-%m'))
+        filters.append(pads.field('date') >= pa.scalar(start_date.to_pydatetime()))
+    if stop_date is not None:
+        stop_date = pd.Timestamp(stop_date)
+        filters.append(pads.field('year_month') <= stop_date.strftime('%Y-%m'))
+        filters.append(pads.field('date') < pa.scalar(stop_date.to_pydatetime()))
+    if facilities is not None:
+        filters.append(pads.field('facility_id').isin(list(facilities)))
+
+    filter_expr = None
+    for expr in filters:
+        filter_expr = expr if filter_expr is None else filter_expr & expr
+
+    index_columns = ['state', 'date', 'facility_id', 'unit_id']
+    if columns is not None:
+        columns = index_columns + [c for c in columns if c not in index_columns]
+    else:
+        columns = [c for c in dataset.schema.names if c != 'year_month']
+
+    df = dataset.to_table(columns=columns, filter=filter_expr).to_pandas()
+    for col in ('state', 'unit_id'):
+        df[col] = df[col].astype('category')
+    if flat:
+        return df
+    else:
+        return df.set_index(index_columns)
+
+
+def _remove_existing_parts(store_dir: Path, basename: str):
+    """Delete the Parquet files written for an input file by an earlier call to :func:`build_cems_store`.
+
+    Writing only replaces parts with the same name in the same partitions, so if the new version of the file covers
+    fewer partitions, or is split into fewer parts, the old data would otherwise be left behind and duplicated.
+    """
+    part_re = re.compile(r'{}-\d+\.parquet$'.format(re.escape(basename)))
+    n_removed = 0
+    for part_file in store_dir.glob('*/*/{}-*.parquet'.format(glob.escape(basename))):
+        if part_re.match(part_file.name):
+            part_file.unlink()
+            n_removed += 1
+    if n_removed > 0:
+        logger.debug('Removed {} existing Parquet files for {}'.format(n_removed, basename))
+
+
+def _check_pyarrow():
+    if pa is None:
+        raise ImportError('The pyarrow package is required to use the CEMS Parquet store. Install CAADA with the '
+                          '"store" extra (pip install CAADA[store]) or install pyarrow directly.')
+
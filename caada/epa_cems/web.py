@@ -1,14 +1,27 @@
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
 import ftplib
+import hashlib
+import json
 import os
 import pandas as pd
 from pathlib import Path
+import queue
 import re
+import threading
+import time
+from typing import Dict, List, Optional
 from zipfile import ZipFile
 
+from .readers import cems_zip_members
 from ..common_ancillary import conus_states
 from ..caada_logging import logger
 from ..caada_typing import datetimelike, pathlike
 
+_default_listing_cache_dir = Path(__file__).parent / 'cache'
+_hourly_file_re = re.compile(r'(\d{4})([a-z]{2})(\d{2})', re.IGNORECASE)
+_daily_file_re = re.compile(r'(\d{4})([a-z]{2})(Q\d)')
+
 
 class EPAFTP(ftplib.FTP):
     """Class that manages a connection to the EPA FTP server.
@@ -23,7 +36,8 @@ class EPAFTP(ftplib.FTP):
 
     This is encouraged because it ensures that the FTP connection is closed whether or not an error occurs.
     """
-    def __init__(self, url: str = 'newftp.epa.gov', *args, **kwargs):
+    def __init__(self, url: str = 'newftp.epa.gov', *args, port: Optional[int] = None,
+                 listing_ttl: float = 86400, listing_cache_dir: Optional[pathlike] = None, **kwargs):
         """Instantiate a connection to the EPA FTP server
 
         Parameters
@@ -31,15 +45,36 @@ class EPAFTP(ftplib.FTP):
         url
             The URL of the FTP server. Should not need changed.
 
+        port
+            The port to connect to. If not given, the standard FTP port is used. Should not need changed.
+
+        listing_ttl
+            How long, in seconds, a cached listing of a directory on the server may be used before it is requested
+            again. Set to 0 to always request a new listing. Default is one day.
+
+        listing_cache_dir
+            Directory in which to cache directory listings. If not given, a "cache" directory in the
+            :mod:`caada.epa_cems` package directory is used.
+
         args, kwargs
             Additional positional and keyword arguments are passed through to :class:`ftplib.FTP`. No additional
             arguments should be required.
         """
-        super(EPAFTP, self).__init__(url, *args, **kwargs)
+        if port is None:
+            super(EPAFTP, self).__init__(url, *args, **kwargs)
+        else:
+            super(EPAFTP, self).__init__('', *args, **kwargs)
+            self.connect(url, port)
         self.login()
+        self._current_dir = None
+        self._listing_cache = _ListingCache(
+            _default_listing_cache_dir if listing_cache_dir is None else listing_cache_dir,
+            server='{}:{}'.format(self.host, self.port), ttl=listing_ttl
+        )
+        self._listed_info = dict()
 
     def download(self, time_res: str, start_time: datetimelike, stop_time: datetimelike, save_dir: pathlike,
-                 states: str = 'all', unzip: bool = True, delete_zip: bool = True):
+                 states: str = 'all', unzip: bool = True, delete_zip: bool = True, force: bool = False):
         """Download a collection of EPA CEMS files.
 
         Parameters
@@ -60,12 +95,19 @@ class EPAFTP(ftplib.FTP):
             e.g. `("ca", "or", "wa")`.
 
         unzip
-            Whether to unzip the .zip files after downloading.
+            Whether to unzip the .zip files after downloading. :func:`~caada.epa_cems.readers.read_cems_file` can read
+            the .zip files directly, so this is not necessary to use the data and keeping only the .zip files takes much
+            less disk space.
 
         delete_zip
             Whether to delete the .zip files after extracting the contained .csv file. Has no effect if `unzip` is
             `False`.
 
+        force
+            By default, files that were already downloaded (and unzipped, if `unzip` is `True`) and have not changed on
+            the server are skipped, and partially downloaded files are resumed. Set this to `True` to download every
+            file from scratch.
+
         Notes
         -----
         Time filtering is done based on the start time of each file. Since the hourly data is organized into monthly
@@ -73,63 +115,287 @@ class EPAFTP(ftplib.FTP):
         download the April 2020 hourly file or Q2 daily file (because April 1, 2020 is the start date for both files),
         however it will *not* download the March 2020 hourly or Q1 2020 daily file, even though the first part of the
         date range overlaps those files.
+
+        To tell whether a file has already been downloaded, its size and modification time on the server are compared
+        against the local .zip file. Since the .zip files may be deleted after unzipping, a manifest file
+        (:file:`.cems_manifest.json`) in `save_dir` records the size and modification time of each .zip file that was
+        unzipped and the .csv files it contained.
+        """
+        save_dir = self._check_save_dir(save_dir)
+        files = self.file_list(time_res, start_time, stop_time, states)
+        manifest = _DownloadManifest(save_dir)
+
+        for dir_url, fnames in files.items():
+            logger.info('Downloading {} files from {}'.format(len(fnames), dir_url))
+            for f in fnames:
+                info = self._sync_file(dir_url, f, save_dir, manifest=manifest, unzip=unzip, force=force,
+                                       remote_info=self.listed_file_info(dir_url, f))
+                if unzip and info is not None:
+                    members = self._unzip_file(save_dir / f, delete_zip=delete_zip)
+                    manifest.record(f, info, members)
+
+    def file_list(self, time_res: str, start_time: datetimelike, stop_time: datetimelike,
+                  states: str = 'all') -> Dict[str, List[str]]:
+        """List the CEMS files on the server for a given time period and states.
+
+        Parameters
+        ----------
+        time_res, start_time, stop_time, states
+            See :meth:`download`.
+
+        Returns
+        -------
+        dict
+            A dictionary with FTP directories as keys and lists of file names in that directory as values.
+
+        Notes
+        -----
+        Directory listings are cached on disk (see the `listing_ttl` and `listing_cache_dir` arguments to
+        :class:`EPAFTP`). Where the server supports it, the listings include the size and modification time of each
+        file, which can be retrieved with :meth:`listed_file_info`.
         """
-        save_dir = Path(save_dir)
         start_time = pd.Timestamp(start_time)
         stop_time = pd.Timestamp(stop_time)
 
-        if not save_dir.is_dir():
-            raise IOError('Save directory ({}) either does not exist or is a file.'.format(save_dir))
-
         if time_res == 'hourly':
-            files = self._hourly_file_list(start_time, stop_time, states)
+            return self._hourly_file_list(start_time, stop_time, states)
         elif time_res == 'daily':
-            files = self._daily_file_list(start_time, stop_time, states)
+            return self._daily_file_list(start_time, stop_time, states)
         else:
             raise ValueError('Unknown option for time_res: "{}". Allowed values are "hourly", "daily".')
 
-        for dir_url, fnames in files.items():
-            logger.info('Downloading {} files from {}'.format(len(fnames), dir_url))
+    def retrieve_file(self, dir_url: str, fname: str, save_dir: pathlike, remote_info: Optional[dict] = None,
+                      force: bool = False) -> bool:
+        """Download a single file from the server, unless an up-to-date copy already exists.
+
+        The file is first downloaded to a ".part" file, which is renamed once the download is complete. If a ".part"
+        file already exists (e.g. because an earlier download was interrupted), the download is resumed from the end
+        of it, provided the file on the server has not been modified since the partial download was started (the
+        server's modification time is recorded in a ".part.mtime" file for this purpose); otherwise the download
+        starts over. Once downloaded, the local file's modification time is set to match the server's.
+
+        Parameters
+        ----------
+        dir_url
+            The FTP directory containing the file.
+
+        fname
+            The name of the file within `dir_url`.
+
+        save_dir
+            The local directory to save the file to.
+
+        remote_info
+            A dictionary with the "size" (in bytes) and "mtime" (as a POSIX timestamp) of the file on the server. If not
+            given, these are requested from the server. Either may be `None` if unknown.
+
+        force
+            If `True`, always download the whole file, even if a complete or partial local copy exists.
+
+        Returns
+        -------
+        bool
+            `True` if the file was downloaded, `False` if the existing local copy was up-to-date.
+        """
+        if remote_info is None:
+            remote_info = self.remote_file_info(dir_url, fname)
+        remote_size, remote_mtime = remote_info['size'], remote_info['mtime']
+
+        local_file = Path(save_dir) / fname
+        part_file = Path(save_dir) / (fname + '.part')
+        if not force and local_file.exists() and _local_file_matches(local_file, remote_size, remote_mtime):
+            logger.debug('{} is up to date, skipping'.format(local_file))
+            return False
+
+        # The remote modification time that the partial download was started from is stored alongside it, so that a
+        # partial download of an older version of the file is not resumed with bytes from the newer one.
+        part_mtime_file = Path(save_dir) / (fname + '.part.mtime')
+        offset = 0
+        if not force and part_file.exists() and remote_size is not None and part_file.stat().st_size < remote_size:
+            if remote_mtime is not None and _read_part_mtime(part_mtime_file) == remote_mtime:
+                offset = part_file.stat().st_size
+            else:
+                logger.debug('{} does not match the current version of {} on the server, restarting download'
+                             .format(part_file, fname))
+        if offset == 0:
+            _write_part_mtime(part_mtime_file, remote_mtime)
+
+        if dir_url != self._current_dir:
             self.cwd(dir_url)
-            for f in fnames:
-                cmd = 'RETR {}'.format(f)
-                logger.debug('Downloading {} (command is {})'.format(f, cmd))
-                with open(save_dir / f, 'wb') as wobj:
-                    self.retrbinary(cmd, wobj.write)
-                if unzip:
-                    self._unzip_file(save_dir / f, delete_zip=delete_zip)
+            self._current_dir = dir_url
+        cmd = 'RETR {}'.format(fname)
+        if offset > 0:
+            logger.debug('Resuming {} from byte {} (command is {})'.format(fname, offset, cmd))
+            with open(part_file, 'ab') as wobj:
+                self.retrbinary(cmd, wobj.write, rest=offset)
+        else:
+            logger.debug('Downloading {} (command is {})'.format(fname, cmd))
+            with open(part_file, 'wb') as wobj:
+                self.retrbinary(cmd, wobj.write)
+
+        if remote_size is not None and part_file.stat().st_size != remote_size:
+            raise _SizeMismatchError('Downloaded size of {} ({} bytes) does not match the size on the server ({} bytes)'
+                          .format(fname, part_file.stat().st_size, remote_size))
+        os.replace(part_file, local_file)
+        if part_mtime_file.exists():
+            part_mtime_file.unlink()
+        if remote_mtime is not None:
+            os.utime(local_file, (remote_mtime, remote_mtime))
+        return True
+
+    def remote_file_info(self, dir_url: str, fname: str) -> dict:
+        """Get the size and modification time of a file on the server.
+
+        Parameters
+        ----------
+        dir_url
+            The FTP directory containing the file.
+
+        fname
+            The name of the file within `dir_url`.
+
+        Returns
+        -------
+        dict
+            A dictionary with keys "size" (in bytes) and "mtime" (as a POSIX timestamp). Either will be `None` if the
+            server does not support the SIZE or MDTM commands.
+        """
+        if dir_url != self._current_dir:
+            self.cwd(dir_url)
+            self._current_dir = dir_url
+
+        # SIZE is often refused in ASCII mode, so switch to binary first
+        self.voidcmd('TYPE I')
+        try:
+            size = self.size(fname)
+        except ftplib.error_perm:
+            size = None
+
+        try:
+            mtime = _parse_ftp_time(self.sendcmd('MDTM {}'.format(fname)).split()[-1])
+        except ftplib.error_perm:
+            mtime = None
+
+        return {'size': size, 'mtime': mtime}
+
+    def list_dir(self, dir_url: str) -> List[dict]:
+        """List the files in a directory on the server, using the cached listing if it is current.
+
+        The listing is requested with the MLSD command so that file sizes and modification times are included. If the
+        server does not support MLSD, NLST is used instead and the sizes and modification times will be `None`.
+
+        Parameters
+        ----------
+        dir_url
+            The FTP directory to list.
+
+        Returns
+        -------
+        list
+            A list of dictionaries with keys "name", "size", and "mtime" (as a POSIX timestamp), one per file.
+        """
+        entries = self._listing_cache.load(dir_url)
+        if entries is None:
+            logger.debug('Listing remote directory {}'.format(dir_url))
+            try:
+                entries = [{'name': name, 'size': int(facts['size']) if 'size' in facts else None,
+                            'mtime': _parse_ftp_time(facts['modify']) if 'modify' in facts else None}
+                           for name, facts in self.mlsd(dir_url, facts=['type', 'size', 'modify'])
+                           if facts.get('type', 'file') == 'file']
+            except ftplib.error_perm as err:
+                logger.debug('MLSD failed ({}), falling back on NLST'.format(err))
+                entries = [{'name': f.split('/')[-1], 'size': None, 'mtime': None} for f in self.nlst(dir_url)]
+            self._listing_cache.save(dir_url, entries)
+        else:
+            logger.debug('Using cached listing of remote directory {}'.format(dir_url))
+
+        for e in entries:
+            self._listed_info[(dir_url, e['name'])] = {'size': e['size'], 'mtime': e['mtime']}
+        return entries
+
+    def listed_file_info(self, dir_url: str, fname: str) -> Optional[dict]:
+        """Get the size and modification time of a file from the last listing of its directory.
+
+        Parameters
+        ----------
+        dir_url
+            The FTP directory containing the file.
+
+        fname
+            The name of the file within `dir_url`.
+
+        Returns
+        -------
+        Optional[dict]
+            A dictionary with the same keys as :meth:`remote_file_info`, or `None` if the directory has not been listed
+            by :meth:`list_dir` (or :meth:`file_list`) or the listing did not include the size and modification time.
+        """
+        info = self._listed_info.get((dir_url, fname))
+        if info is None or info['size'] is None or info['mtime'] is None:
+            return None
+        return info
+
+    def _sync_file(self, dir_url, fname, save_dir, manifest, unzip, force=False, remote_info=None):
+        """Download a file if needed. Returns the remote file info if the file needs unzipped, `None` otherwise.
+
+        If `remote_info` came from a cached directory listing, it may be out of date. In that case, a download whose
+        size does not match the listing is retried once with the size and modification time queried directly from the
+        server, and the cached listing for the directory is discarded. `manifest` is only used if `unzip` is `True`,
+        and may be `None` otherwise.
+        """
+        info = self.remote_file_info(dir_url, fname) if remote_info is None else remote_info
+        if unzip and not force and manifest.is_current(fname, info):
+            logger.debug('{} already downloaded and unzipped, skipping'.format(fname))
+            return None
+
+        try:
+            self.retrieve_file(dir_url, fname, save_dir, remote_info=info, force=force)
+        except _SizeMismatchError as err:
+            if remote_info is None:
+                raise
+            logger.info('{}; the directory listing may be out of date, retrying with current file info'.format(err))
+            self._listing_cache.invalidate(dir_url)
+            info = self.remote_file_info(dir_url, fname)
+            self._listed_info[(dir_url, fname)] = info
+            if unzip and not force and manifest.is_current(fname, info):
+                return None
+            self.retrieve_file(dir_url, fname, save_dir, remote_info=info, force=force)
+        return info
+
+    def cwd(self, dirname):
+        self._current_dir = None
+        return super(EPAFTP, self).cwd(dirname)
+
+    @staticmethod
+    def _check_save_dir(save_dir):
+        save_dir = Path(save_dir)
+        if not save_dir.is_dir():
+            raise IOError('Save directory ({}) either does not exist or is a file.'.format(save_dir))
+        return save_dir
 
     def _hourly_file_list(self, start_time, stop_time, states='all'):
         url = '/DMDnLoad/emissions/hourly/monthly/'
-        all_files = []
-        for year in range(start_time.year, stop_time.year+1):
-            self.cwd('{}{}'.format(url, year))
-            all_files += self.nlst()
-
         file_info = []
-        for f in all_files:
-            fname = f.split('/')[-1]
-            m = re.search(r'(\d{4})([a-z]{2})(\d{2})', fname, re.IGNORECASE)
-            year, month, state = int(m.group(1)), int(m.group(3)), m.group(2)
-            file_info.append({'name': fname, 'date': pd.Timestamp(year, month, 1), 'state': state.lower()})
+        for year in range(start_time.year, stop_time.year+1):
+            for entry in self.list_dir('{}{}'.format(url, year)):
+                m = _hourly_file_re.search(entry['name'])
+                if m is None:
+                    continue
+                year, month, state = int(m.group(1)), int(m.group(3)), m.group(2)
+                file_info.append({'name': entry['name'], 'date': pd.Timestamp(year, month, 1), 'state': state.lower()})
 
         return self._filter_files(url, file_info, start_time, stop_time, states)
 
     def _daily_file_list(self, start_time, stop_time, states='all'):
         url = '/DMDnLoad/emissions/daily/quarterly/'
-        all_files = []
-        for year in range(start_time.year, stop_time.year+1):
-            dir_url = '{}{}'.format(url, year)
-            logger.debug('Changing remote directory to {}'.format(dir_url))
-            self.cwd(dir_url)
-            all_files += self.nlst()
-
         file_info = []
-        for f in all_files:
-            fname = f.split('/')[-1]
-            m = re.search(r'(\d{4})([a-z]{2})(Q\d)', fname)
-            year, quarter, state = int(m.group(1)), m.group(3), m.group(2)
-            file_info.append({'name': fname, 'date': self._q_to_date(year, quarter), 'state': state.lower()})
+        for year in range(start_time.year, stop_time.year+1):
+            for entry in self.list_dir('{}{}'.format(url, year)):
+                m = _daily_file_re.search(entry['name'])
+                if m is None:
+                    continue
+                year, quarter, state = int(m.group(1)), m.group(3), m.group(2)
+                file_info.append({'name': entry['name'], 'date': self._q_to_date(year, quarter), 'state': state.lower()})
 
         return self._filter_files(url, file_info, start_time, stop_time, states)
 
@@ -170,26 +436,221 @@ class EPAFTP(ftplib.FTP):
     @staticmethod
     def _unzip_file(zip_path: Path, delete_zip):
         logger.debug('Decompressing {}'.format(zip_path))
+        members = []
         with ZipFile(zip_path) as z:
-            for mem in z.infolist():
-                if os.sep in mem.filename:
-                    raise IOError('A member of {} contains path separators. This is unexpected and potentially unsafe.'.format(zip_path))
+            for mem in cems_zip_members(z, zip_path):
                 out_path = z.extract(mem, path=zip_path.parent)
+                members.append(mem.filename)
                 logger.debug('Created {}'.format(out_path))
 
         if delete_zip:
             os.remove(zip_path)
             logger.debug('Deleted {}'.format(zip_path))
+        return members
+
+
+class _SizeMismatchError(IOError):
+    """Raised when a downloaded file's size does not match the size expected from the server"""
+    pass
+
+
+class _DownloadManifest:
+    """Record of which downloaded .zip files have been unzipped, stored as JSON in the download directory.
+
+    Used by :meth:`EPAFTP.download` to skip files that were already downloaded and unzipped, even if the .zip file
+    has since been deleted. Safe to share between threads.
+    """
+    def __init__(self, save_dir: Path, name: str = '.cems_manifest.json'):
+        self.save_dir = Path(save_dir)
+        self.manifest_file = self.save_dir / name
+        self._lock = threading.Lock()
+        if self.manifest_file.exists():
+            with open(self.manifest_file) as robj:
+                self._entries = json.load(robj)
+        else:
+            self._entries = dict()
+
+    def is_current(self, zip_name: str, remote_info: dict) -> bool:
+        with self._lock:
+            entry = self._entries.get(zip_name)
+        if entry is None or remote_info['size'] is None or remote_info['mtime'] is None:
+            return False
+        elif entry['size'] != remote_info['size'] or abs(entry['mtime'] - remote_info['mtime']) > 1:
+            return False
+        else:
+            return all((self.save_dir / m).exists() for m in entry['members'])
+
+    def record(self, zip_name: str, remote_info: dict, members: List[str]):
+        with self._lock:
+            self._entries[zip_name] = {'size': remote_info['size'], 'mtime': remote_info['mtime'], 'members': members}
+            tmp_file = self.manifest_file.with_name(self.manifest_file.name + '.tmp')
+            with open(tmp_file, 'w') as wobj:
+                json.dump(self._entries, wobj, indent=1)
+            os.replace(tmp_file, self.manifest_file)
+
+
+class _ListingCache:
+    """On-disk cache of FTP directory listings, with one JSON file per server and directory.
+
+    Listings older than `ttl` seconds are treated as missing. The cache directory is only created when the first
+    listing is saved.
+    """
+    def __init__(self, cache_dir: pathlike, server: str, ttl: float):
+        self.cache_dir = Path(cache_dir)
+        self.server = server
+        self.ttl = ttl
+
+    def load(self, dir_url: str) -> Optional[List[dict]]:
+        if self.ttl <= 0:
+            return None
+        cache_file = self._cache_file(dir_url)
+        try:
+            with open(cache_file) as robj:
+                cached = json.load(robj)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as err:
+            logger.warning('Could not read cached listing {} ({}), will list the directory again'.format(cache_file, err))
+            return None
+
+        if cached.get('server') != self.server or cached.get('dir') != dir_url:
+            return None
+        elif time.time() - cached['time'] > self.ttl:
+            return None
+        return cached['entries']
+
+    def save(self, dir_url: str, entries: List[dict]):
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        cache_file = self._cache_file(dir_url)
+        tmp_file = cache_file.with_name('{}.{}.tmp'.format(cache_file.name, threading.get_ident()))
+        with open(tmp_file, 'w') as wobj:
+            json.dump({'server': self.server, 'dir': dir_url, 'time': time.time(), 'entries': entries}, wobj)
+        os.replace(tmp_file, cache_file)
+
+    def invalidate(self, dir_url: str):
+        cache_file = self._cache_file(dir_url)
+        if cache_file.exists():
+            cache_file.unlink()
+
+    def _cache_file(self, dir_url):
+        key = hashlib.sha1('{}{}'.format(self.server, dir_url).encode('utf8')).hexdigest()[:16]
+        return self.cache_dir / 'listing_{}.json'.format(key)
+
+
+def _parse_ftp_time(timestr: str) -> float:
+    """Convert a YYYYMMDDhhmmss[.sss] time from an FTP MDTM or MLSD response (always UTC) to a POSIX timestamp"""
+    return pd.Timestamp(datetime.strptime(timestr.split('.')[0], '%Y%m%d%H%M%S')).tz_localize('UTC').timestamp()
+
+
+def _read_part_mtime(mtime_file: Path) -> Optional[float]:
+    """Read the remote modification time recorded for a partial download, or `None` if there isn't one"""
+    try:
+        with open(mtime_file) as robj:
+            return float(robj.read().strip())
+    except (OSError, ValueError):
+        return None
+
+
+def _write_part_mtime(mtime_file: Path, remote_mtime: Optional[float]):
+    """Record the remote modification time a partial download was started from, or clear it if unknown"""
+    if remote_mtime is None:
+        if mtime_file.exists():
+            mtime_file.unlink()
+    else:
+        with open(mtime_file, 'w') as wobj:
+            wobj.write(repr(float(remote_mtime)))
+
+
+def _local_file_matches(local_file: Path, remote_size: Optional[int], remote_mtime: Optional[float]) -> bool:
+    st = local_file.stat()
+    if remote_size is None or st.st_size != remote_size:
+        return False
+    return remote_mtime is None or abs(st.st_mtime - remote_mtime) <= 1
+
+
+def download_concurrently(time_res: str, start_time: datetimelike, stop_time: datetimelike, save_dir: pathlike,
+                          states: str = 'all', unzip: bool = True, delete_zip: bool = True, force: bool = False,
+                          connections: int = 4, ftp_kws: Optional[dict] = None):
+    """Download a collection of EPA CEMS files over several simultaneous FTP connections.
+
+    This opens `connections` separate :class:`EPAFTP` sessions, each of which takes the next file to download from a
+    shared list until all are downloaded. Downloaded files are unzipped by a separate worker thread, so that
+    decompressing one file does not hold up downloading the next.
+
+    Parameters
+    ----------
+    time_res, start_time, stop_time, save_dir, states, unzip, delete_zip, force
+        See :meth:`EPAFTP.download`. As with that method, up-to-date files are skipped and partial downloads resumed
+        unless `force` is `True`.
+
+    connections
+        How many FTP connections to open at once.
+
+    ftp_kws
+        Keyword arguments to pass to :class:`EPAFTP` when creating each connection, e.g. to use a different server.
+
+    Returns
+    -------
+    None
+    """
+    ftp_kws = dict() if ftp_kws is None else ftp_kws
+    save_dir = EPAFTP._check_save_dir(save_dir)
+    with EPAFTP(**ftp_kws) as ftp:
+        files = ftp.file_list(time_res, start_time, stop_time, states)
+        file_queue = queue.Queue()
+        for dir_url, fnames in files.items():
+            for f in fnames:
+                file_queue.put((dir_url, f, ftp.listed_file_info(dir_url, f)))
+    nfiles = file_queue.qsize()
+    logger.info('Downloading {} files over {} connections'.format(nfiles, connections))
+
+    manifest = _DownloadManifest(save_dir)
+    unzip_futures = []
+    unzip_lock = threading.Lock()
+
+    def unzip_worker(fname, info):
+        members = EPAFTP._unzip_file(save_dir / fname, delete_zip)
+        manifest.record(fname, info, members)
+
+    def download_worker(unzipper):
+        with EPAFTP(**ftp_kws) as worker_ftp:
+            while True:
+                try:
+                    dir_url, fname, listed_info = file_queue.get_nowait()
+                except queue.Empty:
+                    return
+                info = worker_ftp._sync_file(dir_url, fname, save_dir, manifest=manifest, unzip=unzip, force=force,
+                                             remote_info=listed_info)
+                if unzip and info is not None:
+                    with unzip_lock:
+                        unzip_futures.append(unzipper.submit(unzip_worker, fname, info))
+
+    with ThreadPoolExecutor(max_workers=1) as unzipper:
+        with ThreadPoolExecutor(max_workers=connections) as downloaders:
+            download_futures = [downloaders.submit(download_worker, unzipper) for _ in range(min(connections, nfiles))]
+            for fut in download_futures:
+                fut.result()
+        for fut in unzip_futures:
+            fut.result()
 
 
 def download_cl_driver(time_res: str, start_time: datetimelike, stop_time: datetimelike,
-                       save_dir: str = '.', unzip: bool = True, delete_zip: bool = True):
+                       save_dir: str = '.', unzip: bool = True, delete_zip: bool = True, force: bool = False,
+                       connections: int = 1, listing_ttl: float = 86400):
     """Download EPA continuous emissions monitoring system data via FTP
 
-    Creates a default :class:`EPAFTP` connection and downloads CEMS data. All arguments correspond to those for
-    :meth:`EPAFTP.download`.
+    Creates a default :class:`EPAFTP` connection and downloads CEMS data. All arguments except `connections` and
+    `listing_ttl` correspond to those for :meth:`EPAFTP.download`. If `connections` is greater than 1, then
+    :func:`download_concurrently` is used to download over that many connections at once. `listing_ttl` is passed to
+    :class:`EPAFTP`.
 
     """
-    with EPAFTP() as ftp:
+    if connections > 1:
+        download_concurrently(time_res=time_res, start_time=start_time, stop_time=stop_time, save_dir=save_dir,
+                              unzip=unzip, delete_zip=delete_zip, force=force, connections=connections,
+                              ftp_kws={'listing_ttl': listing_ttl})
+        return
+
+    with EPAFTP(listing_ttl=listing_ttl) as ftp:
         ftp.download(time_res=time_res, start_time=start_time, stop_time=stop_time, save_dir=save_dir,
-                     unzip=unzip, delete_zip=delete_zip)
+                     unzip=unzip, delete_zip=delete_zip, force=force)
@@ -1,8 +1,7 @@
 from pathlib import Path
 _my_dir = Path(__file__).parent
+# Created when something is first downloaded into it, not on import
 _cache_dir = _my_dir / 'cache'
-if not _cache_dir.exists():
-    _cache_dir.mkdir()
 
 airport_code_sources = {'openflights': dict(local=_cache_dir / 'openflights_airport_codes.csv', remote='https://raw.githubusercontent.com/jpatokal/openflights/master/data/airports.dat')}
 # Other possible sources:
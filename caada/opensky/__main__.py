@@ -1,10 +1,36 @@
 from argparse import ArgumentParser
-from .agglomeration import summarize_and_merge_covid_files
+from ..caada_cli import LazyDriver
 
 
 def parse_opensky_covid_agg_args(p: ArgumentParser):
     p.description = "Agglomerate the OpenSky-derived datasets from Strohmeier et al. 2020 (doi: 10.5194/essd-2020-223) " \
                     "into netCDF files summed by day."
+    p.add_argument('savename', help='Name to give the output netCDF file. If --update is given, this should be an '
+                                    'existing file to add new days to.')
+    p.add_argument('filenames', nargs='+', help='Paths .csv files from Strohmeier et al. to agglomerate. Gzipped '
+                                                '.csv files may be given directly.')
+    p.add_argument('-n', '--chunk-size', type=int, dest='chunksize',
+                   help='Read each .csv file this many rows at a time instead of loading the whole file at once. '
+                        'Use this to limit memory usage for large files; the output is the same.')
+    p.add_argument('-c', '--cache-dir', help='Directory in which to cache the summary of each .csv file. On later runs '
+                                             'with the same cache directory, files that have not changed are not '
+                                             're-read.')
+    p.add_argument('-u', '--update', action='store_true',
+                   help='Add the days from the given .csv files to SAVENAME (replacing any days already in it) rather '
+                        'than overwriting it.')
+    p.add_argument('-d', '--day-basis', choices=('utc', 'local'), default='utc',
+                   help='Count flights by UTC day (default) or by the local day at the origin (for departures) or '
+                        'destination (for arrivals) airport.')
+    p.set_defaults(driver_fxn=LazyDriver('.agglomeration', 'summarize_and_merge_covid_files', __package__))
+
+
+def parse_opensky_od_agg_args(p: ArgumentParser):
+    p.description = "Agglomerate the OpenSky-derived datasets from Strohmeier et al. 2020 (doi: 10.5194/essd-2020-223) " \
+                    "into a netCDF file of the number of flights between each pair of airports per day."
     p.add_argument('savename', help='Name to give the output netCDF file')
-    p.add_argument('filenames', nargs='+', help='Paths .csv files from Strohmeier et al. to agglomerate')
-    p.set_defaults(driver_fxn=summarize_and_merge_covid_files)
+    p.add_argument('filenames', nargs='+', help='Paths .csv files from Strohmeier et al. to agglomerate. Gzipped '
+                                                '.csv files may be given directly.')
+    p.add_argument('-n', '--chunk-size', type=int, dest='chunksize',
+                   help='Read each .csv file this many rows at a time instead of loading the whole file at once. '
+                        'Use this to limit memory usage for large files; the output is the same.')
+    p.set_defaults(driver_fxn=LazyDriver('.agglomeration', 'summarize_and_merge_od_files', __package__))
@@ -1,17 +1,20 @@
 import itertools
 import netCDF4 as ncdf
 import numpy as np
+import os
 import pandas as pd
 import toml
+from typing import Optional
 
 from jllutils.subutils import ncdf as ncio
 
-from . import readers, _my_dir
+from . import readers, summary_cache, _my_dir
 from ..caada_logging import logger
 from ..caada_typing import pathlike, pathseq, strseq
 
 
-def summarize_and_merge_covid_files(filenames: pathseq, savename: pathlike):
+def summarize_and_merge_covid_files(filenames: pathseq, savename: pathlike, chunksize: Optional[int] = None,
+                                    cache_dir: Optional[pathlike] = None, update: bool = False, day_basis: str = 'utc'):
     """Summarize Strohmeier et al. COVID-19 OpenSky files into a single netCDF file
 
     This will take a list of .csv files from `Strohmeier et al. <https://essd.copernicus.org/preprints/essd-2020-223/>`_
@@ -26,7 +29,26 @@ def summarize_and_merge_covid_files(filenames: pathseq, savename: pathlike):
         The list of .csv files to summarize
 
     savename
-        The name to give the resulting netCDF file. Will be overwritten if already exists!
+        The name to give the resulting netCDF file. Will be overwritten if already exists, unless `update` is `True`!
+
+    chunksize
+        If given, each .csv file is read this many rows at a time, rather than all at once. This bounds the memory
+        needed for very large files; the output is the same either way. See :func:`summarize_opensky_covid_file`.
+
+    cache_dir
+        If given, the summary of each file is cached in this directory (see
+        :class:`~caada.opensky.summary_cache.SummaryCache`). Files whose summary is already cached and that have not
+        changed since are not read again.
+
+    update
+        If `True` and `savename` already exists, the days summarized from `filenames` are added to that file rather
+        than overwriting it. Days already in the file are replaced by the new data. When counting by local day, the
+        first and last days of each file will usually include flights from the neighboring files, so include the
+        previous file as well to get complete counts for the first new day (with `cache_dir` set, this is cheap).
+
+    day_basis
+        Whether to count flights by UTC day (`"utc"`, the default) or by the local day at the origin/destination
+        airport (`"local"`). See :func:`summarize_opensky_covid_file` for details.
 
     Returns
     -------
@@ -40,64 +62,77 @@ def summarize_and_merge_covid_files(filenames: pathseq, savename: pathlike):
     Openflights database, then flights to/from it cannot be properly categorized.
 
     """
-    def reorder_list(orig_list, new_order):
-        return [orig_list[i] for i in new_order]
-
-    data = {'{}_{}'.format(end, group): [] for end, group in itertools.product(['departures', 'arrivals'], ['all', 'domestic', 'international'])}
-    codes = []
-    times = []
+    cache = None if cache_dir is None else summary_cache.SummaryCache(cache_dir)
+    summaries = []
 
     for i, f in enumerate(filenames, start=1):
-        logger.info('Reading %s (%d of %d)', f, i, len(filenames))
-        counts, iaca_codes, these_times = summarize_opensky_covid_file(f, 'day', output='array')
-        for end, end_dicts in counts.items():
-            for group, group_counts in end_dicts.items():
-                key = '{}_{}'.format(end, group)
-                data[key].append(group_counts)
-
-        codes.append(iaca_codes)
-        times.append(these_times)
+        summary = None if cache is None else cache.load(f, avg_to='day', day_basis=day_basis)
+        if summary is None:
+            logger.info('Reading %s (%d of %d)', f, i, len(filenames))
+            summary = summarize_opensky_covid_file(f, 'day', output='array', chunksize=chunksize, day_basis=day_basis)
+            if cache is not None:
+                cache.save(f, summary, avg_to='day', day_basis=day_basis)
+        else:
+            logger.info('Using cached summary for %s (%d of %d)', f, i, len(filenames))
+        summaries.append(summary)
 
     logger.info('Done reading - %d files read', len(filenames))
-    # Sort all the outputs by time
-    sort_order = np.argsort([t[0] for t in times])
-    for k, v in data.items():
-        data[k] = reorder_list(v, sort_order)
-    codes = reorder_list(codes, sort_order)
-    times = reorder_list(times, sort_order)
+    # Local days span two UTC-day files, so their partial counts must be added. UTC days come from a single file, so if
+    # files overlap (e.g. the same file given twice) the later one replaces the earlier rather than double counting.
+    overlap = 'sum' if day_basis == 'local' else 'replace'
+    final_data, dtindex, all_codes = _merge_covid_summaries(summaries, overlap=overlap)
+
+    if update and os.path.exists(savename):
+        logger.info('Updating %s', savename)
+        update_covid_netcdf(savename=savename, data=final_data, times=dtindex, codes=all_codes, day_basis=day_basis)
+    else:
+        logger.info('Saving to %s', savename)
+        save_covid_netcdf(savename=savename, data=final_data, times=dtindex, codes=all_codes, day_basis=day_basis)
+
+
+def _merge_covid_summaries(summaries, overlap='replace'):
+    """Merge summaries from :func:`summarize_opensky_covid_file` into single time by airport arrays.
 
+    If two summaries include the same day, their counts are added when `overlap` is "sum" (as happens for local days
+    that span two files) or the later one in the list takes precedence when `overlap` is "replace".
+    """
     # Merge all codes and times
     all_codes = set()
-    for some_codes in codes:
+    all_times = set()
+    for _, some_codes, some_times in summaries:
         all_codes.update(some_codes)
-    all_codes = sorted(all_codes)
-
-    dtindex = pd.DatetimeIndex([])
-    for some_time in times:
-        dtindex = dtindex.append(pd.DatetimeIndex(some_time))
+        all_times.update(some_times)
+    all_codes = np.array(sorted(all_codes))
+    dtindex = pd.DatetimeIndex(sorted(all_times))
 
     # Now simultaneously concatenate the data and account for different codes in different files
     final_data = dict()
     ntimes = dtindex.size
-    ncodes = len(all_codes)
-    for key, counts in data.items():
-        final_data[key] = np.zeros([ntimes, ncodes], dtype=np.int32)
-        for i, arr in enumerate(counts):
-            code_inds = np.array([all_codes.index(c) for c in codes[i]]).reshape(1, -1)
-            time_inds = np.flatnonzero(dtindex.isin(times[i])).reshape(-1, 1)
-            final_data[key][time_inds, code_inds] = arr
+    ncodes = all_codes.size
+    for end, group in itertools.product(['departures', 'arrivals'], ['all', 'domestic', 'international']):
+        final_data['{}_{}'.format(end, group)] = np.zeros([ntimes, ncodes], dtype=np.int32)
 
-    logger.info('Saving to %s', savename)
-    save_covid_netcdf(savename=savename, data=final_data, times=dtindex, codes=all_codes)
+    for counts, some_codes, some_times in summaries:
+        code_inds = np.searchsorted(all_codes, np.array(some_codes, dtype=str)).reshape(1, -1)
+        time_inds = dtindex.get_indexer(pd.DatetimeIndex(some_times)).reshape(-1, 1)
+        for end, end_dicts in counts.items():
+            for group, group_counts in end_dicts.items():
+                if overlap == 'sum':
+                    final_data['{}_{}'.format(end, group)][time_inds, code_inds] += group_counts
+                else:
+                    final_data['{}_{}'.format(end, group)][time_inds, code_inds] = group_counts
 
+    return final_data, dtindex, all_codes.tolist()
 
-def summarize_opensky_covid_file(filename: pathlike, avg_to: str, output: str = 'array'):
+
+def summarize_opensky_covid_file(filename: pathlike, avg_to: str, output: str = 'array', chunksize: Optional[int] = None,
+                                 day_basis: str = 'utc'):
     """Create the summary of a single Strohmeier et al. .csv file
 
     Parameters
     ----------
     filename
-        Path to the .csv file to summarize
+        Path to the .csv file to summarize. Gzipped files (ending in ".gz") may be read directly.
 
     avg_to
         One of the strings "day" or "month", controls whether the summary returned sums up data over individual days
@@ -106,6 +141,20 @@ def summarize_opensky_covid_file(filename: pathlike, avg_to: str, output: str =
     output
         Controls what is returned. Currently "array" is the only valid value here.
 
+    chunksize
+        If given, the file is read in chunks of at most this many rows and each chunk is reduced to the arrival and
+        departure counts before the next one is read, so that the memory needed is bounded by the chunk size rather
+        than the file size. The result is identical to reading the whole file at once (the default, when this is
+        `None`).
+
+    day_basis
+        Which day (or month) each flight is counted in. `"utc"` (the default) uses the UTC "day" column in the file
+        for both departures and arrivals. `"local"` counts departures by the local date at the origin airport when the
+        flight was first seen and arrivals by the local date at the destination airport when it was last seen. Local
+        times use the time zone from the Openflights airport data, including daylight savings. Airports without a
+        recognized time zone there use their standard UTC offset, and flights to or from airports with neither fall
+        back on UTC.
+
     Returns
     -------
     dict
@@ -121,9 +170,28 @@ def summarize_opensky_covid_file(filename: pathlike, avg_to: str, output: str =
         The list of dates that correspond to the first dimension of the arrays. If "month" was given as the value for
         `avg_to`, then these will be the first date of each month.
     """
-    df = readers.read_opensky_covid_file(filename)
-    all_codes = set(df['origin'].dropna().tolist()).union(df['destination'].dropna().tolist())
+    if avg_to not in ('day', 'month'):
+        raise ValueError('Bad value for avg_to: {}'.format(avg_to))
+    if day_basis not in ('utc', 'local'):
+        raise ValueError('Bad value for day_basis: {}'.format(day_basis))
 
+    if output == 'dataframe':
+        raise NotImplementedError('Summarizing to dataframe not yet implemented')
+        #return _summarize_opensky_to_df(df, groups, all_codes, date_fxn)
+    elif output == 'array':
+        if chunksize is None:
+            chunks = [readers.read_opensky_covid_file(filename)]
+        elif day_basis == 'local':
+            chunks = readers.iter_opensky_covid_file(filename, chunksize, usecols=_summary_columns + ('firstseen', 'lastseen'))
+        else:
+            chunks = readers.iter_opensky_covid_file(filename, chunksize, usecols=_summary_columns)
+        return _summarize_opensky_to_array(chunks, avg_to, day_basis=day_basis)
+
+
+# The only columns from the Strohmeier et al. files needed to compute the summary arrays
+_summary_columns = ('origin', 'destination', 'day')
+
+def _opensky_time_groups(df, avg_to):
     yr, mn = df['day'].iloc[0].year, df['day'].iloc[0].month
     if avg_to == 'day':
         groups = df['day'].dt.dayofyear
@@ -133,53 +201,295 @@ def summarize_opensky_covid_file(filename: pathlike, avg_to: str, output: str =
         date_fxn = lambda m, y=yr: pd.Timestamp(y, m, 1)
     else:
         raise ValueError('Bad value for avg_to: {}'.format(avg_to))
+    return groups, date_fxn
 
-    if output == 'dataframe':
-        raise NotImplementedError('Summarizing to dataframe not yet implemented')
-        #return _summarize_opensky_to_df(df, groups, all_codes, date_fxn)
-    elif output == 'array':
-        return _summarize_opensky_to_array(df, groups, all_codes, date_fxn)
 
+def _opensky_local_time_groups(df, avg_to, airport_zones):
+    unit = 'D' if avg_to == 'day' else 'M'
+    dep_groups = _local_datetimes(df['firstseen'], df['origin'], airport_zones).astype('datetime64[{}]'.format(unit))
+    arr_groups = _local_datetimes(df['lastseen'], df['destination'], airport_zones).astype('datetime64[{}]'.format(unit))
+    dep_groups = pd.Series(dep_groups.astype('datetime64[ns]'), index=df.index, name='local_day')
+    arr_groups = pd.Series(arr_groups.astype('datetime64[ns]'), index=df.index, name='local_day')
+    return dep_groups, arr_groups, pd.Timestamp
 
-def _summarize_opensky_to_array(df, groups, all_codes, date_fxn):
-    all_codes = sorted(all_codes)
 
-    ncode = len(all_codes)
-    ndates = groups.unique().size
+def _airport_time_zones():
+    """Make a lookup table of each airport's time zone name and standard UTC offset (in hours)"""
+    codes_df = readers.read_airport_codes().dropna(subset=['icao_code']).drop_duplicates('icao_code')
+    std_offset = pd.to_numeric(codes_df['utc_offset'], errors='coerce').to_numpy(dtype=float)
+    return pd.Index(codes_df['icao_code']), codes_df['time_zone'].to_numpy(dtype=object), std_offset
 
-    count_arrs = {'departures': {k: np.zeros([ndates, ncode], dtype=np.int32) for k in ('all', 'domestic', 'international')},
-                  'arrivals': {k: np.zeros([ndates, ncode], dtype=np.int32) for k in ('all', 'domestic', 'international')}}
 
-    df['counter'] = 1  # use for sum
+def _local_datetimes(utc_times, codes, airport_zones):
+    """Convert UTC times of flights to local times at the given airports.
+
+    Flights are grouped by their airport's time zone (from the table made by :func:`_airport_time_zones`) and each
+    group is converted with one call to :meth:`pandas.DatetimeIndex.tz_convert`, so that daylight savings follows the
+    time zone database. Airports whose time zone is missing or not recognized fall back on their standard UTC offset
+    (without daylight savings) and times for airports with neither are left in UTC. Returns a numpy datetime64[ns]
+    array.
+    """
+    airport_index, time_zone, std_offset = airport_zones
+    utc_times = pd.DatetimeIndex(utc_times)
+    if utc_times.tz is None:
+        utc_times = utc_times.tz_localize('UTC')
+    local_times = utc_times.tz_convert(None).to_numpy(dtype='datetime64[ns]')
+
+    inds = airport_index.get_indexer(codes)
+    has_airport = inds >= 0
+    zone_codes, zone_names = pd.factorize(np.where(has_airport, time_zone[inds], None))
+
+    # Sort the flights by time zone once so that each zone's flights can be sliced out rather than searched for
+    order = np.argsort(zone_codes, kind='stable')
+    zone_bounds = np.searchsorted(zone_codes[order], np.arange(len(zone_names) + 1))
+    converted = np.zeros(local_times.shape, dtype=bool)
+    for izone, zone in enumerate(zone_names):
+        xx = order[zone_bounds[izone]:zone_bounds[izone + 1]]
+        try:
+            zone_times = utc_times[xx].tz_convert(zone)
+        except (LookupError, ValueError):
+            logger.debug('Time zone "%s" not recognized, will use the standard UTC offset', zone)
+            continue
+        local_times[xx] = zone_times.tz_localize(None).to_numpy(dtype='datetime64[ns]')
+        converted[xx] = True
+
+    use_offset = has_airport & ~converted
+    use_offset[use_offset] = ~np.isnan(std_offset[inds[use_offset]])
+    offset_ns = np.round(std_offset[inds[use_offset]] * 3600e9).astype(np.int64)
+    local_times[use_offset] += offset_ns.astype('timedelta64[ns]')
+
+    n_utc = (~converted & ~use_offset & ~np.isnat(local_times)).sum()
+    if n_utc > 0:
+        logger.debug('%d flights have no time zone or UTC offset for their airport, will use UTC time', n_utc)
+    return local_times
+
+
+def _count_opensky_flights(df, dep_groups, arr_groups=None):
+    if arr_groups is None:
+        arr_groups = dep_groups
+
     xxdom = df['origin_country_name'].fillna('UORIG') == df['dest_country_name'].fillna('UDEST')
     dom_df = df[xxdom]
     intl_df = df[~xxdom]
 
-    counts = {'departures':
-                  {'all': df.groupby([groups, 'origin']).sum()['counter'],
-                   'domestic': dom_df.groupby([groups, 'origin']).sum()['counter'],
-                   'international': intl_df.groupby([groups, 'origin']).sum()['counter']},
-              'arrivals':
-                  {'all': df.groupby([groups, 'destination']).sum()['counter'],
-                   'domestic': dom_df.groupby([groups, 'destination']).sum()['counter'],
-                   'international': intl_df.groupby([groups, 'destination']).sum()['counter']}}
+    return {'departures':
+                {'all': df.groupby([dep_groups, 'origin']).size(),
+                 'domestic': dom_df.groupby([dep_groups[xxdom], 'origin']).size(),
+                 'international': intl_df.groupby([dep_groups[~xxdom], 'origin']).size()},
+            'arrivals':
+                {'all': df.groupby([arr_groups, 'destination']).size(),
+                 'domestic': dom_df.groupby([arr_groups[xxdom], 'destination']).size(),
+                 'international': intl_df.groupby([arr_groups[~xxdom], 'destination']).size()}}
+
+
+def _summarize_opensky_to_array(chunks, avg_to, day_basis='utc'):
+    # Each chunk of the file is reduced to counts per (time, airport) before moving on to the next, so only the
+    # counts need to be kept in memory.
+    all_codes = set()
+    counts = None
+    date_fxn = None
+    airport_zones = _airport_time_zones() if day_basis == 'local' else None
+    for df in chunks:
+        if df.shape[0] == 0:
+            continue
+
+        if day_basis == 'local':
+            dep_groups, arr_groups, date_fxn = _opensky_local_time_groups(df, avg_to, airport_zones)
+        else:
+            dep_groups, chunk_date_fxn = _opensky_time_groups(df, avg_to)
+            arr_groups = dep_groups
+            if date_fxn is None:
+                # Like the original whole-file summary, the year comes from the first row of the file
+                date_fxn = chunk_date_fxn
+
+        all_codes.update(df['origin'].dropna().tolist())
+        all_codes.update(df['destination'].dropna().tolist())
+
+        chunk_counts = _count_opensky_flights(df, dep_groups, arr_groups)
+        if counts is None:
+            counts = chunk_counts
+        else:
+            for end, end_dicts in chunk_counts.items():
+                for status, status_counts in end_dicts.items():
+                    counts[end][status] = counts[end][status].add(status_counts, fill_value=0)
+
+    if counts is None:
+        raise ValueError('No flights found to summarize')
+
+    return _opensky_counts_to_array(counts, all_codes, date_fxn)
+
+
+def _opensky_counts_to_array(counts, all_codes, date_fxn):
+    all_codes = sorted(all_codes)
+    ncode = len(all_codes)
 
     origin_tinds = counts['departures']['all'].index.get_level_values(0)
     dest_tinds = counts['arrivals']['all'].index.get_level_values(0)
 
     unique_tinds = sorted(set(origin_tinds).union(dest_tinds))
     unique_times = [date_fxn(d) for d in unique_tinds]
+    ndates = len(unique_tinds)
 
-    for i, t in enumerate(unique_tinds):
-        for end, end_dicts in counts.items():
-            for status, status_df in end_dicts.items():
-                if status_df.index.get_level_values(0).isin([t]).any():
-                    sub_df = status_df.xs(t).reindex(all_codes).fillna(0)
-                    count_arrs[end][status][i, :] = sub_df.to_numpy()
+    count_arrs = {'departures': {k: np.zeros([ndates, ncode], dtype=np.int32) for k in ('all', 'domestic', 'international')},
+                  'arrivals': {k: np.zeros([ndates, ncode], dtype=np.int32) for k in ('all', 'domestic', 'international')}}
+
+    # Rather than reindexing each time separately, convert both levels of the index to array indices and assign
+    # all the counts at once.
+    code_array = np.array(all_codes)
+    for end, end_dicts in counts.items():
+        for status, status_counts in end_dicts.items():
+            if status_counts.size == 0:
+                continue
+            tinds = pd.Index(unique_tinds).get_indexer(status_counts.index.get_level_values(0))
+            cinds = np.searchsorted(code_array, status_counts.index.get_level_values(1).to_numpy(dtype=str))
+            count_arrs[end][status][tinds, cinds] = status_counts.to_numpy()
 
     return count_arrs, all_codes, unique_times
 
 
+def summarize_and_merge_od_files(filenames: pathseq, savename: pathlike, chunksize: Optional[int] = None):
+    """Summarize Strohmeier et al. COVID-19 OpenSky files into a netCDF file of origin-destination flight counts
+
+    This is the counterpart to :func:`summarize_and_merge_covid_files` that, rather than counting the departures and
+    arrivals at each airport, counts the number of flights between each pair of airports for each day. Since most
+    pairs of airports never have flights between them, these counts are stored sparsely, as a list of airport pairs
+    each with a list of (day, number of flights) entries. Use :func:`~caada.opensky.readers.read_opensky_od_file` to
+    read the resulting file.
+
+    Parameters
+    ----------
+    filenames
+        The list of .csv files to summarize
+
+    savename
+        The name to give the resulting netCDF file. Will be overwritten if already exists!
+
+    chunksize
+        If given, each .csv file is read this many rows at a time, rather than all at once. This bounds the memory
+        needed for very large files; the output is the same either way.
+
+    Returns
+    -------
+    None
+    """
+    summaries = []
+    for i, f in enumerate(filenames, start=1):
+        logger.info('Reading %s (%d of %d)', f, i, len(filenames))
+        summaries.append(summarize_opensky_od_file(f, 'day', chunksize=chunksize))
+
+    logger.info('Done reading - %d files read', len(filenames))
+    coo, dtindex, all_codes = _merge_od_summaries(summaries)
+
+    logger.info('Saving to %s', savename)
+    save_od_netcdf(savename=savename, coo=coo, times=dtindex, codes=all_codes)
+
+
+def summarize_opensky_od_file(filename: pathlike, avg_to: str, chunksize: Optional[int] = None):
+    """Count the flights between each pair of airports in a single Strohmeier et al. .csv file
+
+    Parameters
+    ----------
+    filename
+        Path to the .csv file to summarize. Gzipped files (ending in ".gz") may be read directly.
+
+    avg_to
+        One of the strings "day" or "month", controls whether the summary returned sums up data over individual days
+        or months.
+
+    chunksize
+        If given, the file is read in chunks of at most this many rows. See :func:`summarize_opensky_covid_file`.
+
+    Returns
+    -------
+    dict
+        The flight counts in sparse coordinate (COO) form: a dict with keys "origin", "destination", "time", and
+        "count". Each is a 1D array of the same length; "origin" and "destination" are indices into the list of
+        ICAO codes, "time" is an index into the list of dates, and "count" is the number of flights between that
+        origin and destination on that date. Pairs of airports with no flights between them on a date are not
+        included. Flights missing either the origin or destination are not counted.
+
+    strseq
+        The list of ICAO airport codes indexed by the "origin" and "destination" arrays.
+
+    Sequence[pandas.Timestamp]
+        The list of dates indexed by the "time" array. If "month" was given as the value for `avg_to`, then these
+        will be the first date of each month.
+    """
+    if avg_to not in ('day', 'month'):
+        raise ValueError('Bad value for avg_to: {}'.format(avg_to))
+
+    if chunksize is None:
+        chunks = [readers.read_opensky_covid_file(filename)]
+    else:
+        chunks = readers.iter_opensky_covid_file(filename, chunksize, usecols=_summary_columns)
+
+    pair_counts = None
+    date_fxn = None
+    for df in chunks:
+        if df.shape[0] == 0:
+            continue
+
+        groups, chunk_date_fxn = _opensky_time_groups(df, avg_to)
+        if date_fxn is None:
+            date_fxn = chunk_date_fxn
+
+        chunk_counts = df.groupby([groups, 'origin', 'destination']).size()
+        pair_counts = chunk_counts if pair_counts is None else pair_counts.add(chunk_counts, fill_value=0)
+
+    if pair_counts is None:
+        raise ValueError('No flights found to summarize')
+
+    time_keys, time_inds = np.unique(pair_counts.index.get_level_values(0).to_numpy(), return_inverse=True)
+    npairs = pair_counts.size
+    all_ends = np.concatenate([pair_counts.index.get_level_values(1).to_numpy(dtype=str),
+                               pair_counts.index.get_level_values(2).to_numpy(dtype=str)])
+    codes, code_inds = np.unique(all_ends, return_inverse=True)
+
+    coo = {'origin': code_inds[:npairs].astype(np.int32),
+           'destination': code_inds[npairs:].astype(np.int32),
+           'time': time_inds.astype(np.int32),
+           'count': pair_counts.to_numpy().astype(np.int32)}
+    return coo, codes.tolist(), [date_fxn(t) for t in time_keys]
+
+
+def _merge_od_summaries(summaries):
+    """Merge sparse summaries from :func:`summarize_opensky_od_file` into one set of COO arrays.
+
+    Counts for the same origin, destination, and time in different summaries are added. The merged entries are sorted
+    by origin, then destination, then time, so that each airport pair's entries are contiguous.
+    """
+    all_codes = set()
+    all_times = set()
+    for _, some_codes, some_times in summaries:
+        all_codes.update(some_codes)
+        all_times.update(some_times)
+    all_codes = np.array(sorted(all_codes))
+    dtindex = pd.DatetimeIndex(sorted(all_times))
+    ncodes = np.int64(all_codes.size)
+    ntimes = np.int64(dtindex.size)
+
+    keys = []
+    counts = []
+    for coo, some_codes, some_times in summaries:
+        code_map = np.searchsorted(all_codes, np.array(some_codes, dtype=str))
+        time_map = dtindex.get_indexer(pd.DatetimeIndex(some_times))
+        pair_key = code_map[coo['origin']].astype(np.int64) * ncodes + code_map[coo['destination']]
+        keys.append(pair_key * ntimes + time_map[coo['time']])
+        counts.append(coo['count'])
+
+    # np.unique sorts the combined keys, which puts the entries in origin/destination/time order
+    unique_keys, inverse = np.unique(np.concatenate(keys), return_inverse=True)
+    summed_counts = np.bincount(inverse.ravel(), weights=np.concatenate(counts)).astype(np.int32)
+    pair_key, time_inds = np.divmod(unique_keys, ntimes)
+    origin_inds, dest_inds = np.divmod(pair_key, ncodes)
+
+    coo = {'origin': origin_inds.astype(np.int32),
+           'destination': dest_inds.astype(np.int32),
+           'time': time_inds.astype(np.int32),
+           'count': summed_counts}
+    return coo, dtindex, all_codes.tolist()
+
+
 def _summarize_opensky_to_df(df, groups, all_codes, date_fxn):
     # Note: not tested. Likely needs reworked.
     mi_tuples = []
@@ -222,25 +532,16 @@ def get_info(df, code):
     return {'origin_count': origin_dict['count'], 'dest_count': dest_dict['count'], 'longitude': lon, 'latitude': lat}
 
 
-def save_covid_netcdf(savename, data, times, codes):
-    # Read in the NC attributes from the TOML file and ancillary data
-    with open(_my_dir / 'ncattrs.toml') as f:
-        ncatts = toml.load(f)['opensky-covid']
-
-    ancillary_df = readers.read_airport_codes().set_index('icao_code').reindex(codes)
-    ancillary_varinfo = {'iata_code': ('iata_code', '', 'U'),
-                         'airport_name': ('airport_name', '', 'U'),
-                         'city_name': ('airport_city', '', 'U'),
-                         'country_name': ('airport_country', '', 'U'),
-                         'latitude': ('airport_latitude', np.nan, 'float32'),
-                         'longitude': ('airport_longitude', np.nan, 'float32')}
+def save_covid_netcdf(savename, data, times, codes, day_basis='utc'):
+    # Read in the NC attributes from the TOML file
+    ncatts = _load_covid_ncattrs()
 
     def get_atts(var):
         return ncatts.get(var, dict())
 
     with ncdf.Dataset(savename, 'w') as ds:
-        # Dimensions first
-        timedim = ncio.make_nctimedim_helper(ds, 'time', times)
+        # Dimensions first. Time is unlimited so that new days can be appended by update_covid_netcdf.
+        timedim = _make_unlimited_timedim(ds, 'time', times)
         apdim = ncio.make_ncdim_helper(ds, 'airport', np.array(codes), **get_atts('airport'))
 
         # Then regular variables
@@ -248,7 +549,167 @@ def save_covid_netcdf(savename, data, times, codes):
             ncio.make_ncvar_helper(ds, varname, vardata, (timedim, apdim), **get_atts(varname))
 
         # Finally build up ancillary data: IATA code, airport name, airport lat/lon, etc.
-        for colname, (varname, varfill, vartype) in ancillary_varinfo.items():
-            logger.debug('Adding ancillary data: %s', varname)
-            coldata = ancillary_df[colname].fillna(varfill).to_numpy().astype(vartype)
-            ncio.make_ncvar_helper(ds, varname, coldata, ('airport',), **get_atts(varname))
+        _add_airport_ancillary_vars(ds, codes, ncatts)
+        ds.setncattr('day_basis', day_basis)
+
+
+def update_covid_netcdf(savename, data, times, codes, day_basis='utc'):
+    """Add new days to an existing file written by :func:`save_covid_netcdf`.
+
+    When possible, the new days are appended to the file in place. If the new data includes airports not already in
+    the file, or the file cannot be appended to (e.g. it was written before the time dimension was unlimited), then
+    the existing data is read in, merged with the new data, and the whole file rewritten.
+
+    Parameters
+    ----------
+    savename
+        Path to the existing netCDF file
+
+    data
+        Dictionary of time by airport count arrays, as produced by :func:`_merge_covid_summaries`.
+
+    times
+        The times corresponding to the first dimension of the arrays in `data`.
+
+    codes
+        The airport codes corresponding to the second dimension of the arrays in `data`.
+
+    day_basis
+        Whether `data` is counted by UTC or local day. Must match the file being updated.
+
+    Returns
+    -------
+    None
+    """
+    times = pd.DatetimeIndex(times)
+    with ncdf.Dataset(savename, 'a') as ds:
+        file_day_basis = ds.getncattr('day_basis') if 'day_basis' in ds.ncattrs() else 'utc'
+        if file_day_basis != day_basis:
+            raise ValueError('Cannot update {} (counted by {} day) with data counted by {} day'
+                             .format(savename, file_day_basis, day_basis))
+
+        time_var = ds.variables['time']
+        calendar = time_var.getncattr('calendar') if 'calendar' in time_var.ncattrs() else 'standard'
+        file_times = pd.DatetimeIndex(ncdf.num2date(time_var[:], time_var.units, calendar=calendar,
+                                                    only_use_cftime_datetimes=False, only_use_python_datetimes=True))
+        file_codes = pd.Index(ds.variables['airport'][:])
+        code_inds = file_codes.get_indexer(codes)
+
+        new_times = times[~times.isin(file_times)]
+        can_append = (ds.dimensions['time'].isunlimited()
+                      and (code_inds >= 0).all()
+                      and all(k in ds.variables for k in data)
+                      and (new_times.size == 0 or file_times.size == 0 or new_times.min() > file_times.max()))
+
+        if can_append:
+            time_inds = file_times.get_indexer(times)
+            ntime_file = file_times.size
+            is_new = time_inds < 0
+            time_inds[is_new] = np.arange(ntime_file, ntime_file + is_new.sum())
+            logger.info('Appending %d new days and replacing %d existing days in %s',
+                        is_new.sum(), (~is_new).sum(), savename)
+
+            if new_times.size > 0:
+                time_var[ntime_file:] = ncdf.date2num(new_times.to_pydatetime(), time_var.units, calendar=calendar)
+            for varname, vardata in data.items():
+                file_var = ds.variables[varname]
+                for i, itime in enumerate(time_inds):
+                    row = np.zeros(file_codes.size, dtype=vardata.dtype)
+                    row[code_inds] = vardata[i]
+                    file_var[itime, :] = row
+            return
+
+        logger.info('Cannot append to %s in place, will merge with the new data and rewrite it', savename)
+        file_counts = {'departures': dict(), 'arrivals': dict()}
+        for end, end_dict in file_counts.items():
+            for group in ('all', 'domestic', 'international'):
+                end_dict[group] = np.ma.filled(ds.variables['{}_{}'.format(end, group)][:], 0)
+        file_summary = (file_counts, file_codes.tolist(), list(file_times))
+
+    new_counts = {'departures': dict(), 'arrivals': dict()}
+    for key, vardata in data.items():
+        end, group = key.split('_')
+        new_counts[end][group] = vardata
+
+    data, times, codes = _merge_covid_summaries([file_summary, (new_counts, codes, list(times))], overlap='replace')
+    save_covid_netcdf(savename=savename, data=data, times=times, codes=codes, day_basis=day_basis)
+
+
+def save_od_netcdf(savename, coo, times, codes):
+    """Save sparse origin-destination flight counts to a netCDF file.
+
+    The counts are stored as a contiguous ragged array (following the CF conventions): the "od_pair" dimension lists
+    each pair of airports with at least one flight between them, and the "obs" dimension holds the (time, count)
+    entries for all pairs, with each pair's entries stored together in the same order as the pairs. The
+    "pair_num_obs" variable gives the number of entries for each pair.
+
+    Parameters
+    ----------
+    savename
+        Path to write the netCDF file to. Will be overwritten if already exists!
+
+    coo
+        Dictionary of COO arrays, as returned by :func:`_merge_od_summaries`. Must be sorted by origin, destination,
+        and time.
+
+    times
+        The dates indexed by the "time" array in `coo`.
+
+    codes
+        The ICAO airport codes indexed by the "origin" and "destination" arrays in `coo`.
+
+    Returns
+    -------
+    None
+    """
+    ncatts = _load_covid_ncattrs()
+    od_ncatts = _load_covid_ncattrs('opensky-covid-od')
+
+    pair_key = coo['origin'].astype(np.int64) * len(codes) + coo['destination']
+    _, pair_start, pair_num_obs = np.unique(pair_key, return_index=True, return_counts=True)
+
+    with ncdf.Dataset(savename, 'w') as ds:
+        ncio.make_nctimedim_helper(ds, 'time', times)
+        ncio.make_ncdim_helper(ds, 'airport', np.array(codes), **ncatts.get('airport', dict()))
+        ds.createDimension('od_pair', pair_start.size)
+        ds.createDimension('obs', coo['count'].size)
+
+        pair_vars = {'pair_origin': coo['origin'][pair_start],
+                     'pair_destination': coo['destination'][pair_start],
+                     'pair_num_obs': pair_num_obs.astype(np.int32)}
+        for varname, vardata in pair_vars.items():
+            ncio.make_ncvar_helper(ds, varname, vardata, ('od_pair',), **od_ncatts.get(varname, dict()))
+
+        obs_vars = {'obs_time': coo['time'], 'flight_count': coo['count']}
+        for varname, vardata in obs_vars.items():
+            ncio.make_ncvar_helper(ds, varname, vardata, ('obs',), **od_ncatts.get(varname, dict()))
+
+        _add_airport_ancillary_vars(ds, codes, ncatts)
+
+
+def _add_airport_ancillary_vars(ds, codes, ncatts):
+    ancillary_df = readers.read_airport_codes().set_index('icao_code').reindex(codes)
+    ancillary_varinfo = {'iata_code': ('iata_code', '', 'U'),
+                         'airport_name': ('airport_name', '', 'U'),
+                         'city_name': ('airport_city', '', 'U'),
+                         'country_name': ('airport_country', '', 'U'),
+                         'latitude': ('airport_latitude', np.nan, 'float32'),
+                         'longitude': ('airport_longitude', np.nan, 'float32')}
+
+    for colname, (varname, varfill, vartype) in ancillary_varinfo.items():
+        logger.debug('Adding ancillary data: %s', varname)
+        coldata = ancillary_df[colname].fillna(varfill).to_numpy().astype(vartype)
+        ncio.make_ncvar_helper(ds, varname, coldata, ('airport',), **ncatts.get(varname, dict()))
+
+
+def _load_covid_ncattrs(product='opensky-covid'):
+    with open(_my_dir / 'ncattrs.toml') as f:
+        return toml.load(f)[product]
+
+
+def _make_unlimited_timedim(ds, dim_name, times, time_units='seconds since 1970-01-01 00:00:00', calendar='gregorian'):
+    dim = ds.createDimension(dim_name, None)
+    var = ds.createVariable(dim_name, 'f8', (dim_name,))
+    var.setncatts({'units': time_units, 'calendar': calendar})
+    var[:] = ncdf.date2num(pd.DatetimeIndex(times).to_pydatetime(), time_units, calendar=calendar)
+    return dim
@@ -1,6 +1,10 @@
+import hashlib
+import netCDF4 as ncdf
+import numpy as np
 import pandas as pd
+from typing import Iterator, Optional
 
-from ..caada_typing import pathlike
+from ..caada_typing import datetimelike, pathlike, strseq
 from ..caada_logging import logger
 
 from . import web
@@ -33,15 +37,36 @@ def read_airport_codes(source: str = 'openflights', update: str = 'never') -> pd
     """
     web._download_airport_codes(source, update=update)
     local_file = get_airport_code_source(source)['local']
-    df = pd.read_csv(local_file, header=None).iloc[:, :11]
+    df = pd.read_csv(local_file, header=None).iloc[:, :12]
     df.columns = ['entry_id', 'airport_name', 'city_name', 'country_name', 'iata_code', 'icao_code',
-                  'latitude', 'longitude', 'elevation', 'utc_offset', 'dst_group']
+                  'latitude', 'longitude', 'elevation', 'utc_offset', 'dst_group', 'time_zone']
     # convert altitude from feet to meters
     df.loc[:, 'elevation'] *= 0.3048
     df.set_index('entry_id', inplace=True)
     return df
 
 
+def airport_codes_version(source: str = 'openflights') -> str:
+    """Get a short identifier for the current local copy of the airport code data
+
+    Parameters
+    ----------
+    source
+        Which web source to check. Currently the only allowed option is `"openflights"`.
+
+    Returns
+    -------
+    str
+        A hash of the local airport code file's contents. This changes whenever the airport data is updated, so it can
+        be used to tell whether anything derived from the airport data (e.g. domestic vs. international flights) needs
+        to be recomputed.
+    """
+    web._download_airport_codes(source, update='never')
+    local_file = get_airport_code_source(source)['local']
+    with open(local_file, 'rb') as robj:
+        return hashlib.sha1(robj.read()).hexdigest()[:16]
+
+
 def read_opensky_covid_file(filename: pathlike, code_source: str = 'openflights', update_codes: str = 'never') -> pd.DataFrame:
     """Read a .csv file prepared by Strohmeier et al. 2020 (ESSDD).
 
@@ -51,7 +76,7 @@ def read_opensky_covid_file(filename: pathlike, code_source: str = 'openflights'
     Parameters
     ----------
     filename
-        Path to the .csv file to read
+        Path to the .csv file to read. Gzipped files (ending in ".gz") may be read directly.
 
     code_source
         Which web source to use for the geographic data. See :func:`read_airport_codes` in this module.
@@ -69,11 +94,63 @@ def read_opensky_covid_file(filename: pathlike, code_source: str = 'openflights'
     df = pd.read_csv(filename, parse_dates=['firstseen', 'lastseen', 'day'])
     df.drop(columns=df.columns[0], inplace=True)
 
+    airport_codes = _read_airport_codes_for_merge(code_source=code_source, update_codes=update_codes)
+
+    logger.info('Adding origin & destination metadata')
+    return _add_airport_metadata(df, airport_codes)
+
+
+def iter_opensky_covid_file(filename: pathlike, chunksize: int, code_source: str = 'openflights',
+                            update_codes: str = 'never', usecols: Optional[strseq] = None) -> Iterator[pd.DataFrame]:
+    """Iterate over a .csv file prepared by Strohmeier et al. 2020 (ESSDD) in fixed-size chunks.
+
+    This is the streaming equivalent of :func:`read_opensky_covid_file`, intended for the larger monthly files which
+    may be several GB uncompressed. Each chunk is joined with the same geographic data as the full dataframe returned
+    by :func:`read_opensky_covid_file`, so concatenating all the chunks would give the same dataframe. Gzipped files
+    (ending in ".gz") are decompressed on the fly.
+
+    Parameters
+    ----------
+    filename
+        Path to the .csv or .csv.gz file to read
+
+    chunksize
+        Maximum number of rows from the .csv file to include in each chunk. This controls the memory usage.
+
+    code_source
+        Which web source to use for the geographic data. See :func:`read_airport_codes` in this module.
+
+    update_codes
+        Controls whether the geographic data is updated. See :func:`read_airport_codes` in this module.
+
+    usecols
+        If given, only these columns are read from the .csv file. The "firstseen", "lastseen", and "day" columns are
+        parsed as datetimes if included. Reading only the columns needed can speed up summarizing considerably.
+        Note that "origin" and "destination" must be included for the geographic data to be joined.
+
+    Returns
+    -------
+    Iterator[pandas.DataFrame]
+        Yields dataframes with at most `chunksize` rows.
+    """
+    logger.info('Reading %s in chunks of %d rows', filename, chunksize)
+    date_cols = [c for c in ('firstseen', 'lastseen', 'day') if usecols is None or c in usecols]
+    airport_codes = _read_airport_codes_for_merge(code_source=code_source, update_codes=update_codes)
+    with pd.read_csv(filename, parse_dates=date_cols, usecols=usecols, chunksize=chunksize) as reader:
+        for chunk in reader:
+            if usecols is None:
+                chunk.drop(columns=chunk.columns[0], inplace=True)
+            yield _add_airport_metadata(chunk, airport_codes)
+
+
+def _read_airport_codes_for_merge(code_source: str, update_codes: str) -> pd.DataFrame:
     airport_codes = read_airport_codes(source=code_source, update=update_codes)
-    airport_codes.drop(columns=['elevation', 'utc_offset', 'dst_group'], inplace=True)
+    airport_codes.drop(columns=['elevation', 'utc_offset', 'dst_group', 'time_zone'], inplace=True)
+    return airport_codes
+
 
+def _add_airport_metadata(df: pd.DataFrame, airport_codes: pd.DataFrame) -> pd.DataFrame:
     # Add some information about the origin and destination airports
-    logger.info('Adding origin & destination metadata')
     df = df.merge(airport_codes, how='left', left_on='origin', right_on='icao_code')
     df.drop(columns=['icao_code'], inplace=True)
     rename_dict = {c: 'origin_{}'.format(c) for c in airport_codes.columns if c != 'icao_code'}
@@ -85,3 +162,78 @@ def read_opensky_covid_file(filename: pathlike, code_source: str = 'openflights'
     df.rename(columns=rename_dict, inplace=True)
 
     return df
+
+
+def read_opensky_od_file(filename: pathlike, origins: Optional[strseq] = None, destinations: Optional[strseq] = None,
+                         start_date: Optional[datetimelike] = None, stop_date: Optional[datetimelike] = None) -> pd.Series:
+    """Read origin-destination flight counts from a netCDF file written by the `os-covid-od` command
+
+    The counts are stored sparsely in the file (see :func:`~caada.opensky.agglomeration.save_od_netcdf`). Only the
+    per-pair index variables are read in full; the per-day counts are read only for the airport pairs requested, so
+    selecting a few origins or destinations is fast even for a large file.
+
+    Parameters
+    ----------
+    filename
+        Path to the netCDF file to read.
+
+    origins
+        ICAO codes of the origin airports to include. If not given, all origins are included.
+
+    destinations
+        ICAO codes of the destination airports to include. If not given, all destinations are included.
+
+    start_date, stop_date
+        First and last dates (inclusive) to include. If not given, the range is unbounded on that end.
+
+    Returns
+    -------
+    pandas.Series
+        The number of flights, indexed by origin code, destination code, and date. Only origin/destination/date
+        combinations with at least one flight are included.
+    """
+    with ncdf.Dataset(filename) as ds:
+        codes = pd.Index(np.ma.filled(ds.variables['airport'][:]))
+        time_var = ds.variables['time']
+        calendar = time_var.getncattr('calendar') if 'calendar' in time_var.ncattrs() else 'standard'
+        times = pd.DatetimeIndex(ncdf.num2date(time_var[:], time_var.units, calendar=calendar,
+                                               only_use_cftime_datetimes=False, only_use_python_datetimes=True))
+
+        pair_origin = np.ma.filled(ds.variables['pair_origin'][:])
+        pair_dest = np.ma.filled(ds.variables['pair_destination'][:])
+        pair_num_obs = np.ma.filled(ds.variables['pair_num_obs'][:]).astype(np.int64)
+        pair_stop = np.cumsum(pair_num_obs)
+        pair_start = pair_stop - pair_num_obs
+
+        selected = np.ones(pair_origin.shape, dtype=bool)
+        if origins is not None:
+            selected &= np.isin(pair_origin, codes.get_indexer(origins))
+        if destinations is not None:
+            selected &= np.isin(pair_dest, codes.get_indexer(destinations))
+        selected = np.flatnonzero(selected)
+
+        # Since the entries for each pair are stored contiguously, adjacent selected pairs can be read together. This
+        # matters most when selecting by origin, as the pairs are sorted by origin first.
+        ranges = []
+        if selected.size > 0:
+            range_breaks = np.flatnonzero(pair_start[selected[1:]] != pair_stop[selected[:-1]]) + 1
+            first_pairs = selected[np.concatenate([[0], range_breaks])]
+            last_pairs = selected[np.concatenate([range_breaks - 1, [selected.size - 1]])]
+            ranges = list(zip(pair_start[first_pairs], pair_stop[last_pairs]))
+
+        obs_time = [np.ma.filled(ds.variables['obs_time'][a:b]) for a, b in ranges]
+        obs_count = [np.ma.filled(ds.variables['flight_count'][a:b]) for a, b in ranges]
+
+    obs_time = np.concatenate(obs_time) if len(obs_time) > 0 else np.array([], dtype=np.int32)
+    obs_count = np.concatenate(obs_count) if len(obs_count) > 0 else np.array([], dtype=np.int32)
+    obs_pair = np.repeat(selected, pair_num_obs[selected])
+
+    xx = np.ones(obs_time.shape, dtype=bool)
+    if start_date is not None:
+        xx &= times[obs_time] >= pd.Timestamp(start_date)
+    if stop_date is not None:
+        xx &= times[obs_time] <= pd.Timestamp(stop_date)
+
+    index = pd.MultiIndex.from_arrays([codes[pair_origin[obs_pair[xx]]], codes[pair_dest[obs_pair[xx]]], times[obs_time[xx]]],
+                                      names=['origin', 'destination', 'date'])
+    return pd.Series(obs_count[xx], index=index, name='flight_count')
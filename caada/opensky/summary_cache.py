@@ -0,0 +1,145 @@
+"""
+This module contains an on-disk cache of the per-file summaries computed by
+:func:`~caada.opensky.agglomeration.summarize_opensky_covid_file`, so that agglomerating a growing list of Strohmeier et
+al. files only needs to summarize the new or changed ones.
+"""
+
+import hashlib
+import json
+import numpy as np
+import os
+import pandas as pd
+from pathlib import Path
+from typing import Optional
+
+from . import readers
+from ..caada_logging import logger
+from ..caada_typing import pathlike
+
+# Increment this if the layout of the cached files or the way the summaries are computed changes, so that
+# old cache entries are not reused.
+_CACHE_FORMAT_VERSION = 2
+
+
+class SummaryCache:
+    """Cache of OpenSky file summaries, stored as compressed numpy .npz files.
+
+    Each entry is keyed by the absolute path, size, and modification time of the summarized file, the version of the
+    airport code data used to classify domestic vs. international flights, and any options passed to the summary.
+    If any of those change, the cached entry will not be used.
+
+    Parameters
+    ----------
+    cache_dir
+        Directory to store the cached summaries in. Will be created if it does not exist.
+
+    code_source
+        Which airport code source the summaries use. See :func:`~caada.opensky.readers.read_airport_codes`.
+    """
+    def __init__(self, cache_dir: pathlike, code_source: str = 'openflights'):
+        self.cache_dir = Path(cache_dir)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.code_source = code_source
+        self._airport_version = None
+
+    @property
+    def airport_version(self) -> str:
+        if self._airport_version is None:
+            self._airport_version = readers.airport_codes_version(self.code_source)
+        return self._airport_version
+
+    def load(self, filename: pathlike, **options) -> Optional[tuple]:
+        """Load the cached summary for a file, if a current one exists.
+
+        Parameters
+        ----------
+        filename
+            The Strohmeier et al. .csv file that was summarized.
+
+        options
+            The keyword arguments that affect the summary, e.g. `avg_to`. These must match the ones given to
+            :meth:`save`.
+
+        Returns
+        -------
+        Optional[tuple]
+            `None` if there is no current cache entry, otherwise the same three values returned by
+            :func:`~caada.opensky.agglomeration.summarize_opensky_covid_file`.
+        """
+        key = self._make_key(filename, options)
+        cache_file = self._cache_file(filename, key)
+        if not cache_file.exists():
+            return None
+
+        try:
+            with np.load(cache_file, allow_pickle=False) as npz:
+                if str(npz['key']) != key:
+                    logger.debug('Cache file %s does not match the key for %s', cache_file, filename)
+                    return None
+
+                counts = dict()
+                for end in ('departures', 'arrivals'):
+                    counts[end] = {group: npz['{}_{}'.format(end, group)] for group in ('all', 'domestic', 'international')}
+                codes = npz['codes'].tolist()
+                times = list(pd.DatetimeIndex(npz['times']))
+        except (OSError, ValueError, KeyError) as err:
+            logger.warning('Could not read cached summary %s (%s), will recompute', cache_file, err)
+            return None
+
+        return counts, codes, times
+
+    def save(self, filename: pathlike, summary: tuple, **options):
+        """Save the summary of a file to the cache.
+
+        Parameters
+        ----------
+        filename
+            The Strohmeier et al. .csv file that was summarized.
+
+        summary
+            The three values returned by :func:`~caada.opensky.agglomeration.summarize_opensky_covid_file`.
+
+        options
+            The keyword arguments that affect the summary, e.g. `avg_to`.
+
+        Returns
+        -------
+        None
+        """
+        counts, codes, times = summary
+        key = self._make_key(filename, options)
+        cache_file = self._cache_file(filename, key)
+
+        arrays = {'{}_{}'.format(end, group): arr for end, end_dict in counts.items() for group, arr in end_dict.items()}
+        arrays['codes'] = np.array(codes, dtype=str)
+        arrays['times'] = pd.DatetimeIndex(times).to_numpy(dtype='datetime64[ns]')
+        arrays['key'] = np.array(key)
+
+        # Any other entries for this file are out of date now, so remove them to keep the cache from growing
+        for old_file in self.cache_dir.glob('{}_*.npz'.format(self._path_hash(filename))):
+            if old_file != cache_file:
+                logger.debug('Removing out of date cached summary %s', old_file)
+                old_file.unlink()
+
+        # Write to a temporary file first so that an interrupted write does not leave a corrupted entry
+        tmp_file = cache_file.with_name(cache_file.name + '.tmp')
+        with open(tmp_file, 'wb') as wobj:
+            np.savez_compressed(wobj, **arrays)
+        os.replace(tmp_file, cache_file)
+        logger.debug('Cached summary of %s as %s', filename, cache_file)
+
+    def _make_key(self, filename, options):
+        filename = Path(filename).resolve()
+        st = filename.stat()
+        key = {'path': str(filename), 'size': st.st_size, 'mtime_ns': st.st_mtime_ns,
+               'airport_version': self.airport_version, 'format': _CACHE_FORMAT_VERSION}
+        key.update(options)
+        return json.dumps(key, sort_keys=True)
+
+    def _cache_file(self, filename, key):
+        key_hash = hashlib.sha1(key.encode('utf8')).hexdigest()[:16]
+        return self.cache_dir / '{}_{}.npz'.format(self._path_hash(filename), key_hash)
+
+    @staticmethod
+    def _path_hash(filename):
+        return hashlib.sha1(str(Path(filename).resolve()).encode('utf8')).hexdigest()[:16]
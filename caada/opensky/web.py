@@ -1,9 +1,18 @@
+from contextlib import contextmanager
+import json
 import os
 from pandas import Timedelta
+from pathlib import Path
 import requests
 import time
 
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
 from . import get_airport_code_source
+from ..caada_files import atomic_writer, write_atomic
 from ..caada_errors import HTMLRequestError
 from ..caada_typing import pathlike
 from ..caada_logging import logger
@@ -59,7 +68,14 @@ def _download_airport_code_data(source_name: str, local_file: pathlike, remote_u
     -------
     None
         Returns nothing, downloads the file to `local_file`.
+
+    Notes
+    -----
+    When redownloading, the server is asked to send the file only if it has changed since the last download, and the
+    new file is written atomically. A lock file next to `local_file` ensures that when several processes need the
+    file at once, only one downloads it.
     """
+    local_file = Path(local_file)
     if update == 'never':
         if local_file.exists():
             logger.debug('%s already exists', local_file)
@@ -80,11 +96,74 @@ def _download_airport_code_data(source_name: str, local_file: pathlike, remote_u
     elif update != 'always':
         raise ValueError('Bad value for update: "{}". Options are "never", "periodically", and "always".'.format(update))
 
+    local_file.parent.mkdir(parents=True, exist_ok=True)
+    with _file_lock(local_file.with_name(local_file.name + '.lock')):
+        # Another process may have finished downloading the file while we waited for the lock, in which case
+        # we can use its download.
+        if update == 'never' and local_file.exists():
+            logger.debug('%s was downloaded by another process', local_file)
+            return
+        elif update == 'periodically' and local_file.exists() and time.time() - os.path.getmtime(local_file) < 7*24*3600:
+            logger.debug('%s was updated by another process', local_file)
+            return
+
+        _conditional_download(source_name, local_file, remote_url)
+
+
+def _conditional_download(source_name: str, local_file: Path, remote_url: str, chunk_size: int = 65536,
+                          timeout: float = 60):
+    """Download a file, skipping the download if it has not changed since the last time.
+
+    The ETag and Last-Modified headers of the last download are saved in a JSON file next to `local_file` and sent
+    as If-None-Match and If-Modified-Since headers, so the server can reply that the file is unchanged. The response
+    is streamed to a temporary file in the same directory which then replaces `local_file`, so other processes never
+    see a partially written file. If the download fails, the existing `local_file` is left as it was. `timeout` is
+    the number of seconds to wait for the server to respond or send more data.
+    """
+    validator_file = local_file.with_name(local_file.name + '.validators.json')
+    headers = dict()
+    if local_file.exists() and validator_file.exists():
+        with open(validator_file) as robj:
+            validators = json.load(robj)
+        if validators.get('url') == remote_url:
+            if validators.get('etag'):
+                headers['If-None-Match'] = validators['etag']
+            if validators.get('last_modified'):
+                headers['If-Modified-Since'] = validators['last_modified']
+
     logger.info('Downloading %s to %s', remote_url, local_file)
-    r = requests.get(remote_url)
-    if r.status_code != 200:
-        raise HTMLRequestError('Error retrieving {} airport codes. HTTP status code was {}'.format(source_name, r.status_code))
+    with requests.get(remote_url, headers=headers, stream=True, timeout=timeout) as r:
+        if r.status_code == 304:
+            # Reset the modification time so that "periodically" waits another week before checking again
+            os.utime(local_file)
+            logger.info('%s is unchanged on the server, keeping existing copy.', remote_url)
+            return
+        elif r.status_code != 200:
+            raise HTMLRequestError('Error retrieving {} airport codes. HTTP status code was {}'.format(source_name, r.status_code))
+
+        with atomic_writer(local_file) as wobj:
+            for chunk in r.iter_content(chunk_size=chunk_size):
+                wobj.write(chunk)
+
+        validators = {'url': remote_url, 'etag': r.headers.get('ETag'), 'last_modified': r.headers.get('Last-Modified')}
 
-    with open(local_file, 'wb') as wobj:
-        wobj.write(r.content)
+    write_atomic(validator_file, json.dumps(validators).encode('utf8'))
     logger.info('Download successful.')
+
+
+@contextmanager
+def _file_lock(lock_file: Path):
+    """Hold an exclusive lock on `lock_file` (created if needed) so that only one process downloads at a time.
+
+    On systems without :mod:`fcntl` (i.e. Windows), no lock is taken.
+    """
+    if fcntl is None:
+        yield
+        return
+
+    with open(lock_file, 'a') as lock_obj:
+        fcntl.flock(lock_obj, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_obj, fcntl.LOCK_UN)
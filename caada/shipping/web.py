@@ -1,36 +1,151 @@
 from bs4 import BeautifulSoup, element as bs4_element
+from concurrent.futures import ThreadPoolExecutor
+import hashlib
+from io import BytesIO
+import json
 import numpy as np
 import pandas as pd
+from pathlib import Path
 import re
 import requests
+import time
 
-from typing import Optional
+from typing import List, Optional, Sequence, Tuple
+
+# lxml is optional (the "fast-html" extra, pip install CAADA[fast-html]); without it, pages are parsed with the much
+# slower BeautifulSoup parser instead
+try:
+    from lxml import etree as lxml_etree
+except ImportError:
+    lxml_etree = None
 
 from .readers import parse_oakland_excel
 
-from ..caada_typing import stringlike
+from ..caada_typing import pathlike, stringlike
+from ..caada_files import write_atomic
 from ..caada_errors import HTMLParsingError, HTMLRequestError
 from ..caada_logging import logger
 
+_default_cache_dir = Path(__file__).parent / 'cache'
+_la_url_template = 'https://www.portoflosangeles.org/business/statistics/container-statistics/historical-teu-statistics-{year:04d}'
+# The last months of a year are posted (and sometimes revised) during the first months of the next, so a year's page is
+# only treated as final once it was downloaded this long after the year ended
+_la_final_after = pd.DateOffset(months=3)
+
+
+class _HTTPCache:
+    """On-disk cache of HTTP responses, with one body file and one JSON metadata file per URL.
+
+    A cached response is revalidated with the server (using its ETag and Last-Modified headers) every time it is
+    requested unless it was fetched after the `immutable_after` time passed to :meth:`get`, in which case it is used
+    without contacting the server at all. The cache directory is only created when the first response is saved.
+    """
+    def __init__(self, cache_dir: Optional[pathlike] = None):
+        self.cache_dir = Path(_default_cache_dir if cache_dir is None else cache_dir)
+
+    def get(self, session: requests.Session, url: str, immutable_after: Optional[pd.Timestamp] = None) -> requests.Response:
+        body_file, meta_file = self._cache_files(url)
+        meta = self._load_meta(meta_file, url)
+        if meta is not None and not body_file.exists():
+            meta = None
+
+        if meta is not None and immutable_after is not None and meta['fetched'] >= immutable_after.timestamp():
+            logger.debug('Using cached copy of %s', url)
+            return self._cached_response(url, body_file)
+
+        headers = dict()
+        if meta is not None:
+            if meta.get('etag'):
+                headers['If-None-Match'] = meta['etag']
+            if meta.get('last_modified'):
+                headers['If-Modified-Since'] = meta['last_modified']
+
+        r = session.get(url, headers=headers)
+        if r.status_code == 304 and meta is not None:
+            logger.debug('%s unchanged on the server, using cached copy', url)
+            meta['fetched'] = time.time()
+            write_atomic(meta_file, json.dumps(meta).encode('utf8'))
+            return self._cached_response(url, body_file)
+        elif r.status_code == 200:
+            self.cache_dir.mkdir(parents=True, exist_ok=True)
+            write_atomic(body_file, r.content)
+            meta = {'url': url, 'fetched': time.time(), 'etag': r.headers.get('ETag'),
+                    'last_modified': r.headers.get('Last-Modified')}
+            write_atomic(meta_file, json.dumps(meta).encode('utf8'))
+        return r
+
+    def _cache_files(self, url):
+        key = hashlib.sha1(url.encode('utf8')).hexdigest()[:16]
+        return self.cache_dir / 'http_{}.body'.format(key), self.cache_dir / 'http_{}.json'.format(key)
+
+    @staticmethod
+    def _load_meta(meta_file, url):
+        try:
+            with open(meta_file) as robj:
+                meta = json.load(robj)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as err:
+            logger.warning('Could not read cached response metadata %s (%s), will download again', meta_file, err)
+            return None
+        return meta if meta.get('url') == url else None
+
+    @staticmethod
+    def _cached_response(url, body_file):
+        r = requests.Response()
+        r.status_code = 200
+        r.url = url
+        with open(body_file, 'rb') as robj:
+            r._content = robj.read()
+        return r
+
+
+def _make_session(max_connections: int) -> requests.Session:
+    session = requests.Session()
+    adapter = requests.adapters.HTTPAdapter(pool_connections=max_connections, pool_maxsize=max_connections)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+
 ##############
 # PORT OF LA #
 ##############
 
 
-def _convert_la_numbers(val):
+def _convert_la_numbers(values: Sequence[str]) -> np.ndarray:
+    """Convert a sequence of number strings from the LA container table to floats all at once"""
+    values = pd.Series(values, dtype=object).str.strip()
     # If there happens to be a ',' two characters from the end, it should probably be a decimal point.
-    val = re.sub(r',\d\d$', '.', val.strip())
+    values = values.str.replace(r',\d\d$', '.', regex=True)
     # Then just remove the remaining commas plus any percent signs
-    val = re.sub(r'[,%]', '', val)
-    try:
-        return float(val)
-    except ValueError:
-        # This will handle empty cells (e.g. that haven't been filled yet) and misformatted cells (e.g. one number was
-        # "2,406.662.05" - two decimal points)
-        return np.nan
+    values = values.str.replace(r'[,%]', '', regex=True)
+    # Coercing to NaN will handle empty cells (e.g. that haven't been filled yet) and misformatted cells (e.g. one
+    # number was "2,406.662.05" - two decimal points)
+    return pd.to_numeric(values, errors='coerce').to_numpy(dtype=np.float64)
+
+
+def _iter_html_elements(html: stringlike, tags: Sequence[str]):
+    """Iterate over the elements with the given tags in an HTML document, using lxml's C parser.
 
+    Elements are yielded once their closing tag is parsed, so they are complete. Only the requested tags generate
+    events, so the rest of the document is never converted to Python objects.
+    """
+    if isinstance(html, str):
+        html = html.encode('utf8')
+    return (el for _, el in lxml_etree.iterparse(BytesIO(html), events=('end',), tag=tags, html=True, recover=True))
+
+
+def _element_text(el) -> str:
+    return ''.join(el.itertext())
+
+
+def _has_class(el, cls: str) -> bool:
+    return cls in el.get('class', '').split()
 
-def get_all_la_port_container_data(index: str = 'datetime') -> pd.DataFrame:
+
+def get_all_la_port_container_data(index: str = 'datetime', max_connections: int = 4, use_cache: bool = True,
+                                   cache_dir: Optional[pathlike] = None, url: str = _la_url_template) -> pd.DataFrame:
     """Get Port of LA container data for all years from 1995 to present.
 
     Parameters
@@ -38,6 +153,12 @@ def get_all_la_port_container_data(index: str = 'datetime') -> pd.DataFrame:
     index
         How to index the dataframe. See the `index` parameter in :func:`get_la_port_container_data` for details.
 
+    max_connections
+        How many years' pages to request at once. All requests share one pool of connections.
+
+    use_cache, cache_dir, url
+        See :func:`get_la_port_container_data`.
+
     Returns
     -------
     pandas.DataFrame
@@ -46,14 +167,21 @@ def get_all_la_port_container_data(index: str = 'datetime') -> pd.DataFrame:
 
     """
     this_year = pd.Timestamp.now().year
-    dfs = []
-    for yr in range(1995, this_year+1):
-        dfs.append( get_la_port_container_data(yr, index=index) )
+    years = list(range(1995, this_year+1))
+    with _make_session(max_connections) as session:
+        def get_year(yr):
+            return get_la_port_container_data(yr, index=index, use_cache=use_cache, cache_dir=cache_dir, url=url,
+                                              session=session)
+
+        with ThreadPoolExecutor(max_workers=max_connections) as pool:
+            dfs = list(pool.map(get_year, years))
 
     return pd.concat(dfs, axis=0)
 
 
-def get_la_port_container_data(year: int, index: str = 'datetime') -> pd.DataFrame:
+def get_la_port_container_data(year: int, index: str = 'datetime', use_cache: bool = True,
+                               cache_dir: Optional[pathlike] = None, url: str = _la_url_template,
+                               session: Optional[requests.Session] = None) -> pd.DataFrame:
     """Get Port of LA container data for a given year, return as a dataframe.
 
     Parameters
@@ -73,6 +201,23 @@ def get_la_port_container_data(year: int, index: str = 'datetime') -> pd.DataFra
         A dataframe containing the data for the requested year. Will be container moves broken down by import vs. export
         and empty vs. full.
 
+    Other Parameters
+    ----------------
+    use_cache
+        Whether to keep the downloaded page in an on-disk cache. Once a year's data are final, its page no longer
+        changes, so a copy downloaded more than three months after the end of that year (allowing time for the last
+        months to be posted) is reused without contacting the server. Other pages are revalidated with the server,
+        and only downloaded again if they changed.
+
+    cache_dir
+        Directory to keep the cache in. If not given, a "cache" directory in the :mod:`caada.shipping` package is used.
+
+    url
+        Template for the page URL, with a `{year}` format field. Usually does not need to change.
+
+    session
+        A :class:`requests.Session` to make the request with. If not given, a new connection is used.
+
     """
     if index == 'datetime':
         parse_year = year
@@ -81,7 +226,13 @@ def get_la_port_container_data(year: int, index: str = 'datetime') -> pd.DataFra
     else:
         raise ValueError('"{}" is not one of the allowed values for index'.format(index))
 
-    r = requests.get('https://www.portoflosangeles.org/business/statistics/container-statistics/historical-teu-statistics-{:04d}'.format(year))
+    page_url = url.format(year=year)
+    if session is None:
+        session = requests
+    if use_cache:
+        r = _HTTPCache(cache_dir).get(session, page_url, immutable_after=pd.Timestamp(year + 1, 1, 1) + _la_final_after)
+    else:
+        r = session.get(page_url)
     if r.status_code == 200:
         return _parse_la_port_html(r.content, parse_year)
     elif r.status_code == 404:
@@ -110,27 +261,11 @@ def _parse_la_port_html(html: stringlike, year: Optional[int] = None) -> pd.Data
     pd.DataFrame
         The dataframe with the container data.
     """
-    soup = BeautifulSoup(html, 'html.parser')
-
-    # Should be exactly one table on the page - find it
-    table = soup('table')
-    if len(table) != 1:
-        raise HTMLParsingError('Expected exactly one table, got {}'.format(len(table)))
-    else:
-        table = table[0]
-
-    # Get the rows of the table - the first will give us the header, the rest will give
-    # us the data. Read it into a dict that can be easily converted to a dataframe
-    tr_tags = table('tr')
-    header = [_stdize_la_table_header(tag.text) for tag in tr_tags[0]('td')]
-    index = []
-    df_dict = {k: [] for k in header[1:]}
-    for row in tr_tags[1:]:
-        row_data = [tag.text.strip() if i == 0 else _convert_la_numbers(tag.text) for i, tag in enumerate(row('td'))]
-        index.append(row_data[0])
-
-        for i, k in enumerate(header[1:], start=1):
-            df_dict[k].append(row_data[i])
+    header, index, cells = _extract_la_table(html)
+    header = [_stdize_la_table_header(h) for h in header]
+    values = _convert_la_numbers([c for row in cells for c in row])
+    values = values.reshape(len(cells), -1) if len(cells) > 0 else np.empty((0, len(header) - 1))
+    df_dict = {k: values[:, i] for i, k in enumerate(header[1:])}
 
     df = pd.DataFrame(df_dict, index=index)
 
@@ -150,6 +285,35 @@ def _parse_la_port_html(html: stringlike, year: Optional[int] = None) -> pd.Data
     return df
 
 
+def _extract_la_table(html: stringlike) -> Tuple[List[str], List[str], List[List[str]]]:
+    """Extract the header cells, row labels, and data cells (as strings) from the one table on an LA container page.
+
+    Uses lxml if available, since that is much faster than BeautifulSoup, otherwise falls back on BeautifulSoup.
+    """
+    if lxml_etree is not None:
+        tables = list(_iter_html_elements(html, ['table']))
+        tr_tags = [[_element_text(td) for td in tr.iter('td')] for tr in tables[0].iter('tr')] if len(tables) == 1 else []
+    else:
+        soup = BeautifulSoup(html, 'html.parser')
+        tables = soup('table')
+        tr_tags = [[td.text for td in tr('td')] for tr in tables[0]('tr')] if len(tables) == 1 else []
+
+    # Should be exactly one table on the page
+    if len(tables) != 1:
+        raise HTMLParsingError('Expected exactly one table, got {}'.format(len(tables)))
+
+    # The first row will give us the header, the rest will give us the data.
+    header = tr_tags[0]
+    ncol = len(header) - 1
+    index = []
+    cells = []
+    for row in tr_tags[1:]:
+        index.append(row[0].strip())
+        # Pad short rows so that every row has one cell per column; the padding becomes NaNs
+        cells.append((row[1:] + [''] * ncol)[:ncol])
+    return header, index, cells
+
+
 def _stdize_la_table_header(column_header: str):
     parts = column_header.strip().split()
     if len(parts) == 0:
@@ -206,7 +370,8 @@ def _fix_la_1995(la_df: pd.DataFrame):
 # PORT OF OAKLAND #
 ###################
 
-def get_oakland_container_data(url: str = 'https://www.oaklandseaport.com/performance/facts-figures/') -> pd.DataFrame:
+def get_oakland_container_data(url: str = 'https://www.oaklandseaport.com/performance/facts-figures/',
+                               use_cache: bool = True, cache_dir: Optional[pathlike] = None) -> pd.DataFrame:
     """Download the full record of Oakland container data
 
     Parameters
@@ -214,11 +379,20 @@ def get_oakland_container_data(url: str = 'https://www.oaklandseaport.com/perfor
     url
         The URL to retrieve from. Usually does not need to change.
 
+    use_cache
+        Whether to keep the container history in an on-disk cache. When `True`, the Excel workbook of past data is only
+        downloaded and parsed again if its link on the page or its ETag/Last-Modified headers change; otherwise only the
+        web page is downloaded and its months are merged into the cached history. Months from earlier versions of the
+        page (or of the workbook, if its link changes) are kept in the history even once they are no longer online.
+
+    cache_dir
+        Directory to keep the cache in. If not given, a "cache" directory in the :mod:`caada.shipping` package is used.
+
     Returns
     -------
     pandas.DataFrame
         A dataframe containing the historical data (extracted from their Excel sheet) and this years data (extracted
-        directly from the web page).
+        directly from the web page). Where both have data for the same month, the web page's values are used.
 
     Notes
     -----
@@ -228,14 +402,50 @@ def get_oakland_container_data(url: str = 'https://www.oaklandseaport.com/perfor
     r = requests.get(url)
     if r.status_code != 200:
         raise HTMLRequestError('Failed to retrieve Oakland container web page (URL = {})'.format(url))
-    soup = BeautifulSoup(r.content, features='html.parser')
 
-    # First try to find the link to the Excel sheet and download it
+    xlsx_url = _find_oakland_xlsx_url(r.content, url)
+    history = _OaklandHistory(cache_dir) if use_cache else None
+    df = history.load() if use_cache else None
+
+    headers = dict() if df is None else history.validator_headers(xlsx_url)
+    r_wb = requests.get(xlsx_url, headers=headers)
+    if r_wb.status_code == 304 and df is not None:
+        logger.debug('Oakland container xlsx file unchanged, using cached history')
+    elif r_wb.status_code != 200:
+        raise HTMLRequestError('Failed to retrieve Oakland container xlsx file (URL = {})'.format(xlsx_url))
+    else:
+        # Parse the Excel file contents first. Keep any months from earlier versions of the web page (or an earlier
+        # workbook, if the link changed) that it does not have.
+        df_wb = parse_oakland_excel(r_wb.content, is_contents=True)
+        df = df_wb if df is None else _merge_oakland_months(df, df_wb)
+        if use_cache:
+            history.set_validators(xlsx_url, r_wb.headers)
+
+    # Then merge in the most recent data from the web page
+    df_recent = _parse_oakland_page(r.content)
+    df = _merge_oakland_months(df, df_recent)
+    if use_cache:
+        history.save(df)
+
+    df = df.copy()
+    df['Total Imports'] = df['Full Imports'] + df['Empty Imports']
+    df['Total Exports'] = df['Full Exports'] + df['Empty Exports']
+    df['Total TEUs'] = df['Total Exports'] + df['Total Imports']
+    return df
+
+
+def _find_oakland_xlsx_url(content: bytes, url: str) -> str:
+    """Find the link to the Excel sheet in the Oakland facts & figures page"""
+    if lxml_etree is not None:
+        hrefs = [el.get('href') for el in _iter_html_elements(content, ['a'])]
+    else:
+        hrefs = [el.attrs.get('href') for el in BeautifulSoup(content, features='html.parser')('a')]
+
     xlsx_url = None
-    for el in soup('a'):
-        if 'href' in el.attrs and 'xlsx' in el.attrs['href']:
+    for href in hrefs:
+        if href is not None and 'xlsx' in href:
             if xlsx_url is None:
-                xlsx_url = el.attrs['href']
+                xlsx_url = href
             else:
                 raise HTMLParsingError('Multiple links to Excel files found on Oakland container page')
 
@@ -246,59 +456,100 @@ def get_oakland_container_data(url: str = 'https://www.oaklandseaport.com/perfor
     if not xlsx_url.startswith('http'):
         schema = url.split('//')[0]
         xlsx_url = '{}{}'.format(schema, xlsx_url)
-    r_wb = requests.get(xlsx_url)
-    if r_wb.status_code != 200:
-        raise HTMLRequestError('Failed to retrieve Oakland container xlsx file (URL = {})'.format(xlsx_url))
-
-    # Parse the Excel file contents first, then append the most recent data from the web page
-    df = parse_oakland_excel(r_wb.content, is_contents=True)
-    df_recent = _parse_oakland_page(r.content)
-
-    df = pd.concat([df, df_recent], axis=0)
-    df['Total Imports'] = df['Full Imports'] + df['Empty Imports']
-    df['Total Exports'] = df['Full Exports'] + df['Empty Exports']
-    df['Total TEUs'] = df['Total Exports'] + df['Total Imports']
-    return df
+    return xlsx_url
+
+
+def _merge_oakland_months(df: pd.DataFrame, new_df: pd.DataFrame) -> pd.DataFrame:
+    """Add the months in `new_df` to `df`, replacing any months both have with the values in `new_df`"""
+    df = df[~df.index.isin(new_df.index)]
+    return pd.concat([df, new_df], axis=0).sort_index()
+
+
+class _OaklandHistory:
+    """On-disk store of the Oakland container history, plus the URL and validators of the workbook it came from"""
+    def __init__(self, cache_dir: Optional[pathlike] = None):
+        cache_dir = Path(_default_cache_dir if cache_dir is None else cache_dir)
+        self.data_file = cache_dir / 'oakland_history.csv'
+        self.meta_file = cache_dir / 'oakland_history.json'
+        self._meta = dict()
+
+    def load(self) -> Optional[pd.DataFrame]:
+        """Load the stored history, or return `None` if there isn't one"""
+        try:
+            with open(self.meta_file) as robj:
+                self._meta = json.load(robj)
+            df = pd.read_csv(self.data_file, index_col=0, parse_dates=True, float_precision='round_trip')
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as err:
+            logger.warning('Could not read cached Oakland history (%s), will download it again', err)
+            return None
+        return df
+
+    def validator_headers(self, xlsx_url: str) -> dict:
+        """Get the headers to conditionally request the workbook, empty if the history came from a different URL"""
+        headers = dict()
+        if self._meta.get('xlsx_url') != xlsx_url:
+            logger.info('Oakland container xlsx link changed, will download it again')
+            return headers
+        if self._meta.get('etag'):
+            headers['If-None-Match'] = self._meta['etag']
+        if self._meta.get('last_modified'):
+            headers['If-Modified-Since'] = self._meta['last_modified']
+        return headers
+
+    def set_validators(self, xlsx_url: str, response_headers):
+        self._meta = {'xlsx_url': xlsx_url, 'etag': response_headers.get('ETag'),
+                      'last_modified': response_headers.get('Last-Modified')}
+
+    def save(self, df: pd.DataFrame):
+        # Write the data before the metadata: if writing the metadata fails, the old validators will no longer match
+        # the workbook on the server, so it will just be downloaded and parsed again next time.
+        self.data_file.parent.mkdir(parents=True, exist_ok=True)
+        write_atomic(self.data_file, df.to_csv().encode('utf8'))
+        write_atomic(self.meta_file, json.dumps(self._meta).encode('utf8'))
 
 
 def _parse_oakland_page(content: bytes):
     """Parse the Oakland facts & figures page to extract a dataframe of container moves"""
-    soup = BeautifulSoup(content, features='html.parser')
+    if lxml_etree is not None:
+        headings = []
+        charts = []
+        for el in _iter_html_elements(content, ['h2', 'div']):
+            if el.tag == 'h2':
+                headings.append(_element_text(el))
+            elif _has_class(el, 'chart-wrapper'):
+                charts.append(_parse_one_oakland_chart_lxml(el))
+    else:
+        soup = BeautifulSoup(content, features='html.parser')
+        headings = [heading.text for heading in soup.find_all('h2')]
+        charts = [_parse_one_oakland_chart(c) for c in soup.find_all('div', attrs={'class': 'chart-wrapper'})]
 
     # Try to find the year in the page headings. Usually the first <h2> element
     # is something like: <h2 style="text-align: center;">2020 Container Activity (TEUs)</h2>
     year = None
-    for heading in soup.find_all('h2'):
-        m = re.search(r'\d{4}', heading.text)
+    for heading in headings:
+        m = re.search(r'\d{4}', heading)
         if m:
             year = int(m.group())
             break
     if year is None:
         raise HTMLParsingError('Could not identify year in Oakland port data page')
 
-    charts = soup.find_all('div', attrs={'class': 'chart-wrapper'})
     chart_data = dict()
 
     # The last chart is a summary of past years' total TEUs so we skip it
-    for c in charts[:-1]:
-        category, months, teus = _parse_one_oakland_chart(c)
+    for category, month_names, teus in charts[:-1]:
+        months = pd.to_datetime(pd.Series(month_names, dtype=object), format='%b').dt.month
         dtind = pd.DatetimeIndex([pd.Timestamp(year, m, 1) for m in months])
-        chart_data[category] = pd.Series(teus, index=dtind)
+        chart_data[category] = pd.Series(_convert_oakland_numbers(teus), index=dtind)
 
-    # Compute the total for convenience and make sure the totals are in order
     return pd.DataFrame(chart_data)
-    # col_order = df.columns.tolist()
-    # df['Total Imports'] = df['Full Imports'] + df['Empty Imports']
-    # df['Total Exports'] = df['Full Exports'] + df['Empty Exports']
-    # df['Total TEUs'] = df['Total Imports'] + df['Total Exports']
-    # col_order.append('Total Imports')
-    # col_order.append('Total Exports')
-    # col_order.append('Total TEUs')
-    # return df[col_order]
 
 
 def _parse_one_oakland_chart(chart: bs4_element):
-    """Parse one of the charts on the Oakland page"""
+    """Parse one of the charts on the Oakland page with BeautifulSoup, returning the title, month names, and number
+    strings"""
     title_el = chart.find('div', attrs={'class': 'chart-vertical-title'})
     title = title_el.text
 
@@ -306,10 +557,31 @@ def _parse_one_oakland_chart(chart: bs4_element):
     months = []
     teus = []
     for el in data_els:
-        month = pd.to_datetime(el.attrs['title'], format='%b').month
         num_el = el.find('span', attrs={'class': 'number'})
-        num = np.nan if len(num_el.text) == 0 else np.float(num_el.text.replace(',', ''))
-        months.append(month)
-        teus.append(num)
+        months.append(el.attrs['title'])
+        teus.append(num_el.text)
 
     return title, months, teus
+
+
+def _parse_one_oakland_chart_lxml(chart):
+    """Parse one of the charts on the Oakland page from an lxml element, with the same output as
+    :func:`_parse_one_oakland_chart`"""
+    title = None
+    months = []
+    teus = []
+    for el in chart.iter('div', 'li'):
+        if el.tag == 'div' and title is None and _has_class(el, 'chart-vertical-title'):
+            title = _element_text(el)
+        elif el.tag == 'li' and el.get('title') is not None:
+            num_el = next(span for span in el.iter('span') if _has_class(span, 'number'))
+            months.append(el.get('title'))
+            teus.append(_element_text(num_el))
+
+    return title, months, teus
+
+
+def _convert_oakland_numbers(values: Sequence[str]) -> np.ndarray:
+    """Convert the Oakland chart number strings to floats all at once. Empty strings become NaNs."""
+    values = pd.Series(values, dtype=object).str.replace(',', '', regex=False)
+    return pd.to_numeric(values.where(values.str.len() > 0)).to_numpy(dtype=np.float64)
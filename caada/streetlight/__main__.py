@@ -0,0 +1,11 @@
+from argparse import ArgumentParser
+from ..caada_cli import LazyDriver
+
+
+def parse_streetlight_agg_args(p: ArgumentParser):
+    p.description = 'Convert the Streetlight VMT data into a county x time netCDF file'
+    p.add_argument('vmt_file', help='The Streetlight VMT file, either the .xlsx file or converted to .csv.')
+    p.add_argument('save_path', help='The path to save the netCDF file as (including filename).')
+    p.add_argument('--variables', nargs='+', help='Which variables to include. Default is all numeric variables.')
+    p.add_argument('--sheet-name', help='For .xlsx files, which sheet contains the data. Default is the first.')
+    p.set_defaults(driver_fxn=LazyDriver('.agglomeration', 'agglomerate_streetlight', __package__))
@@ -0,0 +1,123 @@
+"""
+This module contains functions for converting the Streetlight VMT data into a county x time netCDF file.
+"""
+
+import netCDF4 as ncdf
+import numpy as np
+import pandas as pd
+from pathlib import Path
+from time import perf_counter
+from typing import Optional
+
+from jllutils.subutils import ncdf as ncio
+
+from . import readers
+from .. import common_utils, common_ancillary
+from ..caada_logging import logger
+from ..caada_typing import pathlike, strseq
+
+_variable_attrs = {
+    'county_vmt': dict(units='miles/day', description='Vehicle miles traveled in the county each day'),
+    'jan_avg_vmt': dict(units='miles/day', description='Average daily vehicle miles traveled in the county in January 2020'),
+    'percent_change_from_jan': dict(units='%', description='Percent change in county_vmt from jan_avg_vmt'),
+}
+
+
+def agglomerate_streetlight(vmt_file: pathlike, save_path: pathlike, variables: Optional[strseq] = None,
+                            sheet_name: Optional[str] = None):
+    """Convert the Streetlight VMT data into a county x time netCDF file
+
+    Parameters
+    ----------
+    vmt_file
+        The Streetlight VMT file, either the Excel .xlsx file or converted to .csv.
+
+    save_path
+        The name to give the netCDF file produced. Will be overwritten if exists!
+
+    variables
+        Which variables from the VMT file to include. By default, all numeric variables are included.
+
+    sheet_name
+        For .xlsx files, which sheet has the data. Default is the first sheet.
+
+    Returns
+    -------
+    None
+    """
+    vmt_file = Path(vmt_file)
+    timings = dict()
+    t0 = perf_counter()
+    logger.info('Reading {}'.format(vmt_file))
+    if vmt_file.suffix.lower() == '.xlsx':
+        vmt = readers.load_streetlight_xlsx(vmt_file, sheet_name=sheet_name, normalized=True)
+    else:
+        vmt = readers.load_streetlight_csv(vmt_file, normalized=True)
+
+    data = vmt.data
+    timings['read'] = perf_counter() - t0
+    t0 = perf_counter()
+    if variables is None:
+        variables = [c for c in data.columns if c not in ('statefp', 'countyfp')
+                     and pd.api.types.is_numeric_dtype(data[c]) and not isinstance(data[c].dtype, pd.CategoricalDtype)]
+
+    arrays, fips, times = _pivot_to_county_time(data, variables)
+    county_names = None
+    if 'county_name' in data.columns:
+        county_names = data.groupby(data['statefp'].astype(np.int64) * 1000 + data['countyfp'], sort=False)['county_name'].first()
+        county_names = county_names.reindex(fips).astype(object).fillna('').to_numpy()
+
+    timings['pivot'] = perf_counter() - t0
+
+    logger.info('Writing {}'.format(save_path))
+    provenance = dict(input_files=[vmt_file], parameters=dict(variables=list(variables), sheet_name=sheet_name),
+                      timings=timings)
+    _save_streetlight_file(save_path, arrays, fips, times, county_names=county_names, provenance=provenance)
+
+
+def _pivot_to_county_time(data: pd.DataFrame, variables):
+    """Scatter the long VMT table into county x time arrays. Returns the arrays, the 5-digit county FIPS codes, and
+    the times."""
+    fips = data['statefp'].to_numpy().astype(np.int64) * 1000 + data['countyfp'].to_numpy()
+    county_inds, counties = pd.factorize(fips, sort=True)
+    time_inds, times = pd.factorize(data['datetime'], sort=True)
+
+    arrays = dict()
+    for var in variables:
+        arr = np.full((counties.size, times.size), np.nan, dtype=np.float32)
+        arr[county_inds, time_inds] = data[var].to_numpy(dtype=np.float32, na_value=np.nan)
+        arrays[var] = arr
+    return arrays, np.asarray(counties), pd.DatetimeIndex(times)
+
+
+def _save_streetlight_file(save_path, arrays, fips, times, county_names=None, provenance=None):
+    state_ids = fips // 1000
+    county_ids = fips % 1000
+    with ncdf.Dataset(save_path, 'w') as ds:
+        time = ncio.make_nctimedim_helper(ds, 'time', times, time_units='days')
+        county = ncio.make_ncdim_helper(ds, 'county', np.arange(fips.size), description='Index for the counties')
+        ncio.make_ncvar_helper(ds, 'county_id', county_ids, [county],
+                               description='Census ID of the county, unique only within a state')
+        ncio.make_ncvar_helper(ds, 'state_id', state_ids, [county],
+                               description='Census ID of the state that each county is in')
+
+        if county_names is None:
+            gdf = common_ancillary.get_poly_gdf_subset(None, None).set_index(['statefp', 'countyfp'])
+            county_names = gdf['name'].reindex(pd.MultiIndex.from_arrays([state_ids, county_ids])).fillna('').to_numpy()
+        name_var = ds.createVariable('county_name', str, county.name)
+        for i, n in enumerate(county_names):
+            name_var[i] = n
+
+        common_ancillary.add_county_polys_to_ncdf(ds, county_ids=county_ids.tolist(), state_ids=state_ids.tolist(),
+                                                  county_dimension=county.name)
+
+        # Chunk so that one county's whole time series is contiguous, since that is the most common access pattern
+        for varname, arr in arrays.items():
+            var = ds.createVariable(varname, 'f4', (county.name, time.name), zlib=True, fill_value=np.nan,
+                                    chunksizes=(1, max(arr.shape[1], 1)))
+            var[:] = arr
+            for attr, value in _variable_attrs.get(varname, dict()).items():
+                var.setncattr(attr, value)
+
+        ds.setncattr('source', 'Streetlight Data VMT data (https://www.streetlightdata.com/)')
+        common_utils.add_caada_info(ds, **(provenance or dict()))
@@ -1,32 +1,193 @@
+from datetime import datetime
+from itertools import islice
 import geopandas as gpd
+import numpy as np
 import pandas as pd
+from typing import Optional, Union
 
-from .. import common_ancillary
+from .. import common_ancillary, common_utils
 from ..caada_typing import pathlike
 
-# TODO: allow directly loading the Streetlight XLSX file if the excel package is installed
 
+class StreetlightVMT:
+    """Streetlight VMT data with the county geometry kept in a separate table.
 
-def load_streetlight_csv(filename: pathlike) -> gpd.GeoDataFrame:
+    Rather than repeating each county's polygon on every row, the VMT data are kept as a plain dataframe keyed by the
+    integer state and county FIPS codes (`statefp` and `countyfp`), and the county polygons are only looked up the first
+    time :attr:`geometry` or :meth:`to_geodataframe` is used.
+
+    Parameters
+    ----------
+    data
+        The VMT dataframe. Must have integer `statefp` and `countyfp` columns.
+    """
+    def __init__(self, data: pd.DataFrame):
+        self.data = data
+        self._geometry = None
+
+    @property
+    def counties(self) -> pd.MultiIndex:
+        """The unique (statefp, countyfp) pairs in the data, sorted."""
+        return pd.MultiIndex.from_frame(self.data[['statefp', 'countyfp']].drop_duplicates()).sort_values()
+
+    @property
+    def geometry(self) -> gpd.GeoDataFrame:
+        """A geodataframe with one row per county in the data, indexed by (statefp, countyfp)"""
+        if self._geometry is None:
+            gdf = common_ancillary.get_poly_gdf_subset(None, None)[['statefp', 'countyfp', 'name', 'geometry']]
+            gdf = gdf.set_index(['statefp', 'countyfp'])
+            self._geometry = gdf.reindex(self.counties)
+        return self._geometry
+
+    def to_geodataframe(self) -> gpd.GeoDataFrame:
+        """Join the VMT data with the county geometry
+
+        Returns
+        -------
+        geopandas.GeoDataFrame
+            The same geodataframe returned by :func:`load_streetlight_csv` with `normalized=False`.
+        """
+        return _join_streetlight_with_geometry(self.data)
+
+
+def load_streetlight_csv(filename: pathlike, normalized: bool = False) -> Union[gpd.GeoDataFrame, StreetlightVMT]:
     """Load the Streetlight VMT data from a .csv file as a Geodataframe with county geometry included
 
     Parameters
     ----------
     filename
-        Path to the Streetlight VMT file. Note that at present it MUST be converted to a .csv file - directly loading
-        the Excel file is not yet supported.
+        Path to the Streetlight VMT file converted to .csv. To load the Excel file directly, use
+        :func:`load_streetlight_xlsx`.
+
+    normalized
+        If `True`, return a :class:`StreetlightVMT` instance that keeps the VMT data and county geometry separate
+        instead of a geodataframe. This is much faster and uses much less memory for large files, since each county's
+        geometry is not repeated for every day.
+
+    Returns
+    -------
+    geopandas.GeoDataFrame or StreetlightVMT
+        A geodataframe with the VMT data, joined with the county geometry, or the normalized data if `normalized` is
+        `True`.
+    """
+    return _finish_streetlight_frame(pd.read_csv(filename), normalized)
+
+
+def load_streetlight_xlsx(filename: pathlike, sheet_name: Optional[str] = None, normalized: bool = False,
+                          chunk_size: int = 10000) -> Union[gpd.GeoDataFrame, StreetlightVMT]:
+    """Load the Streetlight VMT data directly from the Excel .xlsx file
+
+    The workbook is opened in read-only mode with the same XML protections as
+    :func:`~caada.common_utils.secure_open_workbook` (see :func:`~caada.common_utils.secure_open_xlsx_workbook`), and
+    its rows are streamed into one typed buffer per column, so the full workbook is never held in memory. Requires the
+    `openpyxl` package (``pip install CAADA[xlsx]``).
+
+    Parameters
+    ----------
+    filename
+        Path to the Streetlight VMT .xlsx file.
+
+    sheet_name
+        Which sheet in the workbook has the data. If not given, the first sheet is used.
+
+    normalized
+        See :func:`load_streetlight_csv`.
+
+    chunk_size
+        How many rows to read at a time before converting them into the column buffers.
 
     Returns
     -------
-    geopandas.GeoDataFrame
-        A geodataframe with the VMT data, joined with the county geometry 
+    geopandas.GeoDataFrame or StreetlightVMT
+        The same output as :func:`load_streetlight_csv` would give for the file converted to .csv.
     """
-    df = pd.read_csv(filename)
-    df['datetime'] = pd.DatetimeIndex(df['ref_dt'])
+    wb = common_utils.secure_open_xlsx_workbook(filename)
+    try:
+        ws = wb.worksheets[0] if sheet_name is None else wb[sheet_name]
+        rows = ws.iter_rows(values_only=True)
+        header = next(rows)
+        ncol = len(header)
+        while ncol > 0 and header[ncol-1] is None:
+            ncol -= 1
+        buffers = [_ColumnBuffer() for _ in range(ncol)]
+        pad = (None,) * ncol
+        while True:
+            # Convert the rows in chunks, so that each column is converted to a typed array a chunk at a time
+            chunk = [(row + pad)[:ncol] for row in islice(rows, chunk_size)]
+            if len(chunk) == 0:
+                break
+            chunk = [row for row in chunk if row != pad]
+            if len(chunk) == 0:
+                continue
+            for buf, col in zip(buffers, zip(*chunk)):
+                buf.extend(col)
+    finally:
+        wb.close()
+
+    df = pd.DataFrame({str(h): buf.to_array() for h, buf in zip(header, buffers)})
+    return _finish_streetlight_frame(df, normalized)
+
+
+def _finish_streetlight_frame(df, normalized):
+    df['datetime'] = pd.to_datetime(df['ref_dt'], cache=True)
     df.drop(columns=['ref_dt'], inplace=True)
-    return _join_streetlight_with_geometry(df)
+    if normalized:
+        return StreetlightVMT(_compact_streetlight_frame(df))
+    else:
+        return _join_streetlight_with_geometry(df)
+
+
+def _compact_streetlight_frame(df: pd.DataFrame) -> pd.DataFrame:
+    for col in ('statefp', 'countyfp'):
+        df[col] = pd.to_numeric(df[col], downcast='integer')
+    for col in df.columns:
+        if pd.api.types.is_object_dtype(df[col].dtype) or pd.api.types.is_string_dtype(df[col].dtype):
+            # State and county names repeat for every day, so are much smaller as categoricals
+            df[col] = df[col].astype('category')
+    return df
 
 
 def _join_streetlight_with_geometry(st_df):
     gdf = common_ancillary.get_poly_gdf_subset(None, None)[['statefp', 'countyfp', 'geometry']]
-    return gpd.GeoDataFrame(st_df.merge(gdf, on=['statefp', 'countyfp'], how='left'), crs=str(gdf.crs))
\ No newline at end of file
+    return gpd.GeoDataFrame(st_df.merge(gdf, on=['statefp', 'countyfp'], how='left'), crs=str(gdf.crs))
+
+
+class _ColumnBuffer:
+    """Accumulates one column of values as a list of typed numpy chunks"""
+    _numeric_types = {int, float, type(None)}
+
+    def __init__(self):
+        self._chunks = []
+        self._kinds = set()
+
+    def extend(self, values: tuple):
+        types = set(map(type, values))
+        if types == {int}:
+            self._chunks.append(np.array(values, dtype=np.int64))
+            self._kinds.add('int')
+        elif types <= self._numeric_types:
+            # None becomes NaN
+            self._chunks.append(np.array(values, dtype=np.float64))
+            self._kinds.add('float')
+        else:
+            self._chunks.append(np.array(values, dtype=object))
+            self._kinds.add('object')
+
+    def to_array(self):
+        if len(self._chunks) == 0:
+            return np.array([], dtype=np.float64)
+        elif self._kinds == {'int'}:
+            return np.concatenate(self._chunks)
+        elif self._kinds <= {'int', 'float'}:
+            return np.concatenate([c.astype(np.float64) for c in self._chunks])
+
+        values = np.concatenate([c.astype(object) for c in self._chunks])
+        if all(isinstance(v, datetime) or v is None for v in values):
+            return pd.DatetimeIndex(values).to_numpy()
+        else:
+            # Convert numbers stored as text to numeric, as reading a .csv would, and otherwise let pandas infer the type
+            series = pd.Series(values.tolist())
+            try:
+                return pd.to_numeric(series)
+            except (ValueError, TypeError):
+                return series
@@ -1,4 +1,33 @@
+import json
+import os
+import subprocess
 from setuptools import setup, find_packages
+from setuptools.command.build_py import build_py
+
+
+def _git_build_info():
+    """Get the commit, branch, and clean status of the source tree, or `None` if git is not available"""
+    def git(*args):
+        return subprocess.run(['git'] + list(args), cwd=os.path.dirname(os.path.abspath(__file__)),
+                              stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, check=True, timeout=30,
+                              universal_newlines=True).stdout.strip()
+    try:
+        return {'commit': git('rev-parse', 'HEAD'),
+                'branch': git('rev-parse', '--abbrev-ref', 'HEAD'),
+                'clean': len(git('status', '--porcelain', '--untracked-files=no')) == 0}
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+class BuildPyWithGitInfo(build_py):
+    """Record which commit is being installed, so that caada.common_utils.add_caada_info does not need git later"""
+    def run(self):
+        super().run()
+        info = _git_build_info()
+        if info is not None and not self.dry_run:
+            with open(os.path.join(self.build_lib, 'caada', '_build_info.json'), 'w') as wobj:
+                json.dump(info, wobj)
+
 
 setup(
     name='CAADA',
@@ -11,7 +40,11 @@ setup(
                       'netCDF4',
                       'numpy',
                       'pandas'],
+    extras_require={'fast-html': ['lxml'],
+                    'store': ['pyarrow'],
+                    'xlsx': ['openpyxl']},
     include_package_data=True,
+    cmdclass={'build_py': BuildPyWithGitInfo},
     entry_points={
             'console_scripts': ['caada-main=caada.__main__:main']
         },
@@ -0,0 +1,65 @@
+import csv
+
+import pytest
+
+from caada import opensky
+
+# A few rows in the format of the Openflights airports.dat file: id, name, city, country, IATA code, ICAO code,
+# latitude, longitude, elevation (ft), UTC offset (h), DST group, time zone, type, source
+_test_airports = [
+    (1, 'Los Angeles International Airport', 'Los Angeles', 'United States', 'LAX', 'KLAX', 33.94, -118.41, 125.0,
+     -8, 'A', 'America/Los_Angeles', 'airport', 'OurAirports'),
+    (2, 'San Francisco International Airport', 'San Francisco', 'United States', 'SFO', 'KSFO', 37.62, -122.37, 13.0,
+     -8, 'A', 'America/Los_Angeles', 'airport', 'OurAirports'),
+    (3, 'London Heathrow Airport', 'London', 'United Kingdom', 'LHR', 'EGLL', 51.47, -0.46, 83.0,
+     0, 'E', 'Europe/London', 'airport', 'OurAirports'),
+    (4, 'Sydney Kingsford Smith International Airport', 'Sydney', 'Australia', 'SYD', 'YSSY', -33.95, 151.18, 21.0,
+     10, 'O', 'Australia/Sydney', 'airport', 'OurAirports'),
+]
+
+
+@pytest.fixture
+def airport_codes(tmp_path, monkeypatch):
+    """Point the Openflights airport code source at a small local file so that no download is needed"""
+    local_file = tmp_path / 'openflights_airport_codes.csv'
+    with open(local_file, 'w', newline='') as wobj:
+        csv.writer(wobj).writerows(_test_airports)
+    monkeypatch.setitem(opensky.airport_code_sources, 'openflights',
+                        dict(local=local_file, remote='http://localhost/airports.dat'))
+    return local_file
+
+
+def _cems_rows(states=('CA',), dates=('01-01-2019',), hours=(0, 1), units=((1, '1'), (2, 'GT1')), daily=False):
+    """Make rows of a CEMS .csv file, one per state, date, hour (unless daily), and (facility, unit)"""
+    rows = []
+    for state in states:
+        for date in dates:
+            for hour in ([None] if daily else hours):
+                for fac_id, unit_id in units:
+                    so2 = 10.0 * fac_id + (0 if hour is None else hour)
+                    row = {'STATE': state, 'FACILITY_NAME': 'Plant {}'.format(fac_id), 'ORISPL_CODE': 1000 + fac_id,
+                           'UNITID': unit_id, 'OP_DATE': date}
+                    if not daily:
+                        row['OP_HOUR'] = hour
+                    row.update({'SO2_MASS (lbs)': so2, 'NOX_MASS (lbs)': 2 * so2, 'CO2_MASS (tons)': 100 * so2,
+                                'FAC_ID': fac_id, 'UNIT_ID': unit_id})
+                    rows.append(row)
+    return rows
+
+
+@pytest.fixture
+def make_cems_file(tmp_path):
+    """Return a function that writes a small synthetic CEMS .csv (or .zip) file; see _cems_rows for its arguments"""
+    def make(name, zipped=False, **kwargs):
+        import pandas as pd
+        from zipfile import ZipFile
+
+        csv_text = pd.DataFrame(_cems_rows(**kwargs)).to_csv(index=False)
+        path = tmp_path / name
+        if zipped:
+            with ZipFile(path, 'w') as z:
+                z.writestr(path.with_suffix('.csv').name, csv_text)
+        else:
+            path.write_text(csv_text)
+        return path
+    return make
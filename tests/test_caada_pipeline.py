@@ -0,0 +1,213 @@
+import os
+from pathlib import Path
+
+import pytest
+
+from caada.caada_pipeline import Pipeline
+
+
+def copy_upper(src, dst, log='runs.log'):
+    """Pipeline stage function for these tests: writes `src` in upper case to `dst` and records that it ran"""
+    # Stages run in worker processes with the pipeline directory as the working directory
+    Path(dst).write_text(Path(src).read_text().upper())
+    with open(log, 'a') as wobj:
+        wobj.write(dst + '\n')
+
+
+def fail(**kwargs):
+    raise RuntimeError('This stage always fails')
+
+
+_two_stages = """
+fingerprint = "{fingerprint}"
+
+[stages.first]
+function = "{module}:copy_upper"
+kwargs = {{src = "raw.txt", dst = "first.txt"}}
+inputs = ["raw.txt"]
+outputs = ["first.txt"]
+
+[stages.second]
+function = "{module}:copy_upper"
+kwargs = {{src = "first.txt", dst = "second.txt"}}
+inputs = ["first.txt"]
+outputs = ["second.txt"]
+"""
+
+
+def _write_pipeline(tmp_path, text, **fmt):
+    pipeline_file = tmp_path / 'pipeline.toml'
+    pipeline_file.write_text(text.format(module=__name__, **fmt))
+    return pipeline_file
+
+
+def _runs(tmp_path):
+    log = tmp_path / 'runs.log'
+    runs = log.read_text().split() if log.exists() else []
+    log.unlink(missing_ok=True)
+    return runs
+
+
+def _touch_later(path):
+    # Move the modification time forward explicitly, in case the file system's timestamps are coarse
+    st = path.stat()
+    os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns + 1_000_000_000))
+
+
+@pytest.fixture
+def two_stages(tmp_path):
+    (tmp_path / 'raw.txt').write_text('abc')
+
+    def make(fingerprint='mtime'):
+        return Pipeline(_write_pipeline(tmp_path, _two_stages, fingerprint=fingerprint))
+    return make
+
+
+def test_dependencies_from_inputs_and_outputs(tmp_path):
+    pipeline_file = _write_pipeline(tmp_path, """
+[stages.a]
+command = "os-covid"
+inputs = ["raw/*.csv"]
+outputs = ["out/a"]
+
+[stages.b]
+command = "os-covid"
+inputs = ["out/a/summary.nc"]
+outputs = ["b.nc"]
+
+[stages.c]
+command = "os-covid"
+inputs = ["b.nc"]
+depends_on = ["a"]
+""")
+    assert Pipeline(pipeline_file).dependencies == {'a': set(), 'b': {'a'}, 'c': {'a', 'b'}}
+
+
+def test_cycles_rejected(tmp_path):
+    pipeline_file = _write_pipeline(tmp_path, """
+[stages.a]
+command = "os-covid"
+inputs = ["c.nc"]
+outputs = ["a.nc"]
+
+[stages.b]
+command = "os-covid"
+inputs = ["a.nc"]
+outputs = ["b.nc"]
+
+[stages.c]
+command = "os-covid"
+inputs = ["b.nc"]
+outputs = ["c.nc"]
+
+[stages.d]
+command = "os-covid"
+outputs = ["d.nc"]
+""")
+    with pytest.raises(ValueError, match='circular dependencies: a, b, c$'):
+        Pipeline(pipeline_file)
+
+
+def test_unknown_dependency_rejected(tmp_path):
+    pipeline_file = _write_pipeline(tmp_path, """
+[stages.a]
+command = "os-covid"
+depends_on = ["download"]
+""")
+    with pytest.raises(ValueError, match='unknown stage'):
+        Pipeline(pipeline_file)
+
+
+def test_mtime_fingerprint(tmp_path, two_stages):
+    stage = two_stages().stages['first']
+    fingerprint = stage.inputs_fingerprint('mtime')
+    assert stage.inputs_fingerprint('mtime') == fingerprint
+    _touch_later(tmp_path / 'raw.txt')
+    assert stage.inputs_fingerprint('mtime') != fingerprint
+
+
+def test_content_fingerprint(tmp_path, two_stages):
+    stage = two_stages().stages['first']
+    fingerprint = stage.inputs_fingerprint('content')
+    _touch_later(tmp_path / 'raw.txt')
+    assert stage.inputs_fingerprint('content') == fingerprint
+    (tmp_path / 'raw.txt').write_text('abd')
+    assert stage.inputs_fingerprint('content') != fingerprint
+
+
+def test_fingerprint_excludes_outputs(tmp_path):
+    (tmp_path / 'data').mkdir()
+    (tmp_path / 'data' / 'in.csv').write_text('1')
+    pipeline_file = _write_pipeline(tmp_path, """
+[stages.a]
+command = "os-covid"
+inputs = ["data"]
+outputs = ["data/*.nc"]
+""")
+    stage = Pipeline(pipeline_file).stages['a']
+    fingerprint = stage.inputs_fingerprint('mtime')
+    # Writing its own output into its input directory must not make the stage out of date
+    (tmp_path / 'data' / 'out.nc').write_text('2')
+    assert stage.input_files() == [tmp_path / 'data' / 'in.csv']
+    assert stage.inputs_fingerprint('mtime') == fingerprint
+
+
+def test_missing_input(tmp_path, two_stages):
+    (tmp_path / 'raw.txt').unlink()
+    with pytest.raises(IOError, match='raw.txt'):
+        two_stages().stages['first'].inputs_fingerprint('mtime')
+
+
+@pytest.mark.parametrize('fingerprint', ['mtime', 'content'])
+def test_changed_input_reruns(tmp_path, two_stages, fingerprint):
+    assert two_stages(fingerprint).run() == {'first': 'ran', 'second': 'ran'}
+    assert _runs(tmp_path) == ['first.txt', 'second.txt']
+    assert (tmp_path / 'second.txt').read_text() == 'ABC'
+
+    assert two_stages(fingerprint).run() == {'first': 'skipped', 'second': 'skipped'}
+    assert _runs(tmp_path) == []
+
+    # A new input reruns the stage that reads it, and so every stage downstream of it
+    (tmp_path / 'raw.txt').write_text('xyz')
+    _touch_later(tmp_path / 'raw.txt')
+    assert two_stages(fingerprint).run() == {'first': 'ran', 'second': 'ran'}
+    assert _runs(tmp_path) == ['first.txt', 'second.txt']
+    assert (tmp_path / 'second.txt').read_text() == 'XYZ'
+
+
+def test_intermediate_change_reruns_downstream_only(tmp_path, two_stages):
+    two_stages().run()
+    _runs(tmp_path)
+    (tmp_path / 'first.txt').write_text('changed')
+    assert two_stages().run() == {'first': 'skipped', 'second': 'ran'}
+    assert (tmp_path / 'second.txt').read_text() == 'CHANGED'
+
+
+def test_missing_output_or_new_parameters_rerun(tmp_path, two_stages):
+    two_stages().run()
+    (tmp_path / 'second.txt').unlink()
+    assert two_stages().run() == {'first': 'skipped', 'second': 'ran'}
+
+    pipeline_file = tmp_path / 'pipeline.toml'
+    pipeline_file.write_text(pipeline_file.read_text().replace('dst = "first.txt"', 'dst = "first.txt", log = "x.log"'))
+    assert Pipeline(pipeline_file).run() == {'first': 'ran', 'second': 'ran'}
+
+
+def test_dry_run_and_force(tmp_path, two_stages):
+    assert two_stages().run(dry_run=True) == {'first': 'would run', 'second': 'would run'}
+    assert not (tmp_path / 'first.txt').exists()
+    assert not (tmp_path / 'pipeline.state.json').exists()
+
+    two_stages().run()
+    assert two_stages().run(force=True) == {'first': 'ran', 'second': 'ran'}
+
+
+def test_failure_blocks_downstream(tmp_path, two_stages):
+    pipeline_file = tmp_path / 'pipeline.toml'
+    two_stages()
+    pipeline_file.write_text(pipeline_file.read_text().replace('copy_upper"\nkwargs = {src = "raw.txt"',
+                                                               'fail"\nkwargs = {src = "raw.txt"'))
+    with pytest.raises(RuntimeError, match='first'):
+        Pipeline(pipeline_file).run()
+    assert _runs(tmp_path) == []
+    assert not (tmp_path / 'pipeline.state.json').exists()
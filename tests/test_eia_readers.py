@@ -0,0 +1,84 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from caada.eia import readers
+
+
+def _write_chart(path, title, columns, rows):
+    """Write a file in the format of the EIA electricity data browser CHART download"""
+    lines = [title, 'https://www.eia.gov/electricity/data/browser/', 'Source: U.S. Energy Information Administration',
+             '', 'Month,' + ','.join(columns)]
+    for month, values in rows:
+        lines.append(month + ',' + ','.join('' if v is None else str(v) for v in values))
+    # The blank line must not be skipped, as pandas would with a truly empty line, or the header would move
+    path.write_text('\n'.join(line if line else '""' for line in lines) + '\n')
+    return path
+
+
+@pytest.fixture
+def chart_files(tmp_path):
+    gwh = 'thousand megawatthours'
+    sales = _write_chart(tmp_path / 'sales.csv', 'Retail sales of electricity : monthly',
+                         ['California all sectors ' + gwh, 'California residential ' + gwh, 'Nevada residential ' + gwh],
+                         [('Jan 2001', (20.0, 8.0, 2.0)), ('Feb 2001', (19.0, 7.0, None))])
+    # Same units as the sales, but a different metric
+    generation = _write_chart(tmp_path / 'generation.csv', 'Net generation for all sectors : monthly',
+                              ['California all sectors ' + gwh], [('Feb 2001', (15.0,)), ('Mar 2001', (16.0,))])
+    price = _write_chart(tmp_path / 'price.csv', 'Average retail price of electricity : monthly',
+                         ['California residential cents per kilowatthour'], [('Jan 2001', (10.5,))])
+    return sales, generation, price
+
+
+def test_cube_keys_by_metric_and_units(chart_files):
+    cube = readers.load_eia_cube(chart_files, n_threads=1)
+    gwh = 'thousand megawatthours'
+    assert cube.variables == [('Retail sales of electricity', gwh), ('Net generation for all sectors', gwh),
+                              ('Average retail price of electricity', 'cents per kilowatthour')]
+    assert cube.regions.tolist() == ['California', 'Nevada']
+    assert cube.sectors.tolist() == ['all sectors', 'residential']
+    pd.testing.assert_index_equal(cube.times, pd.DatetimeIndex(['2001-01-01', '2001-02-01', '2001-03-01']),
+                                  exact=False)
+
+    sales = cube[('Retail sales of electricity', gwh)]
+    np.testing.assert_array_equal(sales[0, 0], [20.0, 19.0, np.nan])
+    np.testing.assert_array_equal(sales[1, 1], [2.0, np.nan, np.nan])
+    # Nevada has no "all sectors" data in any file
+    assert np.isnan(sales[1, 0]).all()
+    np.testing.assert_array_equal(cube[('Net generation for all sectors', gwh)][0, 0], [np.nan, 15.0, 16.0])
+
+    df = cube.to_dataframe(('Retail sales of electricity', gwh))
+    assert df.columns.tolist() == [('California', 'all sectors'), ('California', 'residential'),
+                                   ('Nevada', 'residential')]
+
+
+def test_cube_title_falls_back_on_file_name(tmp_path):
+    chart = _write_chart(tmp_path / 'my_chart.csv', '', ['California all sectors thousand megawatthours'],
+                         [('Jan 2001', (1.0,))])
+    cube = readers.load_eia_cube([chart])
+    assert cube.variables == [('my_chart', 'thousand megawatthours')]
+
+
+def test_cube_conflicts(tmp_path, chart_files):
+    sales = chart_files[0]
+    # The same file twice (or overlapping files that agree) is fine
+    cube = readers.load_eia_cube([sales, sales], n_threads=2)
+    np.testing.assert_array_equal(cube[cube.variables[0]][0, 0], [20.0, 19.0])
+
+    revised = _write_chart(tmp_path / 'revised.csv', 'Retail sales of electricity : monthly',
+                           ['California all sectors thousand megawatthours'], [('Feb 2001', (19.5,))])
+    with pytest.raises(ValueError, match='California, all sectors, 2001-02'):
+        readers.load_eia_cube([sales, revised])
+
+
+def test_cube_netcdf_round_trip(tmp_path, chart_files):
+    cube = readers.load_eia_cube(chart_files)
+    cube.to_netcdf(tmp_path / 'eia.nc')
+    read_back = readers.EIACube.from_netcdf(tmp_path / 'eia.nc')
+
+    assert read_back.variables == cube.variables
+    assert read_back.regions.tolist() == cube.regions.tolist()
+    assert read_back.sectors.tolist() == cube.sectors.tolist()
+    assert read_back.input_files == [str(f) for f in chart_files]
+    for key in cube.variables:
+        np.testing.assert_array_equal(read_back[key], cube[key])
@@ -0,0 +1,80 @@
+import netCDF4 as ncdf
+import numpy as np
+import pandas as pd
+import pytest
+
+from caada.epa_cems import agglomeration
+
+
+def _hours(*stamps):
+    return pd.DatetimeIndex(stamps).to_numpy(dtype='datetime64[ns]')
+
+
+def test_accumulator_grows_in_both_directions():
+    acc = agglomeration._CemsAccumulator(['so2'], 'hour')
+    # The second batch adds a new region and earlier times, the third later times, so the grid must be padded at the
+    # start and end of the time axis and at the end of the region axis.
+    batches = [(np.array(['CA']), np.array([0, 0]), _hours('2019-01-01 05:00', '2019-01-01 06:00'), [1.0, 2.0]),
+               (np.array(['NV', 'CA']), np.array([0, 1, 1]), _hours('2019-01-01 02:00', '2019-01-01 02:00',
+                                                                      '2019-01-01 06:00'), [10.0, 20.0, 30.0]),
+               (np.array(['AZ']), np.array([0]), _hours('2019-01-01 09:00'), [100.0])]
+
+    expected = []
+    for labels, codes, dates, values in batches:
+        assert acc.add(labels, codes, dates, {'so2': np.array(values)}) == 0
+        expected.append(pd.DataFrame({'region': labels[codes], 'date': dates, 'so2': values}))
+    expected = pd.concat(expected).groupby(['region', 'date'])['so2'].agg(['sum', 'size'])
+
+    data, counts, regions, times = acc.result()
+    assert regions.tolist() == ['AZ', 'CA', 'NV']
+    pd.testing.assert_index_equal(times, pd.date_range('2019-01-01 02:00', '2019-01-01 09:00', freq='h'),
+                                  check_names=False, exact=False)
+    grid_sums = pd.DataFrame(data['so2'], index=regions, columns=times).stack().dropna()
+    grid_counts = pd.DataFrame(counts, index=regions, columns=times).stack()
+    np.testing.assert_array_equal(grid_sums.to_numpy(), expected['sum'].to_numpy())
+    np.testing.assert_array_equal(grid_counts[grid_counts > 0].to_numpy(), expected['size'].to_numpy())
+    # Grid cells with no data are NaN in the sums, not 0
+    assert np.isnan(data['so2'][regions.tolist().index('AZ'), 0])
+
+
+def test_accumulator_skips_missing_regions_and_dates():
+    acc = agglomeration._CemsAccumulator(['so2'], 'day')
+    dates = _hours('2019-01-01 05:00', '2019-01-01 06:00', 'NaT', '2019-01-02 00:00')
+    n_dropped = acc.add(np.array(['CA']), np.array([0, -1, 0, 0]), dates, {'so2': np.array([1.0, 2.0, 4.0, np.nan])})
+    assert n_dropped == 2
+
+    data, counts, regions, times = acc.result()
+    assert counts.tolist() == [[1, 1]]
+    # A NaN value still counts as a record, but adds nothing to the sum
+    np.testing.assert_array_equal(data['so2'], [[1.0, 0.0]])
+
+
+@pytest.mark.parametrize('time_res, time_units, ntimes', [('hour', 'hours', 48), ('day', 'days', 2)])
+def test_agglomerate_cems_time_units(tmp_path, make_cems_file, time_res, time_units, ntimes):
+    cems_file = make_cems_file('2019ca01.csv', states=('CA', 'NV'), dates=('01-01-2019', '01-02-2019'),
+                               hours=range(24))
+    save_path = tmp_path / 'cems.nc'
+    agglomeration.agglomerate_cems([cems_file], save_path, time_res=time_res,
+                                   variables=['so2_mass', 'nox_mass'])
+
+    with ncdf.Dataset(save_path) as ds:
+        assert ds['time'].units.startswith(time_units + ' since')
+        times = pd.DatetimeIndex(ncdf.num2date(ds['time'][:], ds['time'].units, only_use_cftime_datetimes=False,
+                                               only_use_python_datetimes=True))
+        assert times[0] == pd.Timestamp(2019, 1, 1)
+        assert times.size == ntimes
+        assert ds['state_abbrev'][:].tolist() == ['CA', 'NV']
+        assert ds['so2_mass'].units == 'lbs'
+        so2 = ds['so2_mass'][:].filled(np.nan)
+        assert ds.time_resolution == time_res
+
+    # Each state has two units per hour, with 10 + hour and 20 + hour lbs of SO2
+    hourly_sums = 30.0 + 2 * np.arange(24)
+    expected = np.tile(hourly_sums, 2) if time_res == 'hour' else np.full(2, hourly_sums.sum())
+    np.testing.assert_allclose(so2, np.vstack([expected, expected]))
+
+
+def test_daily_files_rejected_for_hourly_output(tmp_path, make_cems_file):
+    cems_file = make_cems_file('2019caQ1.csv', daily=True)
+    with pytest.raises(ValueError):
+        agglomeration.agglomerate_cems([cems_file], tmp_path / 'cems.nc', time_res='hour')
@@ -0,0 +1,68 @@
+import numpy as np
+import pandas as pd
+
+from caada.epa_cems import readers
+
+
+def test_index_arrays_hourly():
+    df = pd.DataFrame({'STATE': ['CA', 'CA', 'NV'], 'OP_DATE': ['01-31-2019', '01-31-2019', '02-01-2019'],
+                       'OP_HOUR': [0, 23, 5], 'FAC_ID': [1, 70000, 3], 'UNIT_ID': ['1', 'GT1', '1']})
+    index = readers._cems_index_arrays(df)
+    assert list(index.keys()) == ['state', 'date', 'facility_id', 'unit_id']
+    pd.testing.assert_index_equal(pd.DatetimeIndex(index['date']),
+                                  pd.DatetimeIndex(['2019-01-31 00:00', '2019-01-31 23:00', '2019-02-01 05:00']),
+                                  check_names=False, exact=False)
+    assert isinstance(index['state'], pd.Categorical) and list(index['state'].categories) == ['CA', 'NV']
+    assert isinstance(index['unit_id'], pd.Categorical)
+    np.testing.assert_array_equal(index['facility_id'], [1, 70000, 3])
+    # The smallest integer type that holds the IDs
+    assert index['facility_id'].dtype == np.int32
+
+
+def test_index_arrays_daily():
+    df = pd.DataFrame({'STATE': ['CA'], 'OP_DATE': ['03-15-2019'], 'FAC_ID': [1], 'UNIT_ID': ['1']})
+    index = readers._cems_index_arrays(df)
+    assert index['date'][0] == pd.Timestamp(2019, 3, 15)
+    assert index['facility_id'].dtype == np.int8
+
+
+def test_read_filters(make_cems_file):
+    cems_file = make_cems_file('2019ca01.csv', states=('CA', 'NV'), dates=('01-30-2019', '01-31-2019', '02-01-2019'),
+                               hours=(0, 23))
+    df = readers.read_cems_file(cems_file, states=['ca'], start_date='2019-01-31', stop_date='2019-02-01')
+    dates = df.index.get_level_values('date')
+    assert set(df.index.get_level_values('state')) == {'CA'}
+    # stop_date is exclusive, but every hour of the last day before it is kept
+    assert dates.min() == pd.Timestamp('2019-01-31 00:00')
+    assert dates.max() == pd.Timestamp('2019-01-31 23:00')
+    assert df.shape[0] == 4
+    assert df.index.names == ['state', 'date', 'facility_id', 'unit_id']
+
+    # Hourly filtering within a day
+    df = readers.read_cems_file(cems_file, start_date='2019-01-31 12:00', stop_date='2019-01-31 23:00')
+    assert df.shape[0] == 0
+    df = readers.read_cems_file(cems_file, start_date='2019-01-31 12:00', stop_date='2019-01-31 23:01')
+    assert df.shape[0] == 4
+
+
+def test_read_usecols_downcast_flat(make_cems_file):
+    cems_file = make_cems_file('2019ca01.zip', zipped=True, units=((1, '1'), (2, 'GT1'), (2, 'GT2')))
+    df = readers.read_cems_file(cems_file, usecols=['so2_mass', 'NOX_MASS (lbs)'], downcast=True, flat=True)
+    assert list(df.columns) == ['state', 'date', 'facility_id', 'unit_id', 'so2_mass', 'nox_mass']
+    assert df['so2_mass'].dtype == np.float32
+    assert isinstance(df['unit_id'].dtype, pd.CategoricalDtype)
+    np.testing.assert_array_equal(df['so2_mass'], [10, 20, 20, 11, 21, 21])
+
+    full = readers.read_cems_file(cems_file)
+    np.testing.assert_allclose(full['so2_mass'].to_numpy(), df['so2_mass'].to_numpy())
+    assert full['facility_name'].dtype != 'category'
+
+
+def test_read_daily_and_units(make_cems_file):
+    cems_file = make_cems_file('2019caQ1.csv', daily=True, dates=('01-01-2019', '01-02-2019'))
+    assert not readers.cems_file_is_hourly(cems_file)
+    assert readers.cems_file_is_hourly(make_cems_file('2019ca01.csv'))
+    assert readers.cems_column_units(cems_file) == {'so2_mass': 'lbs', 'nox_mass': 'lbs', 'co2_mass': 'tons'}
+
+    df = readers.read_cems_file(cems_file, stop_date='2019-01-02')
+    assert df.index.get_level_values('date').unique().tolist() == [pd.Timestamp(2019, 1, 1)]
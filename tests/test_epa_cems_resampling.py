@@ -0,0 +1,83 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from caada.epa_cems import resampling
+
+
+def _frame(dates, facility_id=1, unit_id='1', state='CA', **columns):
+    dates = pd.DatetimeIndex(dates)
+    df = pd.DataFrame({'state': pd.Categorical([state] * dates.size), 'date': dates,
+                       'facility_id': facility_id, 'unit_id': pd.Categorical([unit_id] * dates.size)})
+    for name, values in columns.items():
+        df[name] = values
+    return df
+
+
+def test_fraction_present_hourly():
+    # Unit 1 reports the first 12 hours of 1 Jan, unit 2 hours 6 to 17
+    unit1 = _frame(pd.date_range('2019-01-01 00:00', periods=12, freq='h'), unit_id='1', so2_mass=1.0)
+    unit2 = _frame(pd.date_range('2019-01-01 06:00', periods=12, freq='h'), unit_id='2', so2_mass=2.0)
+    df = pd.concat([unit1, unit2], ignore_index=True)
+
+    by_unit = resampling.resample_cems(df, freq='day', by='unit')
+    np.testing.assert_allclose(by_unit['fraction_present'], [0.5, 0.5])
+    np.testing.assert_allclose(by_unit['so2_mass'], [12.0, 24.0])
+    np.testing.assert_array_equal(by_unit['num_records'], [12, 12])
+
+    # Hours reported by both units only count once for the facility
+    by_facility = resampling.resample_cems(df, freq='day', by='facility')
+    np.testing.assert_allclose(by_facility['fraction_present'], [18 / 24])
+    np.testing.assert_array_equal(by_facility['num_records'], [24])
+
+    by_month = resampling.resample_cems(df, freq='month', by='facility')
+    np.testing.assert_allclose(by_month['fraction_present'], [18 / (31 * 24)])
+
+
+def test_fraction_present_across_files(tmp_path, make_cems_file):
+    # The first half of January in one file and the second half in another should make a complete month
+    first = make_cems_file('first.csv', dates=['01-{:02d}-2019'.format(d) for d in range(1, 16)], hours=range(24))
+    second = make_cems_file('second.csv', dates=['01-{:02d}-2019'.format(d) for d in range(16, 32)], hours=range(24))
+    result = resampling.resample_cems([first, second], freq='month', by='facility', flat=True)
+    assert result['facility_id'].tolist() == [1, 2]
+    np.testing.assert_allclose(result['fraction_present'], [1.0, 1.0])
+    np.testing.assert_array_equal(result['num_records'], [31 * 24, 31 * 24])
+    # Unit "fac_id" has 10 * fac_id + hour lbs of SO2 each hour
+    np.testing.assert_allclose(result['so2_mass'], [31 * (24 * 10 + 276), 31 * (24 * 20 + 276)])
+
+
+def test_fraction_present_daily_input():
+    df = _frame(pd.date_range('2019-02-01', periods=7, freq='D'), so2_mass=1.0)
+    result = resampling.resample_cems(df, freq='month', by='state', input_res='day')
+    np.testing.assert_allclose(result['fraction_present'], [7 / 28])
+    assert result.index.tolist() == [('CA', pd.Timestamp(2019, 2, 1))]
+
+
+def test_weighted_means_and_missing_values():
+    df = _frame(pd.date_range('2019-01-01', periods=4, freq='h'), so2_mass=[1.0, np.nan, 3.0, np.nan],
+                so2_rate=[1.0, 2.0, 4.0, np.nan], op_time=[1.0, 0.5, 0.5, 1.0])
+    result = resampling.resample_cems(df, freq='day', by='unit')
+    assert list(result.columns) == ['so2_mass', 'so2_rate', 'op_time', 'num_records', 'fraction_present']
+    row = result.iloc[0]
+    assert row['so2_mass'] == 4.0
+    assert row['so2_rate'] == pytest.approx((1.0 * 1.0 + 2.0 * 0.5 + 4.0 * 0.5) / 2.0)
+    assert row['op_time'] == 3.0
+
+    all_missing = resampling.resample_cems(df.iloc[[1, 3]], freq='day', by='unit')
+    assert np.isnan(all_missing['so2_mass'].iloc[0])
+    assert all_missing['num_records'].iloc[0] == 2
+
+
+def test_rows_without_keys_dropped():
+    df = _frame(pd.date_range('2019-01-01', periods=3, freq='h'), so2_mass=1.0)
+    df['state'] = pd.Categorical(['CA', None, 'CA'])
+    result = resampling.resample_cems(df, freq='day', by='state')
+    np.testing.assert_array_equal(result['num_records'], [2])
+
+
+def test_file_missing_variables(make_cems_file):
+    first = make_cems_file('first.csv')
+    second = make_cems_file('second.csv')
+    pd.read_csv(second).drop(columns='NOX_MASS (lbs)').to_csv(second, index=False)
+    with pytest.raises(ValueError, match='nox_mass'):
+        resampling.resample_cems([first, second])
@@ -0,0 +1,67 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from caada.epa_cems import readers, store
+
+pytest.importorskip('pyarrow')
+
+
+@pytest.fixture
+def cems_store(tmp_path, make_cems_file):
+    january = make_cems_file('2019ca01.csv', states=('CA', 'NV'), dates=('01-30-2019', '01-31-2019'), hours=(0, 23))
+    february = make_cems_file('2019ca02.csv', states=('CA', 'NV'), dates=('02-01-2019',), hours=(0, 23))
+    store_dir = tmp_path / 'store'
+    store.build_cems_store([january, february], store_dir)
+    return store_dir, [january, february]
+
+
+def _sorted(df):
+    return df.sort_index()[['so2_mass', 'nox_mass']]
+
+
+def test_query_matches_reader(cems_store):
+    store_dir, cems_files = cems_store
+    df = store.query_cems_store(store_dir)
+    expected = readers.read_multi_cems_files(cems_files)
+    assert df.index.names == ['state', 'date', 'facility_id', 'unit_id']
+    np.testing.assert_allclose(_sorted(df).to_numpy(), _sorted(expected).to_numpy())
+    assert sorted(p.name for p in store_dir.iterdir()) == ['state=CA', 'state=NV']
+
+
+def test_query_filters(cems_store):
+    store_dir, _ = cems_store
+    df = store.query_cems_store(store_dir, states=['ca'], start_date='2019-01-31', stop_date='2019-02-01',
+                                columns=['so2_mass'], flat=True)
+    assert list(df.columns) == ['state', 'date', 'facility_id', 'unit_id', 'so2_mass']
+    assert set(df['state']) == {'CA'}
+    # stop_date is exclusive, as for read_cems_file
+    assert df['date'].min() == pd.Timestamp('2019-01-31 00:00')
+    assert df['date'].max() == pd.Timestamp('2019-01-31 23:00')
+    assert df.shape[0] == 4
+
+    df = store.query_cems_store(store_dir, facilities=[2], start_date='2019-02-01', flat=True)
+    assert set(df['facility_id']) == {2}
+    assert df.shape[0] == 4
+
+    df = store.query_cems_store(store_dir, states=['wa'])
+    assert df.shape[0] == 0
+
+
+def test_readding_file_replaces_it(cems_store, make_cems_file):
+    store_dir, _ = cems_store
+    # The new version of the January file has only one state and day, so some old partitions have no new parts
+    january = make_cems_file('2019ca01.csv', states=('CA',), dates=('01-31-2019',), hours=(0,))
+    store.build_cems_store([january], store_dir)
+
+    df = store.query_cems_store(store_dir, stop_date='2019-02-01', flat=True)
+    assert df.shape[0] == 2
+    assert set(df['date']) == {pd.Timestamp(2019, 1, 31)}
+    # The February file is untouched
+    assert store.query_cems_store(store_dir, start_date='2019-02-01').shape[0] == 8
+
+
+def test_missing_pyarrow(monkeypatch, tmp_path):
+    monkeypatch.setattr(store, 'pa', None)
+    with pytest.raises(ImportError, match=r'CAADA\[store\]'):
+        store.query_cems_store(tmp_path)
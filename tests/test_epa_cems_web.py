@@ -0,0 +1,254 @@
+import os
+import threading
+from zipfile import ZipFile
+
+import pytest
+
+from caada.epa_cems import pipeline, web
+
+pytest.importorskip('pyftpdlib')
+from pyftpdlib.authorizers import DummyAuthorizer
+from pyftpdlib.handlers import FTPHandler
+from pyftpdlib.servers import ThreadedFTPServer
+
+_hourly_dir = '/DMDnLoad/emissions/hourly/monthly/2019'
+# Files on the server are given this modification time (2020-01-01 00:00:00 UTC) unless changed
+_remote_mtime = 1577836800
+
+
+class _FTPServer:
+    """An anonymous FTP server for a local directory that records the commands it receives"""
+    def __init__(self, root):
+        self.root = root
+        self.commands = []
+        self.disabled_commands = set()
+
+        server = self
+        authorizer = DummyAuthorizer()
+        authorizer.add_anonymous(str(root))
+
+        class Handler(FTPHandler):
+            def pre_process_command(self, line, cmd, arg):
+                server.commands.append((cmd, arg))
+                if cmd in server.disabled_commands:
+                    self.respond('500 Command "{}" not understood.'.format(cmd))
+                    return
+                return super().pre_process_command(line, cmd, arg)
+
+        Handler.authorizer = authorizer
+        self.ftpd = ThreadedFTPServer(('127.0.0.1', 0), Handler)
+        self.port = self.ftpd.address[1]
+        self.thread = threading.Thread(target=self.ftpd.serve_forever, kwargs={'handle_exit': False}, daemon=True)
+        self.thread.start()
+
+    def add_file(self, dir_url, fname, data, mtime=_remote_mtime):
+        path = self.root / dir_url.lstrip('/') / fname
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(data)
+        os.utime(path, (mtime, mtime))
+        return path
+
+    def add_cems_zip(self, dir_url, zip_name, csv_text, mtime=_remote_mtime):
+        path = self.root / dir_url.lstrip('/') / zip_name
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with ZipFile(path, 'w') as z:
+            z.writestr(zip_name.replace('.zip', '.csv'), csv_text)
+        os.utime(path, (mtime, mtime))
+        return path
+
+    def count(self, cmd):
+        return sum(c == cmd for c, _ in self.commands)
+
+    def close(self):
+        self.ftpd.close_all()
+
+
+@pytest.fixture
+def ftp_server(tmp_path):
+    root = tmp_path / 'server'
+    root.mkdir()
+    server = _FTPServer(root)
+    yield server
+    server.close()
+
+
+@pytest.fixture
+def save_dir(tmp_path):
+    save_dir = tmp_path / 'local'
+    save_dir.mkdir()
+    return save_dir
+
+
+def _connect(server, tmp_path, **kwargs):
+    return web.EPAFTP('127.0.0.1', port=server.port, listing_cache_dir=tmp_path / 'listings', **kwargs)
+
+
+def test_retrieve_file(tmp_path, ftp_server, save_dir):
+    data = bytes(range(256)) * 100
+    ftp_server.add_file(_hourly_dir, '2019ca01.zip', data)
+    with _connect(ftp_server, tmp_path) as ftp:
+        assert ftp.retrieve_file(_hourly_dir, '2019ca01.zip', save_dir)
+        assert (save_dir / '2019ca01.zip').read_bytes() == data
+        assert (save_dir / '2019ca01.zip').stat().st_mtime == _remote_mtime
+        assert sorted(p.name for p in save_dir.iterdir()) == ['2019ca01.zip']
+
+        # Already up to date
+        assert not ftp.retrieve_file(_hourly_dir, '2019ca01.zip', save_dir)
+    assert ftp_server.count('RETR') == 1
+
+
+def test_retrieve_file_resumes_partial_download(tmp_path, ftp_server, save_dir):
+    data = bytes(range(256)) * 100
+    ftp_server.add_file(_hourly_dir, '2019ca01.zip', data)
+    (save_dir / '2019ca01.zip.part').write_bytes(data[:1000])
+    (save_dir / '2019ca01.zip.part.mtime').write_text(repr(float(_remote_mtime)))
+
+    with _connect(ftp_server, tmp_path) as ftp:
+        assert ftp.retrieve_file(_hourly_dir, '2019ca01.zip', save_dir)
+    assert ('REST', '1000') in ftp_server.commands
+    assert (save_dir / '2019ca01.zip').read_bytes() == data
+    assert sorted(p.name for p in save_dir.iterdir()) == ['2019ca01.zip']
+
+
+def test_retrieve_file_restarts_stale_partial_download(tmp_path, ftp_server, save_dir):
+    data = bytes(range(256)) * 100
+    ftp_server.add_file(_hourly_dir, '2019ca01.zip', data)
+    # Started from an older version of the file on the server, so its bytes must not be reused
+    (save_dir / '2019ca01.zip.part').write_bytes(b'\xff' * 1000)
+    (save_dir / '2019ca01.zip.part.mtime').write_text(repr(float(_remote_mtime - 86400)))
+
+    with _connect(ftp_server, tmp_path) as ftp:
+        assert ftp.retrieve_file(_hourly_dir, '2019ca01.zip', save_dir)
+    assert ftp_server.count('REST') == 0
+    assert (save_dir / '2019ca01.zip').read_bytes() == data
+    assert sorted(p.name for p in save_dir.iterdir()) == ['2019ca01.zip']
+
+
+def test_retrieve_file_size_mismatch(tmp_path, ftp_server, save_dir):
+    ftp_server.add_file(_hourly_dir, '2019ca01.zip', b'x' * 100)
+    with _connect(ftp_server, tmp_path) as ftp:
+        with pytest.raises(web._SizeMismatchError):
+            ftp.retrieve_file(_hourly_dir, '2019ca01.zip', save_dir, remote_info={'size': 50, 'mtime': _remote_mtime})
+    assert not (save_dir / '2019ca01.zip').exists()
+
+
+def test_list_dir_mlsd(tmp_path, ftp_server):
+    ftp_server.add_file(_hourly_dir, '2019ca01.zip', b'x' * 100)
+    ftp_server.add_file(_hourly_dir, '2019ca02.zip', b'y' * 200, mtime=_remote_mtime + 60)
+    (ftp_server.root / _hourly_dir.lstrip('/') / 'subdir').mkdir()
+
+    with _connect(ftp_server, tmp_path) as ftp:
+        entries = sorted(ftp.list_dir(_hourly_dir), key=lambda e: e['name'])
+        assert entries == [{'name': '2019ca01.zip', 'size': 100, 'mtime': _remote_mtime},
+                           {'name': '2019ca02.zip', 'size': 200, 'mtime': _remote_mtime + 60}]
+        assert ftp.listed_file_info(_hourly_dir, '2019ca02.zip') == {'size': 200, 'mtime': _remote_mtime + 60}
+
+
+def test_list_dir_falls_back_on_nlst(tmp_path, ftp_server):
+    ftp_server.add_file(_hourly_dir, '2019ca01.zip', b'x' * 100)
+    ftp_server.disabled_commands.add('MLSD')
+
+    with _connect(ftp_server, tmp_path) as ftp:
+        assert ftp.list_dir(_hourly_dir) == [{'name': '2019ca01.zip', 'size': None, 'mtime': None}]
+        # Without a size and modification time, the listing cannot say whether a file is up to date
+        assert ftp.listed_file_info(_hourly_dir, '2019ca01.zip') is None
+    assert ftp_server.count('NLST') == 1
+
+
+def test_listing_cache(tmp_path, ftp_server):
+    ftp_server.add_file(_hourly_dir, '2019ca01.zip', b'x' * 100)
+    with _connect(ftp_server, tmp_path) as ftp:
+        ftp.list_dir(_hourly_dir)
+    with _connect(ftp_server, tmp_path) as ftp:
+        entries = ftp.list_dir(_hourly_dir)
+    assert ftp_server.count('MLSD') == 1
+    assert entries == [{'name': '2019ca01.zip', 'size': 100, 'mtime': _remote_mtime}]
+
+    # A zero TTL always lists the directory again
+    with _connect(ftp_server, tmp_path, listing_ttl=0) as ftp:
+        ftp.list_dir(_hourly_dir)
+    assert ftp_server.count('MLSD') == 2
+
+    with _connect(ftp_server, tmp_path) as ftp:
+        ftp._listing_cache.invalidate(_hourly_dir)
+        ftp.list_dir(_hourly_dir)
+    assert ftp_server.count('MLSD') == 3
+
+
+def test_listing_cache_expires(tmp_path, monkeypatch):
+    cache = web._ListingCache(tmp_path, server='127.0.0.1:21', ttl=60)
+    entries = [{'name': '2019ca01.zip', 'size': 100, 'mtime': _remote_mtime}]
+    cache.save(_hourly_dir, entries)
+    assert cache.load(_hourly_dir) == entries
+    assert web._ListingCache(tmp_path, server='127.0.0.1:2121', ttl=60).load(_hourly_dir) is None
+
+    now = web.time.time()
+    monkeypatch.setattr(web.time, 'time', lambda: now + 61)
+    assert cache.load(_hourly_dir) is None
+
+
+def test_download_skips_unchanged_files(tmp_path, ftp_server, save_dir):
+    ftp_server.add_cems_zip(_hourly_dir, '2019ca01.zip', 'STATE,OP_DATE\nCA,01-01-2019\n')
+    ftp_server.add_cems_zip(_hourly_dir, '2019ca02.zip', 'STATE,OP_DATE\nCA,02-01-2019\n')
+
+    def download():
+        with _connect(ftp_server, tmp_path, listing_ttl=0) as ftp:
+            ftp.download('hourly', '2019-01-01', '2019-02-01', save_dir, states=('ca',))
+
+    download()
+    assert sorted(p.name for p in save_dir.iterdir()) == ['.cems_manifest.json', '2019ca01.csv', '2019ca02.csv']
+    assert ftp_server.count('RETR') == 2
+
+    # The .zip files were deleted after unzipping, but the manifest shows they have not changed
+    download()
+    assert ftp_server.count('RETR') == 2
+
+    # A changed file on the server or a deleted .csv file means downloading again
+    ftp_server.add_cems_zip(_hourly_dir, '2019ca01.zip', 'STATE,OP_DATE\nCA,01-02-2019\n', mtime=_remote_mtime + 60)
+    (save_dir / '2019ca02.csv').unlink()
+    download()
+    assert ftp_server.count('RETR') == 4
+    assert (save_dir / '2019ca01.csv').read_text() == 'STATE,OP_DATE\nCA,01-02-2019\n'
+    assert (save_dir / '2019ca02.csv').exists()
+
+
+def test_manifest(tmp_path):
+    (tmp_path / '2019ca01.csv').write_text('')
+    info = {'size': 100, 'mtime': _remote_mtime}
+    manifest = web._DownloadManifest(tmp_path)
+    assert not manifest.is_current('2019ca01.zip', info)
+    manifest.record('2019ca01.zip', info, ['2019ca01.csv'])
+
+    reloaded = web._DownloadManifest(tmp_path)
+    assert reloaded.is_current('2019ca01.zip', info)
+    assert not reloaded.is_current('2019ca01.zip', {'size': 101, 'mtime': _remote_mtime})
+    assert not reloaded.is_current('2019ca01.zip', {'size': 100, 'mtime': _remote_mtime + 60})
+    assert not reloaded.is_current('2019ca01.zip', {'size': None, 'mtime': None})
+
+
+def test_sync_file_retries_stale_listing(tmp_path, ftp_server, save_dir):
+    data = b'x' * 100
+    ftp_server.add_file(_hourly_dir, '2019ca01.zip', data, mtime=_remote_mtime + 60)
+    manifest = web._DownloadManifest(save_dir)
+    with _connect(ftp_server, tmp_path) as ftp:
+        # As if the listing was cached before the file was replaced on the server
+        stale_info = {'size': 50, 'mtime': _remote_mtime}
+        info = ftp._sync_file(_hourly_dir, '2019ca01.zip', save_dir, manifest, unzip=False, remote_info=stale_info)
+    assert info == {'size': 100, 'mtime': _remote_mtime + 60}
+    assert (save_dir / '2019ca01.zip').read_bytes() == data
+
+
+def test_pipeline_retries_stale_listing(tmp_path, ftp_server, save_dir):
+    csv_text = 'STATE,OP_DATE,OP_HOUR,FAC_ID,UNIT_ID,SO2_MASS (lbs)\nCA,01-01-2019,0,1,1,5.0\n'
+    ftp_server.add_cems_zip(_hourly_dir, '2019ca01.zip', csv_text)
+    ftp_kws = dict(url='127.0.0.1', port=ftp_server.port, listing_cache_dir=tmp_path / 'listings')
+    with web.EPAFTP(**ftp_kws) as ftp:
+        # As if the directory was listed before the file on the server was replaced with a different one
+        ftp._listing_cache.save(_hourly_dir, [{'name': '2019ca01.zip', 'size': 10, 'mtime': _remote_mtime - 60}])
+
+    reduced = []
+    pipeline.run_cems_pipeline('hourly', '2019-01-01', '2019-01-01', save_dir, states=('ca',),
+                               reduce_fxn=lambda name, df, units: reduced.append((name, df['so2_mass'].sum())),
+                               connections=1, ftp_kws=ftp_kws)
+    assert reduced == [('2019ca01.csv', 5.0)]
+    assert ftp_server.count('RETR') == 2
@@ -0,0 +1,172 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from caada.opensky import agglomeration, readers
+
+
+def _write_flights(path, flights):
+    """Write a Strohmeier et al. style .csv file from (origin, destination, firstseen, lastseen) tuples"""
+    df = pd.DataFrame(flights, columns=['origin', 'destination', 'firstseen', 'lastseen'])
+    df['firstseen'] = pd.to_datetime(df['firstseen'])
+    df['lastseen'] = pd.to_datetime(df['lastseen'])
+    df['day'] = df['firstseen'].dt.floor('D')
+    df.insert(0, 'callsign', ['TEST{}'.format(i) for i in range(df.shape[0])])
+    df.to_csv(path)
+    return path
+
+
+def _summary_frames(summary):
+    counts, codes, times = summary
+    return {(end, status): pd.DataFrame(arr, index=pd.DatetimeIndex(times), columns=codes)
+            for end, end_dicts in counts.items() for status, arr in end_dicts.items()}
+
+
+@pytest.fixture
+def flight_file(tmp_path, airport_codes):
+    flights = [('KLAX', 'KSFO', '2020-03-01 01:00', '2020-03-01 02:30'),
+               ('KSFO', 'KLAX', '2020-03-01 09:00', '2020-03-01 10:15'),
+               ('KLAX', 'EGLL', '2020-03-01 12:00', '2020-03-02 00:30'),
+               ('EGLL', 'KLAX', '2020-03-01 20:00', '2020-03-02 07:00'),
+               ('KSFO', 'YSSY', '2020-03-01 23:00', '2020-03-02 13:00'),
+               ('KLAX', 'KSFO', '2020-03-02 03:00', '2020-03-02 04:15'),
+               ('YSSY', 'KLAX', '2020-03-02 05:00', '2020-03-02 18:00'),
+               ('KSFO', 'KLAX', '2020-03-02 17:00', '2020-03-02 18:10'),
+               ('EGLL', 'YSSY', '2020-03-03 10:00', '2020-03-04 08:00')]
+    return _write_flights(tmp_path / 'flightlist_20200301_20200331.csv', flights)
+
+
+@pytest.mark.parametrize('day_basis', ['utc', 'local'])
+def test_chunked_summary_matches_whole_file(flight_file, day_basis):
+    # A chunk size of 4 puts a chunk boundary in the middle of both 1 and 2 Mar.
+    whole = agglomeration.summarize_opensky_covid_file(flight_file, 'day', day_basis=day_basis)
+    chunked = agglomeration.summarize_opensky_covid_file(flight_file, 'day', chunksize=4, day_basis=day_basis)
+
+    whole_frames = _summary_frames(whole)
+    chunked_frames = _summary_frames(chunked)
+    assert whole_frames.keys() == chunked_frames.keys()
+    for key, df in whole_frames.items():
+        pd.testing.assert_frame_equal(chunked_frames[key], df, obj=str(key))
+
+    departures = whole_frames[('departures', 'all')]
+    if day_basis == 'utc':
+        assert departures.loc['2020-03-01', 'KLAX'] == 2
+        assert departures.to_numpy().sum() == 9
+    # Every flight arrives in the file regardless of which day it is counted on
+    np.testing.assert_array_equal(whole_frames[('arrivals', 'all')].sum(axis=0).to_numpy(), [1, 4, 2, 2])
+
+
+def _od_series(summary):
+    coo, codes, times = summary
+    codes = np.array(codes)
+    index = pd.MultiIndex.from_arrays([codes[coo['origin']], codes[coo['destination']],
+                                       pd.DatetimeIndex(times)[coo['time']]], names=['origin', 'destination', 'date'])
+    return pd.Series(coo['count'], index=index, name='flight_count').sort_index()
+
+
+def test_od_summary(flight_file):
+    whole = _od_series(agglomeration.summarize_opensky_od_file(flight_file, 'day'))
+    chunked = _od_series(agglomeration.summarize_opensky_od_file(flight_file, 'day', chunksize=4))
+    pd.testing.assert_series_equal(chunked, whole)
+
+    assert whole.loc[('KLAX', 'KSFO', pd.Timestamp(2020, 3, 1))] == 1
+    assert whole.loc[('KLAX', 'KSFO', pd.Timestamp(2020, 3, 2))] == 1
+    assert ('KSFO', 'KSFO') not in whole.index.droplevel('date')
+    assert whole.sum() == 9
+
+
+def test_merge_od_summaries():
+    first = ({'origin': np.array([0, 1]), 'destination': np.array([1, 0]), 'time': np.array([0, 1]),
+              'count': np.array([2, 3])},
+             ['KLAX', 'KSFO'], [pd.Timestamp(2020, 3, 1), pd.Timestamp(2020, 3, 2)])
+    # Different code and time lists, with one entry (KSFO -> KLAX on 2 Mar) overlapping the first summary
+    second = ({'origin': np.array([1, 2, 1]), 'destination': np.array([2, 1, 0]), 'time': np.array([0, 0, 1]),
+               'count': np.array([5, 7, 1])},
+              ['EGLL', 'KSFO', 'KLAX'], [pd.Timestamp(2020, 3, 2), pd.Timestamp(2020, 3, 3)])
+
+    coo, times, codes = agglomeration._merge_od_summaries([first, second])
+    assert codes == ['EGLL', 'KLAX', 'KSFO']
+    merged = _od_series((coo, codes, times))
+    expected = pd.Series({('KLAX', 'KSFO', pd.Timestamp(2020, 3, 1)): 2,
+                          ('KLAX', 'KSFO', pd.Timestamp(2020, 3, 2)): 7,
+                          ('KSFO', 'EGLL', pd.Timestamp(2020, 3, 3)): 1,
+                          ('KSFO', 'KLAX', pd.Timestamp(2020, 3, 2)): 8}, name='flight_count')
+    expected.index.names = ['origin', 'destination', 'date']
+    pd.testing.assert_series_equal(merged, expected, check_dtype=False)
+
+    # Each pair's entries must be contiguous and in time order for the ragged array in the netCDF file
+    keys = (coo['origin'].astype(np.int64) * len(codes) + coo['destination']) * len(times) + coo['time']
+    assert np.all(np.diff(keys) > 0)
+
+
+def test_save_od_netcdf_round_trip(tmp_path, flight_file):
+    summary = agglomeration.summarize_opensky_od_file(flight_file, 'day')
+    coo, times, codes = agglomeration._merge_od_summaries([summary])
+    savename = tmp_path / 'od.nc'
+    agglomeration.save_od_netcdf(savename, coo, times, codes)
+
+    pd.testing.assert_series_equal(readers.read_opensky_od_file(savename), _od_series((coo, codes, times)),
+                                   check_dtype=False, check_index_type=False)
+
+    subset = readers.read_opensky_od_file(savename, origins=['KSFO'], start_date='2020-03-02')
+    assert subset.index.get_level_values('origin').unique().tolist() == ['KSFO']
+    assert subset.sum() == 1
+
+
+def _to_local(times, codes, airport_zones):
+    local = agglomeration._local_datetimes(pd.Series(pd.to_datetime(times)), pd.Series(codes), airport_zones)
+    return pd.DatetimeIndex(local)
+
+
+@pytest.mark.parametrize('code, utc_times, local_times', [
+    # US spring forward, 2020-03-08 02:00 PST
+    ('KLAX', ['2020-03-08 09:59', '2020-03-08 10:00'], ['2020-03-08 01:59', '2020-03-08 03:00']),
+    # US fall back, 2020-11-01 02:00 PDT
+    ('KLAX', ['2020-11-01 08:59', '2020-11-01 09:00'], ['2020-11-01 01:59', '2020-11-01 01:00']),
+    # Europe, 2020-03-29 01:00 UTC and 2020-10-25 01:00 UTC
+    ('EGLL', ['2020-03-29 00:59', '2020-03-29 01:00', '2020-10-25 00:59', '2020-10-25 01:00'],
+     ['2020-03-29 00:59', '2020-03-29 02:00', '2020-10-25 01:59', '2020-10-25 01:00']),
+    # Southern hemisphere: Sydney falls back on 2020-04-05 03:00 AEDT and springs forward on 2020-10-04 02:00 AEST
+    ('YSSY', ['2020-04-04 15:59', '2020-04-04 16:00', '2020-10-03 15:59', '2020-10-03 16:00', '2020-07-01 00:00'],
+     ['2020-04-05 02:59', '2020-04-05 02:00', '2020-10-04 01:59', '2020-10-04 03:00', '2020-07-01 10:00']),
+])
+def test_local_datetimes_across_dst(airport_codes, code, utc_times, local_times):
+    airport_zones = agglomeration._airport_time_zones()
+    local = _to_local(utc_times, [code] * len(utc_times), airport_zones)
+    pd.testing.assert_index_equal(local, pd.DatetimeIndex(pd.to_datetime(local_times)), check_names=False,
+                                  exact=False)
+
+    zone = pd.read_csv(airport_codes, header=None).set_index(5).loc[code, 11]
+    expected = pd.DatetimeIndex(pd.to_datetime(utc_times)).tz_localize('UTC').tz_convert(zone).tz_localize(None)
+    pd.testing.assert_index_equal(local, expected.as_unit('ns'), check_names=False, exact=False)
+
+
+def test_local_datetimes_fallbacks(airport_codes):
+    with open(airport_codes, 'a') as wobj:
+        # Openflights uses \N for missing values
+        wobj.write('5,No Zone Airport,Nowhere,Nowhere,NZA,XNZA,0.0,0.0,0.0,5.5,U,\\N,airport,OurAirports\n')
+    airport_zones = agglomeration._airport_time_zones()
+
+    utc_times = ['2020-06-01 20:00', '2020-06-01 20:00', '2020-06-01 20:00', None]
+    local = _to_local(utc_times, ['XNZA', 'XXXX', 'KSFO', 'KSFO'], airport_zones)
+    # Unrecognized time zone uses the standard offset, unknown airports stay in UTC, missing times stay missing
+    assert local[0] == pd.Timestamp('2020-06-02 01:30')
+    assert local[1] == pd.Timestamp('2020-06-01 20:00')
+    assert local[2] == pd.Timestamp('2020-06-01 13:00')
+    assert pd.isna(local[3])
+
+
+def test_local_day_summary_across_dst(tmp_path, airport_codes):
+    # 07:30 UTC on 8 Mar is 23:30 PST on 7 Mar, 10:30 UTC is after the switch to PDT
+    flights = [('KLAX', 'KSFO', '2020-03-08 07:30', '2020-03-08 08:45'),
+               ('KLAX', 'KSFO', '2020-03-08 10:30', '2020-03-08 11:45'),
+               ('KLAX', 'KSFO', '2020-11-01 07:30', '2020-11-01 08:30')]
+    flight_file = _write_flights(tmp_path / 'flights.csv', flights)
+    frames = _summary_frames(agglomeration.summarize_opensky_covid_file(flight_file, 'day', day_basis='local'))
+
+    departures = frames[('departures', 'all')]['KLAX']
+    assert departures.loc['2020-03-07'] == 1
+    assert departures.loc['2020-03-08'] == 1
+    # 07:30 UTC on 1 Nov is still 00:30 PDT on 1 Nov
+    assert departures.loc['2020-11-01'] == 1
+    assert frames[('arrivals', 'all')]['KSFO'].loc['2020-11-01'] == 1
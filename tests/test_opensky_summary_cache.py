@@ -0,0 +1,56 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+from caada.opensky import summary_cache
+
+
+def _summary():
+    counts = {end: {group: np.arange(6, dtype=np.int32).reshape(2, 3) for group in ('all', 'domestic', 'international')}
+              for end in ('departures', 'arrivals')}
+    return counts, ['EGLL', 'KLAX', 'KSFO'], [pd.Timestamp(2020, 3, 1), pd.Timestamp(2020, 3, 2)]
+
+
+def test_round_trip(tmp_path, airport_codes):
+    flight_file = tmp_path / 'flights.csv'
+    flight_file.write_text('placeholder\n')
+    cache = summary_cache.SummaryCache(tmp_path / 'cache')
+
+    assert cache.load(flight_file, avg_to='day') is None
+    cache.save(flight_file, _summary(), avg_to='day')
+    counts, codes, times = cache.load(flight_file, avg_to='day')
+    np.testing.assert_array_equal(counts['arrivals']['international'], _summary()[0]['arrivals']['international'])
+    assert codes == _summary()[1]
+    assert times == _summary()[2]
+
+    # Different options are a different entry
+    assert cache.load(flight_file, avg_to='month') is None
+
+
+def test_changed_mtime_invalidates(tmp_path, airport_codes):
+    flight_file = tmp_path / 'flights.csv'
+    flight_file.write_text('placeholder\n')
+    cache = summary_cache.SummaryCache(tmp_path / 'cache')
+    cache.save(flight_file, _summary(), avg_to='day')
+    assert cache.load(flight_file, avg_to='day') is not None
+
+    # Same size and contents, only the modification time differs
+    st = flight_file.stat()
+    os.utime(flight_file, ns=(st.st_atime_ns, st.st_mtime_ns + 10**9))
+    assert cache.load(flight_file, avg_to='day') is None
+
+    # Saving the new summary replaces the old entry rather than adding to it
+    cache.save(flight_file, _summary(), avg_to='day')
+    assert cache.load(flight_file, avg_to='day') is not None
+    assert len(list((tmp_path / 'cache').glob('*.npz'))) == 1
+
+
+def test_new_airport_codes_invalidate(tmp_path, airport_codes):
+    flight_file = tmp_path / 'flights.csv'
+    flight_file.write_text('placeholder\n')
+    summary_cache.SummaryCache(tmp_path / 'cache').save(flight_file, _summary(), avg_to='day')
+
+    with open(airport_codes, 'a') as wobj:
+        wobj.write('5,Test Airport,Test,Nowhere,TST,XTST,0.0,0.0,0.0,0,N,Etc/UTC,airport,OurAirports\n')
+    assert summary_cache.SummaryCache(tmp_path / 'cache').load(flight_file, avg_to='day') is None
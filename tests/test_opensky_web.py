@@ -0,0 +1,173 @@
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import json
+import socket
+import threading
+
+import pytest
+
+from caada.caada_errors import HTMLRequestError
+from caada.opensky import web
+
+
+class _AirportServer:
+    """A local HTTP server for one file that honors If-None-Match and records the headers of each request"""
+    def __init__(self):
+        self.body = b'1,Test Airport\n'
+        self.etag = '"v1"'
+        self.last_modified = 'Sun, 01 Mar 2020 00:00:00 GMT'
+        self.fail_with = None
+        self.requests = []
+
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                server.requests.append(dict(self.headers))
+                if server.fail_with is not None:
+                    self.send_response(server.fail_with)
+                    self.end_headers()
+                elif self.headers.get('If-None-Match') == server.etag:
+                    self.send_response(304)
+                    self.end_headers()
+                else:
+                    self.send_response(200)
+                    self.send_header('ETag', server.etag)
+                    self.send_header('Last-Modified', server.last_modified)
+                    self.send_header('Content-Length', str(len(server.body)))
+                    self.end_headers()
+                    self.wfile.write(server.body)
+
+            def log_message(self, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.url = 'http://127.0.0.1:{}/airports.dat'.format(self.httpd.server_address[1])
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self.thread.start()
+
+    def close(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+@pytest.fixture
+def airport_server():
+    server = _AirportServer()
+    yield server
+    server.close()
+
+
+def _validators(local_file):
+    with open(local_file.with_name(local_file.name + '.validators.json')) as robj:
+        return json.load(robj)
+
+
+def test_download_saves_validators(tmp_path, airport_server):
+    local_file = tmp_path / 'airports.csv'
+    web._conditional_download('test', local_file, airport_server.url)
+
+    assert local_file.read_bytes() == airport_server.body
+    assert _validators(local_file) == {'url': airport_server.url, 'etag': '"v1"',
+                                       'last_modified': airport_server.last_modified}
+    assert 'If-None-Match' not in airport_server.requests[0]
+    # Only the downloaded file and its validators, no leftover temporary files
+    assert sorted(p.name for p in tmp_path.iterdir()) == ['airports.csv', 'airports.csv.validators.json']
+
+
+def test_unchanged_file_not_redownloaded(tmp_path, airport_server):
+    local_file = tmp_path / 'airports.csv'
+    web._conditional_download('test', local_file, airport_server.url)
+    local_file.write_bytes(b'local copy')
+
+    web._conditional_download('test', local_file, airport_server.url)
+    assert airport_server.requests[-1]['If-None-Match'] == '"v1"'
+    assert airport_server.requests[-1]['If-Modified-Since'] == airport_server.last_modified
+    assert local_file.read_bytes() == b'local copy'
+
+
+def test_changed_file_redownloaded(tmp_path, airport_server):
+    local_file = tmp_path / 'airports.csv'
+    web._conditional_download('test', local_file, airport_server.url)
+
+    airport_server.etag = '"v2"'
+    airport_server.body = b'1,Test Airport\n2,New Airport\n'
+    web._conditional_download('test', local_file, airport_server.url)
+    assert local_file.read_bytes() == airport_server.body
+    assert _validators(local_file)['etag'] == '"v2"'
+
+
+def test_validators_for_other_url_not_used(tmp_path, airport_server):
+    local_file = tmp_path / 'airports.csv'
+    web._conditional_download('test', local_file, airport_server.url)
+    web._conditional_download('test', local_file, airport_server.url + '?mirror=1')
+    assert 'If-None-Match' not in airport_server.requests[-1]
+
+
+def test_failed_download_keeps_existing_file(tmp_path, airport_server):
+    local_file = tmp_path / 'airports.csv'
+    web._conditional_download('test', local_file, airport_server.url)
+
+    airport_server.etag = '"v2"'
+    airport_server.fail_with = 500
+    with pytest.raises(HTMLRequestError):
+        web._conditional_download('test', local_file, airport_server.url)
+    assert local_file.read_bytes() == b'1,Test Airport\n'
+    assert _validators(local_file)['etag'] == '"v1"'
+
+
+def test_interrupted_download_keeps_existing_file(tmp_path, airport_server, monkeypatch):
+    local_file = tmp_path / 'airports.csv'
+    web._conditional_download('test', local_file, airport_server.url)
+    airport_server.etag = '"v2"'
+    airport_server.body = b'2,New Airport\n' * 1000
+
+    def broken_iter_content(self, chunk_size=1):
+        yield b'2,New Airport\n'
+        raise IOError('Connection lost')
+
+    monkeypatch.setattr(web.requests.Response, 'iter_content', broken_iter_content)
+    with pytest.raises(IOError):
+        web._conditional_download('test', local_file, airport_server.url)
+    assert local_file.read_bytes() == b'1,Test Airport\n'
+    assert sorted(p.name for p in tmp_path.iterdir()) == ['airports.csv', 'airports.csv.validators.json']
+
+
+def test_unresponsive_server_times_out(tmp_path):
+    # The kernel accepts the connection, but nothing ever answers
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        sock.listen(1)
+        url = 'http://127.0.0.1:{}/airports.dat'.format(sock.getsockname()[1])
+        with pytest.raises(web.requests.exceptions.Timeout):
+            web._conditional_download('test', tmp_path / 'airports.csv', url, timeout=0.2)
+    assert list(tmp_path.iterdir()) == []
+
+
+@pytest.mark.skipif(web.fcntl is None, reason='file locking needs fcntl')
+def test_file_lock_is_exclusive(tmp_path):
+    lock_file = tmp_path / 'airports.csv.lock'
+    events = []
+
+    def hold_lock(name, entered, release):
+        with web._file_lock(lock_file):
+            events.append(name + ' acquired')
+            entered.set()
+            release.wait(5)
+            events.append(name + ' released')
+
+    first_in, first_release = threading.Event(), threading.Event()
+    second_in = threading.Event()
+    first = threading.Thread(target=hold_lock, args=('first', first_in, first_release))
+    first.start()
+    assert first_in.wait(5)
+
+    # The lock is on the open file description, so a second open in another thread has to wait for the first
+    second_release = threading.Event()
+    second_release.set()
+    second = threading.Thread(target=hold_lock, args=('second', second_in, second_release))
+    second.start()
+    assert not second_in.wait(0.2)
+    first_release.set()
+    first.join(5)
+    second.join(10)
+    assert events[:3] == ['first acquired', 'first released', 'second acquired']
@@ -0,0 +1,253 @@
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import os
+import threading
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from caada import caada_files
+from caada.shipping import web
+
+
+class _PageServer:
+    """A local HTTP server for a set of pages that honors If-None-Match and records the path and headers of each
+    request"""
+    def __init__(self):
+        self.pages = dict()
+        self.requests = []
+
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                server.requests.append((self.path, dict(self.headers)))
+                if self.path not in server.pages:
+                    self.send_response(404)
+                    self.end_headers()
+                    return
+
+                body, etag = server.pages[self.path]
+                if self.headers.get('If-None-Match') == etag:
+                    self.send_response(304)
+                    self.end_headers()
+                else:
+                    self.send_response(200)
+                    self.send_header('ETag', etag)
+                    self.send_header('Content-Length', str(len(body)))
+                    self.end_headers()
+                    self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.host = '127.0.0.1:{}'.format(self.httpd.server_address[1])
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self.thread.start()
+
+    def url(self, path):
+        return 'http://{}{}'.format(self.host, path)
+
+    def close(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+@pytest.fixture
+def page_server():
+    server = _PageServer()
+    yield server
+    server.close()
+
+
+def test_default_file_mode():
+    old_umask = os.umask(0o027)
+    os.umask(old_umask)
+    assert caada_files.default_file_mode() == 0o666 & ~old_umask
+
+
+##############
+# HTTP CACHE #
+##############
+
+def test_cache_revalidates(tmp_path, page_server):
+    page_server.pages['/page'] = (b'version 1', '"v1"')
+    cache = web._HTTPCache(tmp_path)
+    with web.requests.Session() as session:
+        assert cache.get(session, page_server.url('/page')).content == b'version 1'
+        assert 'If-None-Match' not in page_server.requests[-1][1]
+
+        # Unchanged: the server answers 304 and the cached body is returned
+        r = cache.get(session, page_server.url('/page'))
+        assert page_server.requests[-1][1]['If-None-Match'] == '"v1"'
+        assert r.status_code == 200
+        assert r.content == b'version 1'
+
+        # Changed: the new body is returned and cached
+        page_server.pages['/page'] = (b'version 2', '"v2"')
+        assert cache.get(session, page_server.url('/page')).content == b'version 2'
+        assert cache.get(session, page_server.url('/page')).content == b'version 2'
+        assert page_server.requests[-1][1]['If-None-Match'] == '"v2"'
+    assert len(page_server.requests) == 4
+
+
+def test_cache_immutable_after(tmp_path, page_server):
+    page_server.pages['/page'] = (b'version 1', '"v1"')
+    cache = web._HTTPCache(tmp_path)
+    with web.requests.Session() as session:
+        cache.get(session, page_server.url('/page'))
+        # Fetched after the time it became final, so the server is not contacted even though the page changed
+        page_server.pages['/page'] = (b'version 2', '"v2"')
+        r = cache.get(session, page_server.url('/page'), immutable_after=pd.Timestamp.now() - pd.Timedelta(days=1))
+        assert r.content == b'version 1'
+        assert len(page_server.requests) == 1
+
+        # Fetched before it became final, so still revalidated
+        r = cache.get(session, page_server.url('/page'), immutable_after=pd.Timestamp.now() + pd.Timedelta(days=1))
+        assert r.content == b'version 2'
+        assert len(page_server.requests) == 2
+
+
+def _la_page(year):
+    header = ['', 'Loaded Imports', 'Empty Imports', 'Total Imports', 'Loaded Exports', 'Empty Exports',
+              'Total Exports', 'Total TEUs', 'Prior Year Change']
+    rows = ['<tr>' + ''.join('<td>{}</td>'.format(h) for h in header) + '</tr>']
+    for i, month in enumerate(pd.date_range('2000-01-01', periods=12, freq='MS').strftime('%B'), start=1):
+        values = [1000 * i, i, 1001 * i, 2000, 5, 2005, 1001 * i + 2005]
+        rows.append('<tr><td>{}</td>'.format(month) + ''.join('<td>{:,}</td>'.format(v) for v in values) +
+                    '<td>1.5%</td></tr>')
+    return '<html><body><h1>{}</h1><table>{}</table></body></html>'.format(year, ''.join(rows)).encode('utf8')
+
+
+def test_la_final_year_not_requested_again(tmp_path, page_server):
+    this_year = pd.Timestamp.now().year
+    for year in (2000, this_year):
+        page_server.pages['/teu-{}'.format(year)] = (_la_page(year), '"{}"'.format(year))
+    url = page_server.url('/teu-{year}')
+
+    old = web.get_la_port_container_data(2000, cache_dir=tmp_path, url=url)
+    web.get_la_port_container_data(this_year, cache_dir=tmp_path, url=url)
+    assert len(page_server.requests) == 2
+    np.testing.assert_array_equal(old['Full Imports'], 1000 * np.arange(1, 13))
+    assert old.index[0] == pd.Timestamp(2000, 1, 1)
+
+    # 2000 ended more than _la_final_after ago, so its cached page is used as is; this year's must be revalidated
+    assert web.get_la_port_container_data(2000, cache_dir=tmp_path, url=url).equals(old)
+    assert len(page_server.requests) == 2
+    web.get_la_port_container_data(this_year, cache_dir=tmp_path, url=url)
+    assert [path for path, _ in page_server.requests] == ['/teu-2000'] + ['/teu-{}'.format(this_year)] * 2
+    assert page_server.requests[-1][1]['If-None-Match'] == '"{}"'.format(this_year)
+
+
+###########
+# OAKLAND #
+###########
+
+_oakland_columns = ['Full Imports', 'Full Exports', 'Empty Imports', 'Empty Exports']
+
+
+def _fake_oakland_excel(content, is_contents=False):
+    # The workbook "contents" are just the first month, number of months, and a value to fill in
+    start, nmonths, value = content.decode().split(',')
+    index = pd.date_range(start, periods=int(nmonths), freq='MS')
+    return pd.DataFrame({c: np.full(index.size, float(value)) for c in _oakland_columns}, index=index)
+
+
+def _oakland_page(host, xlsx_name, year, months, value):
+    items = ''.join('<li title="{}"><span class="number">{:,}</span></li>'.format(m, value) for m in months)
+    charts = ''.join('<div class="chart-wrapper"><div class="chart-vertical-title">{}</div><ul>{}</ul></div>'
+                     .format(title, items) for title in _oakland_columns + ['Totals'])
+    return ('<html><body><h2>{} Container Activity (TEUs)</h2><a href="//{}/{}">History</a>{}</body></html>'
+            .format(year, host, xlsx_name, charts).encode('utf8'))
+
+
+@pytest.fixture
+def oakland(page_server, monkeypatch):
+    monkeypatch.setattr(web, 'parse_oakland_excel', _fake_oakland_excel)
+
+    def set_page(xlsx_name, year, months, value):
+        page_server.pages['/facts'] = (_oakland_page(page_server.host, xlsx_name, year, months, value),
+                                       '"{}-{}-{}"'.format(xlsx_name, len(months), value))
+    return set_page
+
+
+def _xlsx_requests(page_server):
+    return [(path, headers) for path, headers in page_server.requests if path.endswith('.xlsx')]
+
+
+def test_oakland_unchanged_workbook_not_downloaded(tmp_path, page_server, oakland):
+    page_server.pages['/history.xlsx'] = (b'2018-01-01,24,10', '"h1"')
+    oakland('history.xlsx', 2020, ['Jan', 'Feb'], 20)
+    url = page_server.url('/facts')
+
+    first = web.get_oakland_container_data(url, cache_dir=tmp_path)
+    assert first.index[0] == pd.Timestamp(2018, 1, 1)
+    assert first.index[-1] == pd.Timestamp(2020, 2, 1)
+    assert (first.loc['2020', 'Full Imports'] == 20).all()
+    assert (first.loc[:'2019', 'Full Imports'] == 10).all()
+    assert first['Total TEUs'].equals(first[_oakland_columns].sum(axis=1))
+    assert first.equals(web.get_oakland_container_data(url, use_cache=False))
+
+    # A new month on the page: the workbook is revalidated but not downloaded again
+    oakland('history.xlsx', 2020, ['Jan', 'Feb', 'Mar'], 20)
+    second = web.get_oakland_container_data(url, cache_dir=tmp_path)
+    assert _xlsx_requests(page_server)[-1][1]['If-None-Match'] == '"h1"'
+    assert second.index[-1] == pd.Timestamp(2020, 3, 1)
+    assert second.iloc[:-1].equals(first)
+
+    # The next year on the page: the previous year's months, no longer online, are kept
+    oakland('history.xlsx', 2021, ['Jan'], 30)
+    third = web.get_oakland_container_data(url, cache_dir=tmp_path)
+    assert third.iloc[:-1].equals(second)
+    assert third.loc['2021-01-01', 'Full Imports'] == 30
+
+
+def test_oakland_new_workbook_link_merges_history(tmp_path, page_server, oakland):
+    url = page_server.url('/facts')
+    page_server.pages['/history.xlsx'] = (b'2018-01-01,24,10', '"h1"')
+    oakland('history.xlsx', 2020, ['Jan', 'Feb', 'Mar'], 20)
+    web.get_oakland_container_data(url, cache_dir=tmp_path)
+
+    # The new workbook starts later and covers 2020 with revised values. Its months replace the cached ones, the
+    # months only in the old history are kept, and the web page still takes precedence.
+    page_server.pages['/history-2021.xlsx'] = (b'2019-01-01,24,40', '"h2"')
+    oakland('history-2021.xlsx', 2021, ['Jan'], 50)
+    df = web.get_oakland_container_data(url, cache_dir=tmp_path)
+
+    assert 'If-None-Match' not in _xlsx_requests(page_server)[-1][1]
+    assert df.index.equals(pd.date_range('2018-01-01', '2021-01-01', freq='MS'))
+    imports = df['Full Imports']
+    assert (imports[:'2018'] == 10).all()
+    assert (imports['2019':'2020'] == 40).all()
+    assert imports['2021-01-01'] == 50
+
+    # The validators of the new workbook are kept for next time
+    web.get_oakland_container_data(url, cache_dir=tmp_path)
+    path, headers = _xlsx_requests(page_server)[-1]
+    assert path == '/history-2021.xlsx'
+    assert headers['If-None-Match'] == '"h2"'
+
+
+###########
+# PARSING #
+###########
+
+@pytest.mark.skipif(web.lxml_etree is None, reason='comparing the parsers needs lxml')
+def test_lxml_and_beautifulsoup_agree(monkeypatch):
+    # A short row checks that both parsers pad missing cells the same way
+    la_html = _la_page(2000).replace(b'<td>1.5%</td></tr>', b'</tr>', 1)
+    oakland_html = _oakland_page('example.com', 'history.xlsx', 2020, ['Jan', 'Feb'], 20)
+
+    def parse_all():
+        return (web._parse_la_port_html(la_html, 2000), web._parse_la_port_html(la_html),
+                web._parse_oakland_page(oakland_html), web._find_oakland_xlsx_url(oakland_html, 'https://example.com'))
+
+    with_lxml = parse_all()
+    monkeypatch.setattr(web, 'lxml_etree', None)
+    with_bs4 = parse_all()
+
+    for fast, slow in zip(with_lxml[:3], with_bs4[:3]):
+        pd.testing.assert_frame_equal(fast, slow)
+    assert with_lxml[3] == with_bs4[3] == 'https://example.com/history.xlsx'
+    assert np.isnan(with_lxml[0]['Prior Year Change (%)'].iloc[0])
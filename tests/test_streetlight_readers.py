@@ -0,0 +1,44 @@
+from datetime import datetime
+
+import numpy as np
+import pytest
+
+from caada import common_utils
+from caada.streetlight.readers import _ColumnBuffer, load_streetlight_xlsx
+
+
+def _buffer_array(*chunks):
+    buffer = _ColumnBuffer()
+    for chunk in chunks:
+        buffer.extend(chunk)
+    return buffer.to_array()
+
+
+def test_numeric_chunks_stay_numeric():
+    arr = _buffer_array((1, 2), (3, None))
+    assert arr.dtype == np.float64
+    np.testing.assert_array_equal(arr, [1.0, 2.0, 3.0, np.nan])
+
+
+def test_numeric_text_is_converted():
+    # Spreadsheet cells with numbers stored as text must not leave the whole column as text
+    arr = _buffer_array((1, 2.5), ('3', '4.5', None))
+    assert np.issubdtype(arr.dtype, np.floating)
+    np.testing.assert_array_equal(arr.to_numpy(), [1.0, 2.5, 3.0, 4.5, np.nan])
+
+
+def test_text_is_kept():
+    arr = _buffer_array(('Alameda', 'Alpine'), ('3',))
+    assert arr.tolist() == ['Alameda', 'Alpine', '3']
+
+
+def test_dates():
+    arr = _buffer_array((datetime(2020, 1, 1), None))
+    assert arr.dtype.kind == 'M'
+    assert np.isnat(arr[1])
+
+
+def test_missing_openpyxl(monkeypatch, tmp_path):
+    monkeypatch.setattr(common_utils, 'openpyxl', None)
+    with pytest.raises(ImportError, match=r'CAADA\[xlsx\]'):
+        load_streetlight_xlsx(tmp_path / 'vmt.xlsx')